@@ -0,0 +1,154 @@
+import asyncio
+import math
+import time
+
+import msgspec
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+
+from db import CheckoutStats, checkout
+from publisher import Publisher
+from schema import TASK_STATES, TERMINAL_STATES
+
+INFLIGHT_STATES = [state for state in TASK_STATES if state not in TERMINAL_STATES]
+
+# The service time runs from the start of the last attempt to done, the
+# time the task waited in the queue is what the estimate adds on top.
+SELECT_BACKLOG = """SELECT
+    (SELECT count(*) from tasks where state = ANY(%(inflight)s::task_state[])),
+    (SELECT avg(extract(epoch from updated_at - started_at)) from tasks
+        where state = 'done' and started_at is not null
+        and updated_at >= localtimestamp - interval '1 hour')"""
+
+
+class OverloadedError(Exception):
+    """Raised when accepting more tasks would exceed the configured backlog"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, retry_after)
+        self.message = message
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        return self.message
+
+
+class Backlog(msgspec.Struct):
+    queue_depth: int
+    inflight: int
+    task_seconds: float
+    taken_at: float
+
+
+class AdmissionController:
+    """Rejects new tasks while the workers are too far behind
+
+    The queue depth comes from a passive declare of the task queue and the
+    number of in-flight tasks from the tasks table. Both are refreshed at
+    most every refresh_seconds and shared by all requests in between, with
+    tasks admitted since the last refresh counted on top.
+
+    A request that holds a connection passes it in and the refresh runs on
+    it. Checking out a second one could wait forever once every pooled
+    connection is held by a request waiting for the refresh.
+    """
+
+    def __init__(
+        self,
+        publisher: Publisher,
+        pool: AsyncConnectionPool,
+        stats: CheckoutStats,
+        max_queue_depth: int,
+        max_inflight: int,
+        worker_slots: int,
+        default_task_seconds: float,
+        refresh_seconds: float = 2.0,
+    ):
+        self.publisher = publisher
+        self.pool = pool
+        self.stats = stats
+        self.max_queue_depth = max_queue_depth
+        self.max_inflight = max_inflight
+        self.worker_slots = max(worker_slots, 1)
+        self.default_task_seconds = default_task_seconds
+        self.refresh_seconds = refresh_seconds
+        self._backlog: Backlog | None = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self, backlog: Backlog | None) -> bool:
+        return (
+            backlog is not None
+            and time.monotonic() - backlog.taken_at < self.refresh_seconds
+        )
+
+    async def backlog(self, conn: AsyncConnection | None = None) -> Backlog:
+        if self._fresh(self._backlog):
+            return self._backlog  # type: ignore[return-value]
+        async with self._lock:
+            if not self._fresh(self._backlog):
+                self._backlog = await self._measure(conn)
+        return self._backlog  # type: ignore[return-value]
+
+    async def _measure(self, conn: AsyncConnection | None = None) -> Backlog:
+        queue_depth = await self.publisher.queue_depth()
+        if conn is not None:
+            row = await self._count(conn)
+        else:
+            async with checkout(self.pool, self.stats) as conn:
+                row = await self._count(conn)
+        inflight, task_seconds = row if row is not None else (0, None)
+        return Backlog(
+            queue_depth=queue_depth,
+            inflight=inflight,
+            task_seconds=float(task_seconds or self.default_task_seconds),
+            taken_at=time.monotonic(),
+        )
+
+    @staticmethod
+    async def _count(conn: AsyncConnection) -> tuple | None:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                SELECT_BACKLOG, {"inflight": INFLIGHT_STATES}, prepare=True
+            )
+            return await cursor.fetchone()
+
+    def estimated_wait(self, backlog: Backlog, position: int | None = None) -> float:
+        """Seconds until a task at position (default: the back of the queue) starts"""
+        ahead = backlog.inflight if position is None else position
+        return math.ceil(ahead / self.worker_slots) * backlog.task_seconds
+
+    async def admit(self, count: int = 1, conn: AsyncConnection | None = None) -> float:
+        """Reserves room for count new tasks
+
+        Args:
+            count (int): number of new tasks
+            conn (AsyncConnection | None): connection the caller holds, used
+                when the backlog needs a refresh
+
+        Returns:
+            float: estimated wait in seconds before the new tasks start
+
+        Raises:
+            OverloadedError: the queue depth or in-flight limit would be exceeded
+        """
+        backlog = await self.backlog(conn)
+        over_queue = self.max_queue_depth > 0 and (
+            backlog.queue_depth + count > self.max_queue_depth
+        )
+        over_inflight = self.max_inflight > 0 and (
+            backlog.inflight + count > self.max_inflight
+        )
+        if over_queue or over_inflight:
+            excess = max(
+                backlog.queue_depth + count - self.max_queue_depth if over_queue else 0,
+                backlog.inflight + count - self.max_inflight if over_inflight else 0,
+            )
+            retry_after = max(
+                1.0, math.ceil(excess / self.worker_slots) * backlog.task_seconds
+            )
+            raise OverloadedError("Too many queued tasks, retry later", retry_after)
+
+        wait = self.estimated_wait(backlog)
+        backlog.queue_depth += count
+        backlog.inflight += count
+        return wait
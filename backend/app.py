@@ -1,26 +1,44 @@
+import asyncio
+import base64
+import collections
 import datetime
+import math
 import sys
 import uuid
+from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, Literal
 
 import boto3
 import msgspec
-import pandas as pd
-import pika
-import psycopg
 from botocore.client import Config
-from fastapi import Depends, FastAPI, HTTPException
-from pydantic import BaseModel
-from types_boto3_s3.client import S3Client
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from pydantic import BaseModel, Field
+
+if TYPE_CHECKING:
+    from types_boto3_s3.client import S3Client
+else:
+    S3Client = Any
 
 if str(Path(__file__).parent) not in sys.path:
     sys.path.append(str(Path(__file__).parent))
 if str(Path(__file__).parent.parent) not in sys.path:
     sys.path.append(str(Path(__file__).parent.parent))
 
+from admission import AdmissionController, OverloadedError
 from appconfig import config
-from utils import get_coordinates
+from common.geocoding import GeocodingError
+from common.queues import parse_tenants, tenant_queue
+from db import CheckoutStats, PoolMetrics, checkout, create_pool, pool_metrics
+from dedup import find_reusable_tasks, lock_request_key, request_key
+from events import RESYNC, TaskEventHub
+from publisher import OutboxFullError, Publisher
+from schema import TASK_STATES, TERMINAL_STATES, migrate
+from utils import geocoder
 
 OLLAMA_HOST = config.ollama_host
 OLLAMA_PORT = config.ollama_port
@@ -32,6 +50,9 @@ POSTGRES_USER = config.postgres_user
 POSTGRES_PASS = config.postgres_pass
 POSTGRES_DB = config.postgres_db
 POSTGRES_PORT = config.postgres_port
+DB_POOL_MIN_SIZE = config.db_pool_min_size
+DB_POOL_MAX_SIZE = config.db_pool_max_size
+DB_POOL_TIMEOUT = config.db_pool_timeout
 
 RUSTFS_HOST = config.rustfs_host
 RUSTFS_PORT = config.rustfs_port
@@ -44,16 +65,66 @@ RABBITMQ_PASS = config.rabbitmq_pass
 RABBITMQ_HOST = config.rabbitmq_host
 RABBITMQ_PORT = config.rabbitmq_port
 RABBITMQ_QUEUE = config.rabbitmq_queue
+PUBLISHER_OUTBOX_SIZE = config.publisher_outbox_size
+PUBLISHER_BATCH_SIZE = config.publisher_batch_size
+PUBLISHER_CONFIRM_TIMEOUT = config.publisher_confirm_timeout
+RABBITMQ_MAX_PRIORITY = config.rabbitmq_max_priority
+INTERACTIVE_PRIORITY = config.interactive_priority
+BATCH_PRIORITY = config.batch_priority
+DEFAULT_TENANT = config.default_tenant
+TENANT_QUEUES = parse_tenants(config.tenant_queues)
+EVENTS_KEEPALIVE_SECONDS = config.events_keepalive_seconds
+BATCH_MAX_SIZE = config.batch_max_size
+ADMISSION_MAX_QUEUE_DEPTH = config.admission_max_queue_depth
+ADMISSION_MAX_INFLIGHT = config.admission_max_inflight
+ADMISSION_REFRESH_SECONDS = config.admission_refresh_seconds
+WORKER_SLOTS = config.worker_slots
+TASK_SECONDS_ESTIMATE = config.task_seconds_estimate
+DEDUP_ENABLED = config.dedup_enabled
+DEDUP_FRESHNESS = datetime.timedelta(seconds=config.dedup_freshness_seconds)
+DEDUP_INFLIGHT_MAX_AGE = datetime.timedelta(
+    seconds=config.dedup_inflight_max_age_seconds
+)
 
 
 class TripDetails(BaseModel):
     city: str
     start_date: str
     end_date: str
+    pipeline: Literal["crew", "lean"] | None = Field(
+        default=None,
+        description="crew runs the multi agent crew, lean a single LLM call, the worker default when unset",
+    )
+    priority: int | None = Field(
+        default=None,
+        ge=0,
+        le=RABBITMQ_MAX_PRIORITY,
+        description="higher runs first, defaults to the interactive or batch priority of the endpoint",
+    )
+    # The API has no authentication, so the tenant is trusted input: a caller
+    # can claim any tenant's share. Put the API behind a gateway that sets it
+    # when clients are not trusted.
+    tenant: str | None = Field(
+        default=None,
+        max_length=64,
+        description="client the trip is planned for, workers share capacity fairly between tenants, trusted as given",
+    )
 
 
 class TaskDetails(BaseModel):
     task_id: str
+    deduplicated: bool = False
+    estimated_wait_seconds: float | None = None
+
+
+class BatchTripDetails(BaseModel):
+    trips: list[TripDetails] = Field(min_length=1)
+
+
+class BatchTaskDetails(BaseModel):
+    task_ids: list[str]
+    deduplicated: int = 0
+    estimated_wait_seconds: float | None = None
 
 
 class AgentOuput(BaseModel):
@@ -62,88 +133,429 @@ class AgentOuput(BaseModel):
 
 class DBStatus(BaseModel):
     state: str
+    stage: str | None = None
+    # reason of the last failure, set for failed tasks and tasks waiting for a retry
+    error: str | None = None
+    # time each stage was reached, only in status responses
+    stages: dict[str, datetime.datetime] = {}
 
 
-db_conn: psycopg.Connection | None = None
-s3_client: S3Client | None = None
+class TaskIds(BaseModel):
+    task_ids: list[uuid.UUID] = Field(min_length=1)
 
 
-def create_table(db_conn: psycopg.Connection):
-    with db_conn.cursor() as cursor:
-        cursor.execute("""Create Table IF NOT EXISTS tasks (
-    id varchar(50) primary key,
-    state varchar(50),
-    created_at Timestamp default current_timestamp,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)""")
-        db_conn.commit()
+class TaskStatus(BaseModel):
+    task_id: str
+    state: str
+
 
+class BulkStatus(BaseModel):
+    statuses: list[TaskStatus]
+    missing: list[str]
 
-def insert_db(db_conn: psycopg.Connection) -> str | None:
-    """Insert submitted job into db"""
 
-    cursor = None
+class TaskSummary(BaseModel):
+    task_id: str
+    state: str
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+
+
+class TaskPage(BaseModel):
+    tasks: list[TaskSummary]
+    next_cursor: str | None
+
+
+db_pool: AsyncConnectionPool | None = None
+db_stats = CheckoutStats()
+s3_client: S3Client | None = None
+publisher: Publisher | None = None
+event_hub: TaskEventHub | None = None
+admission: AdmissionController | None = None
+encoder = msgspec.msgpack.Encoder()
+json_encoder = msgspec.json.Encoder()
+
+SELECT_TASK_STATE = (
+    "SELECT state, stage, stage_times, error from tasks where id = %(id)s::uuid"
+)
+SELECT_TASK_STATES = (
+    "SELECT id::text, state::text from tasks where id = ANY(%(ids)s::uuid[])"
+)
+# tasks whose message never reached the queue, so they are neither reused
+# nor counted as in flight
+FAIL_UNQUEUED_TASKS = """UPDATE tasks SET state = 'failed', error = %(error)s,
+    updated_at = %(updated_at)s
+where id = ANY(%(ids)s::uuid[]) and state = 'submitted'"""
+# Detaches one request from the task, the task itself is only cancelled
+# once no other request shares it. SET reads the values before the update.
+CANCEL_TASK = """UPDATE tasks SET requesters = greatest(requesters - 1, 0),
+    state = CASE WHEN requesters <= 1 THEN 'cancelled'::task_state ELSE state END,
+    updated_at = CASE WHEN requesters <= 1 THEN %(updated_at)s ELSE updated_at END
+where id = %(id)s::uuid and state::text <> ALL(%(terminal)s)
+RETURNING state::text"""
+ATTACH_REQUESTS = """UPDATE tasks SET requesters = requesters + v.count
+FROM unnest(%(ids)s::uuid[], %(counts)s::int[]) AS v(id, count)
+WHERE tasks.id = v.id"""
+INSERT_TASK = """Insert into tasks (id, state, created_at, updated_at, request_key, priority)
+values (
+    %(task_id)s::uuid, %(state)s::task_state, %(created_at)s, %(updated_at)s,
+    %(request_key)s, %(priority)s
+)"""
+
+
+async def insert_db(
+    db_conn: AsyncConnection, key: str, priority: int, admission: AdmissionController
+) -> TaskDetails | None:
+    """Insert submitted job into db unless an equivalent task can be reused
+
+    Args:
+        db_conn (AsyncConnection): database connection
+        key (str): canonical request key of the trip
+        priority (int): priority the task is published with
+        admission (AdmissionController): asked for room before inserting a new task
+
+    Returns:
+        TaskDetails | None: the new or reused task
+
+    Raises:
+        OverloadedError: a new task is needed but the backlog is full
+    """
 
     try:
-        cursor = db_conn.cursor()
-        task_id = str(uuid.uuid4())
-        cur_time = datetime.datetime.now()
-        data = {
-            "task_id": task_id,
-            "state": "submitted",
-            "created_at": cur_time,
-            "updated_at": cur_time,
-        }
-        cursor.execute(
-            """Insert into tasks values (%(task_id)s,%(state)s,%(created_at)s,%(updated_at)s)""",
-            data,
-        )
-        db_conn.commit()
-
-        return task_id
+        async with db_conn.transaction(), db_conn.cursor() as cursor:
+            if DEDUP_ENABLED:
+                await lock_request_key(cursor, key)
+                reusable = await find_reusable_tasks(
+                    cursor, {key: priority}, DEDUP_FRESHNESS, DEDUP_INFLIGHT_MAX_AGE
+                )
+                if key in reusable:
+                    await cursor.execute(
+                        ATTACH_REQUESTS,
+                        {"ids": [reusable[key]], "counts": [1]},
+                        prepare=True,
+                    )
+                    return TaskDetails(task_id=reusable[key], deduplicated=True)
+
+            estimated_wait = await admission.admit(conn=db_conn)
+            task_id = str(uuid.uuid4())
+            cur_time = datetime.datetime.now()
+            data = {
+                "task_id": task_id,
+                "state": "submitted",
+                "created_at": cur_time,
+                "updated_at": cur_time,
+                "request_key": key,
+                "priority": priority,
+            }
+            await cursor.execute(INSERT_TASK, data, prepare=True)
+
+        return TaskDetails(task_id=task_id, estimated_wait_seconds=estimated_wait)
+    except OverloadedError:
+        raise
     except Exception as e:
         print(e)
-    finally:
-        if cursor is not None:
-            cursor.close()
+
+
+async def insert_many_db(
+    db_conn: AsyncConnection,
+    keys: list[str],
+    priorities: dict[str, int],
+    admission: AdmissionController,
+) -> tuple[list[str], list[int], float]:
+    """Insert submitted jobs into db with a single COPY in one transaction
+
+    Keys that match a reusable task, or an earlier trip in the same batch,
+    are attached to that task instead of getting a new row.
+
+    Args:
+        db_conn (AsyncConnection): database connection
+        keys (list[str]): canonical request key of every trip
+        priorities (dict[str, int]): priority of the task of each key, see
+            key_priorities
+        admission (AdmissionController): asked for room for the new tasks
+
+    Returns:
+        tuple[list[str], list[int], float]: task id of every trip, the indexes
+        of trips that got a new task and the estimated wait for them
+
+    Raises:
+        OverloadedError: the new tasks do not fit in the backlog
+    """
+
+    cur_time = datetime.datetime.now()
+    async with db_conn.transaction(), db_conn.cursor() as cursor:
+        assigned: dict[str, str] = {}
+        if DEDUP_ENABLED:
+            assigned = await find_reusable_tasks(
+                cursor, priorities, DEDUP_FRESHNESS, DEDUP_INFLIGHT_MAX_AGE
+            )
+
+        counts = collections.Counter(keys)
+        if assigned:
+            await cursor.execute(
+                ATTACH_REQUESTS,
+                {
+                    "ids": list(assigned.values()),
+                    "counts": [counts[key] for key in assigned],
+                },
+            )
+
+        task_ids: list[str] = []
+        new_indexes: list[int] = []
+        for i, key in enumerate(keys):
+            if key not in assigned:
+                assigned[key] = str(uuid.uuid4())
+                new_indexes.append(i)
+            task_ids.append(assigned[key])
+
+        estimated_wait = await admission.admit(len(new_indexes), conn=db_conn)
+        async with cursor.copy(
+            "COPY tasks (id, state, created_at, updated_at, request_key, priority, requesters) FROM STDIN"
+        ) as copy:
+            for i in new_indexes:
+                await copy.write_row(
+                    (
+                        task_ids[i],
+                        "submitted",
+                        cur_time,
+                        cur_time,
+                        keys[i],
+                        priorities[keys[i]],
+                        counts[keys[i]],
+                    )
+                )
+
+    return task_ids, new_indexes, estimated_wait
+
+
+async def fail_unqueued(pool: AsyncConnectionPool, task_ids: list[str], error: str):
+    """Marks tasks failed after their messages could not be published"""
+    try:
+        async with checkout(pool, db_stats) as conn:
+            await conn.execute(
+                FAIL_UNQUEUED_TASKS,
+                {
+                    "ids": task_ids,
+                    "error": error,
+                    "updated_at": datetime.datetime.now(),
+                },
+            )
+    except Exception as e:
+        print(f"could not fail unqueued tasks {task_ids}: {e}")
+
+
+def parse_date(value: str) -> datetime.date:
+    try:
+        return datetime.datetime.fromisoformat(value).date()
+    except ValueError:
+        raise ValueError(f"Invalid date {value}, expected year-month-day")
+
+
+def trip_dates(start_date: str, end_date: str) -> tuple[datetime.date, datetime.date]:
+    """Parses and validates the dates of a trip
+
+    Raises:
+        ValueError: a date is malformed or the start is not before the end
+    """
+    start, end = parse_date(start_date), parse_date(end_date)
+    if start >= end:
+        raise ValueError("Start date must be before end date")
+    return start, end
+
+
+def trip_priority(trip: TripDetails, default: int) -> int:
+    return trip.priority if trip.priority is not None else default
+
+
+def key_priorities(keys: list[str], priorities: list[int]) -> dict[str, int]:
+    """Highest priority requested for each key, the one its task gets"""
+    top: dict[str, int] = {}
+    for key, priority in zip(keys, priorities):
+        top[key] = max(top.get(key, priority), priority)
+    return top
+
+
+def trip_message(trip: TripDetails, task_id: str, priority: int) -> dict:
+    """Message body of a trip, with the scheduling fields filled in"""
+    return {
+        **trip.model_dump(),
+        "task_id": task_id,
+        "priority": priority,
+        "tenant": trip.tenant or DEFAULT_TENANT,
+    }
+
+
+def task_queue(tenant: str) -> str:
+    """Queue a task of tenant is published to
+
+    Tenants listed in tenant_queues have a queue of their own, which the
+    workers consume next to the shared one. The broker hands each consumer
+    at most its prefetch count, so a tenant's deep backlog cannot crowd
+    the other queues out of a worker's buffer.
+    """
+    if tenant in TENANT_QUEUES:
+        return tenant_queue(RABBITMQ_QUEUE, tenant)
+    return RABBITMQ_QUEUE
+
+
+def batch_limit() -> int:
+    """Most trips a batch may hold
+
+    A batch the admission limits could never take whole is rejected up
+    front, a 429 would only have the caller retry it forever.
+    """
+    limits = [BATCH_MAX_SIZE, ADMISSION_MAX_QUEUE_DEPTH, ADMISSION_MAX_INFLIGHT]
+    return min(limit for limit in limits if limit > 0)
+
+
+def trip_key(trip: TripDetails) -> str:
+    return request_key(
+        trip.city, *trip_dates(trip.start_date, trip.end_date), pipeline=trip.pipeline
+    )
+
+
+def encode_cursor(created_at: datetime.datetime, task_id: str) -> str:
+    raw = json_encoder.encode([created_at.isoformat(), task_id])
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, uuid.UUID]:
+    try:
+        created_at, task_id = msgspec.json.decode(base64.urlsafe_b64decode(cursor))
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(task_id)
+    except (ValueError, TypeError, msgspec.DecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global db_conn
-    global s3_client
+    global db_pool
+    global publisher
+    global event_hub
+    global admission
     try:
         DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASS}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
-        db_conn = psycopg.connect(DATABASE_URL)
+        db_pool = create_pool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+        )
+        await db_pool.open(wait=True)
+        async with db_pool.connection() as conn:
+            version = await migrate(conn)
+        print(f"database schema at version {version}")
 
-        RUSTFS_ENDPOINT = f"http://{RUSTFS_HOST}:{RUSTFS_PORT}"
-        s3_client = boto3.client( #pyright: ignore[reportUnknownMemberType]
-            "s3",
-            endpoint_url=RUSTFS_ENDPOINT,
-            aws_access_key_id=RUSTFS_ACCESS_KEY,
-            aws_secret_access_key=RUSTFS_SECRET_KEY,
-            config=Config(signature_version="s3v4"),
+        RABBITMQ_URL = (
+            f"amqp://{RABBITMQ_USER}:{RABBITMQ_PASS}@{RABBITMQ_HOST}:{RABBITMQ_PORT}/"
+        )
+        publisher = Publisher(
+            RABBITMQ_URL,
+            RABBITMQ_QUEUE,
+            outbox_size=PUBLISHER_OUTBOX_SIZE,
+            batch_size=PUBLISHER_BATCH_SIZE,
+            confirm_timeout=PUBLISHER_CONFIRM_TIMEOUT,
+            max_priority=RABBITMQ_MAX_PRIORITY,
+            extra_queues=[tenant_queue(RABBITMQ_QUEUE, t) for t in TENANT_QUEUES],
         )
+        await publisher.start()
+
+        admission = AdmissionController(
+            publisher,
+            db_pool,
+            db_stats,
+            max_queue_depth=ADMISSION_MAX_QUEUE_DEPTH,
+            max_inflight=ADMISSION_MAX_INFLIGHT,
+            worker_slots=WORKER_SLOTS,
+            default_task_seconds=TASK_SECONDS_ESTIMATE,
+            refresh_seconds=ADMISSION_REFRESH_SECONDS,
+        )
+
+        event_hub = TaskEventHub(DATABASE_URL)
+        await event_hub.start()
         yield
 
     finally:
-        if db_conn is not None:
-            db_conn.close()
+        await geocoder.aclose()
+        if event_hub is not None:
+            await event_hub.close()
+        if publisher is not None:
+            await publisher.close()
+        if db_pool is not None:
+            await db_pool.close()
 
 
 app = FastAPI(lifespan=lifespan)
 
 
-def get_db() -> psycopg.Connection:
-    if db_conn is None:
-        raise RuntimeError("Db connection is not available")
-    return db_conn
+def get_pool() -> AsyncConnectionPool:
+    if db_pool is None:
+        raise RuntimeError("Db pool is not available")
+    return db_pool
+
+
+@asynccontextmanager
+async def db_connection(pool: AsyncConnectionPool) -> AsyncIterator[AsyncConnection]:
+    """Borrows a connection for part of a request, 503 when the pool is exhausted"""
+    try:
+        async with checkout(pool, db_stats) as conn:
+            yield conn
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail="Database is busy, retry later")
+
+
+async def get_db(pool: AsyncConnectionPool = Depends(get_pool)):
+    async with db_connection(pool) as conn:
+        yield conn
+
+
+def get_publisher() -> Publisher:
+    if publisher is None:
+        raise RuntimeError("Publisher is not available")
+    return publisher
+
+
+def get_event_hub() -> TaskEventHub:
+    if event_hub is None:
+        raise RuntimeError("Task event hub is not available")
+    return event_hub
+
 
+def get_admission() -> AdmissionController:
+    if admission is None:
+        raise RuntimeError("Admission controller is not available")
+    return admission
 
-def get_s3_client():
+
+def overloaded(e: OverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+
+def geocoding_failed(e: GeocodingError) -> HTTPException:
+    # an overloaded or unreachable geocoder is worth a retry, any other
+    # error status is the upstream's answer to this request
+    unavailable = e.status_code == 429 or e.status_code >= 500
+    return HTTPException(
+        status_code=503 if unavailable else 502, detail=f"Geocoding failed: {e}"
+    )
+
+
+def get_s3_client() -> S3Client:
+    global s3_client
     if s3_client is None:
-        raise RuntimeError("s3 client is None")
+        RUSTFS_ENDPOINT = f"http://{RUSTFS_HOST}:{RUSTFS_PORT}"
+        s3_client = boto3.client(  # pyright: ignore[reportUnknownMemberType]
+            "s3",
+            endpoint_url=RUSTFS_ENDPOINT,
+            aws_access_key_id=RUSTFS_ACCESS_KEY,
+            aws_secret_access_key=RUSTFS_SECRET_KEY,
+            config=Config(signature_version="s3v4"),
+        )
     return s3_client
 
 
@@ -192,58 +604,373 @@ async def get_task_output(
     return content
 
 
+@app.get("/tasks/{task_id}/output/partial")
+async def get_task_partial_output(
+    task_id: str, client: S3Client = Depends(get_s3_client)
+) -> str:
+    """Output written so far by a running task, grows as the task progresses
+
+    The worker deletes it once the task stops running, the output of a
+    finished task is at /tasks/{task_id}/output.
+    """
+    content = read_text_from_rustfs(client, RUSTFS_BUCKET, f"{task_id}.partial.txt")
+    if content is None:
+        raise HTTPException(
+            status_code=404, detail=f"no partial output for {task_id} yet"
+        )
+    return content
+
+
+def task_status(row: tuple) -> DBStatus:
+    state, stage, stage_times, error = row
+    return DBStatus(state=state, stage=stage, error=error, stages=stage_times or {})
+
+
 @app.get("/tasks/{task_id}/status")
-async def get_task_status(task_id: str, db_conn: psycopg.Connection = Depends(get_db)):
-    cursor = db_conn.cursor()
-    data = {"id": task_id}
-    cursor.execute("SELECT state from tasks where id = %(id)s", data)
-    row = cursor.fetchone()
+async def get_task_status(
+    task_id: uuid.UUID, db_conn: AsyncConnection = Depends(get_db)
+):
+    async with db_conn.cursor() as cursor:
+        data = {"id": task_id}
+        await cursor.execute(SELECT_TASK_STATE, data, prepare=True)
+        row = await cursor.fetchone()
     if row is None:
         raise HTTPException(status_code=400, detail="State not found for given task id")
 
-    state = row[0]
-    cursor.close()
+    return task_status(row)
+
+
+async def fetch_task_state(
+    pool: AsyncConnectionPool, task_id: uuid.UUID
+) -> DBStatus | None:
+    async with checkout(pool, db_stats) as conn, conn.cursor() as cursor:
+        await cursor.execute(SELECT_TASK_STATE, {"id": task_id}, prepare=True)
+        row = await cursor.fetchone()
+    return None if row is None else task_status(row)
+
+
+def format_sse(status: DBStatus, event: str = "state") -> bytes:
+    data = json_encoder.encode(status.model_dump(include={"state", "stage", "error"}))
+    return f"event: {event}\ndata: ".encode() + data + b"\n\n"
+
+
+@app.get("/tasks/{task_id}/events")
+async def stream_task_events(
+    task_id: uuid.UUID,
+    pool: AsyncConnectionPool = Depends(get_pool),
+    hub: TaskEventHub = Depends(get_event_hub),
+):
+    """Streams state and stage changes of a task as server sent events
+
+    The current state is sent first, then a state event per state change and
+    a stage event per progress stage until the task reaches a terminal state.
+    """
+    # subscribe before reading so a change between the read and the
+    # subscription cannot be missed
+    key = str(task_id)
+    queue = hub.subscribe(key)
+    try:
+        status = await fetch_task_state(pool, task_id)
+    except BaseException:
+        hub.unsubscribe(key, queue)
+        raise
+    if status is None:
+        hub.unsubscribe(key, queue)
+        raise HTTPException(status_code=400, detail="State not found for given task id")
+
+    async def stream():
+        try:
+            last = status
+            yield format_sse(last)
+            while last.state not in TERMINAL_STATES:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS
+                    )
+                except TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if event is RESYNC:
+                    new = await fetch_task_state(pool, task_id)
+                    if new is None:
+                        return
+                else:
+                    new = DBStatus(
+                        state=event.state, stage=event.stage, error=event.error
+                    )
+                if new.state != last.state:
+                    yield format_sse(new)
+                elif new.stage != last.stage:
+                    yield format_sse(new, event="stage")
+                last = new
+        finally:
+            hub.unsubscribe(key, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.delete("/tasks/{task_id}")
+async def cancel_task(
+    task_id: uuid.UUID, db_conn: AsyncConnection = Depends(get_db)
+) -> DBStatus:
+    """Cancels a task that has not finished yet
+
+    A queued task is skipped when a worker picks it up, a running one is
+    aborted by its worker before the next LLM or tool step.
+
+    A deduplicated task serves every request that was attached to it. A
+    cancel only detaches one of them, and the task is cancelled once no
+    request is left. Until then the response carries the task's unchanged
+    state. Requests are not told apart, so cancelling twice through one
+    task id detaches two of them.
+    """
+    async with db_conn.transaction(), db_conn.cursor() as cursor:
+        await cursor.execute(
+            CANCEL_TASK,
+            {
+                "id": task_id,
+                "updated_at": datetime.datetime.now(),
+                "terminal": sorted(TERMINAL_STATES),
+            },
+            prepare=True,
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            await cursor.execute(SELECT_TASK_STATE, {"id": task_id}, prepare=True)
+            current = await cursor.fetchone()
+    if row is None:
+        if current is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        raise HTTPException(
+            status_code=409, detail=f"Task already finished as {current[0]}"
+        )
+    return DBStatus(state=row[0])
+
+
+@app.post("/tasks/status")
+async def get_task_statuses(
+    data: TaskIds, db_conn: AsyncConnection = Depends(get_db)
+) -> BulkStatus:
+    if len(data.task_ids) > BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"More than {BATCH_MAX_SIZE} task ids requested"
+        )
+    ids = [str(task_id) for task_id in data.task_ids]
+    async with db_conn.cursor() as cursor:
+        await cursor.execute(SELECT_TASK_STATES, {"ids": ids}, prepare=True)
+        rows = await cursor.fetchall()
+
+    states = dict(rows)
+    return BulkStatus(
+        statuses=[TaskStatus(task_id=id, state=state) for id, state in states.items()],
+        missing=[id for id in ids if id not in states],
+    )
+
+
+@app.get("/tasks")
+async def list_tasks(
+    state: str | None = None,
+    created_after: datetime.datetime | None = None,
+    created_before: datetime.datetime | None = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: str | None = None,
+    db_conn: AsyncConnection = Depends(get_db),
+) -> TaskPage:
+    """Lists tasks newest first using keyset pagination on (created_at, id)
 
-    return DBStatus(state=state)
+    Pass the returned next_cursor back as cursor to get the following page.
+    """
+    if state is not None and state not in TASK_STATES:
+        raise HTTPException(status_code=400, detail=f"Unknown state {state}")
+
+    # only fixed fragments are joined into the query, values stay parameters
+    conditions = []
+    params: dict[str, object] = {"limit": limit}
+    if state is not None:
+        conditions.append("state = %(state)s::task_state")
+        params["state"] = state
+    if created_after is not None:
+        conditions.append("created_at >= %(created_after)s")
+        params["created_after"] = created_after
+    if created_before is not None:
+        conditions.append("created_at < %(created_before)s")
+        params["created_before"] = created_before
+    if cursor is not None:
+        params["cursor_created_at"], params["cursor_id"] = decode_cursor(cursor)
+        conditions.append("(created_at, id) < (%(cursor_created_at)s, %(cursor_id)s)")
+
+    where = f"where {' and '.join(conditions)}" if conditions else ""
+    query = f"""SELECT id::text, state::text, created_at, updated_at from tasks
+{where}
+order by created_at desc, id desc
+limit %(limit)s"""
+
+    async with db_conn.cursor() as cur:
+        await cur.execute(query, params, prepare=True)  # type: ignore[arg-type]
+        rows = await cur.fetchall()
+
+    tasks = [
+        TaskSummary(task_id=id, state=state, created_at=created, updated_at=updated)
+        for id, state, created, updated in rows
+    ]
+    next_cursor = None
+    if len(tasks) == limit:
+        next_cursor = encode_cursor(tasks[-1].created_at, tasks[-1].task_id)
+    return TaskPage(tasks=tasks, next_cursor=next_cursor)
+
+
+@app.get("/metrics/db")
+async def get_db_metrics(pool: AsyncConnectionPool = Depends(get_pool)) -> PoolMetrics:
+    return pool_metrics(pool, db_stats)
 
 
 @app.post("/task/start", status_code=202)
-async def start_task(data: TripDetails, db_conn: psycopg.Connection = Depends(get_db)):
-    data_dict = data.model_dump()
+async def start_task(
+    data: TripDetails,
+    pool: AsyncConnectionPool = Depends(get_pool),
+    publisher: Publisher = Depends(get_publisher),
+    admission: AdmissionController = Depends(get_admission),
+):
     city = data.city
     start_date = data.start_date
     end_date = data.end_date
 
-    if pd.to_datetime(start_date) >= pd.to_datetime(end_date):
-        raise HTTPException(
-            status_code=400, detail="Start date must be before end date"
-        )
+    try:
+        trip_dates(start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        _ = get_coordinates(city=city)
+        _ = await geocoder.aget(city)
+    except GeocodingError as e:
+        raise geocoding_failed(e)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
-    create_table(db_conn)
-    creds = pika.PlainCredentials(username=RABBITMQ_USER, password=RABBITMQ_PASS)
-    connection_params = pika.ConnectionParameters(
-        host=RABBITMQ_HOST, port=RABBITMQ_PORT, credentials=creds
-    )
-    connection = pika.BlockingConnection(connection_params)
-    channel = connection.channel()
-
-    channel.queue_declare(queue=RABBITMQ_QUEUE)
-
-    task_id = insert_db(db_conn)
+    # the connection is only held for the insert, not while geocoding or
+    # waiting for the publisher's confirm
+    priority = trip_priority(data, INTERACTIVE_PRIORITY)
+    try:
+        async with db_connection(pool) as db_conn:
+            task = await insert_db(db_conn, trip_key(data), priority, admission)
+    except OverloadedError as e:
+        raise overloaded(e)
 
-    if task_id is None:
+    if task is None:
         raise HTTPException(status_code=400, detail="Could not start task")
 
-    data_dict["task_id"] = task_id
-    encoder = msgspec.msgpack.Encoder()
+    task_id = task.task_id
+    if task.deduplicated:
+        print(f"attached request to existing task {task_id}")
+        return task
+
+    data_dict = trip_message(data, task_id, priority)
     body = encoder.encode(data_dict)
-    channel.basic_publish(exchange="", routing_key=RABBITMQ_QUEUE, body=body)
+    try:
+        await publisher.publish(
+            body,
+            priority=data_dict["priority"],
+            queue=task_queue(data_dict["tenant"]),
+        )
+    except OutboxFullError as e:
+        await fail_unqueued(pool, [task_id], str(e))
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"failed to publish task {task_id}: {e}")
+        await fail_unqueued(pool, [task_id], f"Could not queue task: {e}")
+        raise HTTPException(status_code=503, detail="Could not queue task")
     print("sent [x] data_dict")
-    connection.close()
 
-    return TaskDetails(task_id=task_id)
+    return task
+
+
+@app.post("/tasks/batch", status_code=202)
+async def start_batch(
+    data: BatchTripDetails,
+    pool: AsyncConnectionPool = Depends(get_pool),
+    publisher: Publisher = Depends(get_publisher),
+    admission: AdmissionController = Depends(get_admission),
+):
+    trips = data.trips
+    limit = batch_limit()
+    if len(trips) > limit:
+        raise HTTPException(
+            status_code=413, detail=f"Batch is larger than {limit} trips"
+        )
+
+    errors: dict[int, str] = {}
+    for i, trip in enumerate(trips):
+        try:
+            trip_dates(trip.start_date, trip.end_date)
+        except ValueError as e:
+            errors[i] = str(e)
+    # malformed trips are rejected before any city is geocoded
+    if errors:
+        raise HTTPException(
+            status_code=400,
+            detail=[{"index": i, "detail": msg} for i, msg in sorted(errors.items())],
+        )
+
+    cities = list({trip.city for trip in trips})
+    results = await asyncio.gather(
+        *(geocoder.aget(city) for city in cities),
+        return_exceptions=True,
+    )
+    unknown_cities: dict[str, str] = {}
+    for city, result in zip(cities, results):
+        if isinstance(result, GeocodingError):
+            raise geocoding_failed(result)
+        if isinstance(result, ValueError):
+            unknown_cities[city] = str(result)
+        elif isinstance(result, BaseException):
+            raise result
+    for i, trip in enumerate(trips):
+        if trip.city in unknown_cities:
+            errors[i] = unknown_cities[trip.city]
+
+    if errors:
+        raise HTTPException(
+            status_code=400,
+            detail=[{"index": i, "detail": msg} for i, msg in sorted(errors.items())],
+        )
+
+    keys = [trip_key(trip) for trip in trips]
+    # duplicates within the batch share one task at the highest of their priorities
+    priorities = key_priorities(
+        keys, [trip_priority(trip, BATCH_PRIORITY) for trip in trips]
+    )
+    try:
+        async with db_connection(pool) as db_conn:
+            task_ids, new_indexes, estimated_wait = await insert_many_db(
+                db_conn, keys, priorities, admission
+            )
+    except OverloadedError as e:
+        raise overloaded(e)
+
+    messages = [
+        trip_message(trips[i], task_ids[i], priorities[keys[i]]) for i in new_indexes
+    ]
+    bodies = [encoder.encode(message) for message in messages]
+    try:
+        await publisher.publish_many(
+            bodies,
+            priorities=[message["priority"] for message in messages],
+            queues=[task_queue(message["tenant"]) for message in messages],
+        )
+    except Exception as e:
+        print(f"failed to publish batch of {len(bodies)} tasks: {e}")
+        await fail_unqueued(
+            pool, [task_ids[i] for i in new_indexes], f"Could not queue task: {e}"
+        )
+        raise HTTPException(status_code=503, detail="Could not queue tasks")
+    print(f"sent [x] batch of {len(bodies)} tasks")
+
+    return BatchTaskDetails(
+        task_ids=task_ids,
+        deduplicated=len(trips) - len(new_indexes),
+        estimated_wait_seconds=estimated_wait,
+    )
@@ -1,3 +1,6 @@
+import tempfile
+from pathlib import Path
+
 import environ
 from dotenv import load_dotenv
 
@@ -15,6 +18,12 @@ class AppConfig:
     ollama_llm: str = environ.var(default="granite3.2:8b")
     api_key: str = environ.var(default="")
     use_mock: bool = environ.var(default=False, converter=use_mock_converter)
+    cache_dir: str = environ.var(
+        default=str(Path(tempfile.gettempdir()) / "trip-planner")
+    )
+    geocode_ttl_seconds: int = environ.var(default=30 * 24 * 3600, converter=int)
+    geocode_negative_ttl_seconds: int = environ.var(default=24 * 3600, converter=int)
+    geocode_memory_size: int = environ.var(default=1024, converter=int)
     phoenix_collector_endpoint: str = environ.var(
         default="http://localhost:6006/v1/traces"
     )
@@ -23,11 +32,36 @@ class AppConfig:
     postgres_db: str = environ.var(default="postgres")
     postgres_pass: str = environ.var(default="postgres")
     postgres_port: str = environ.var(default="5433")
+    db_pool_min_size: int = environ.var(default=2, converter=int)
+    db_pool_max_size: int = environ.var(default=10, converter=int)
+    db_pool_timeout: float = environ.var(default=10.0, converter=float)
     rabbitmq_user: str = environ.var(default="user")
     rabbitmq_pass: str = environ.var(default="password")
     rabbitmq_host: str = environ.var(default="localhost")
     rabbitmq_port: int = environ.var(default=5672, converter=int)
     rabbitmq_queue: str = environ.var(default="messages")
+    # 0 declares a plain FIFO queue, must match the worker's setting
+    rabbitmq_max_priority: int = environ.var(default=10, converter=int)
+    interactive_priority: int = environ.var(default=8, converter=int)
+    batch_priority: int = environ.var(default=2, converter=int)
+    default_tenant: str = environ.var(default="default")
+    # tenants with a task queue of their own, as "tenant,...", so their
+    # backlog cannot hold up the others. Must match the worker's setting.
+    tenant_queues: str = environ.var(default="")
+    publisher_outbox_size: int = environ.var(default=1000, converter=int)
+    publisher_batch_size: int = environ.var(default=100, converter=int)
+    publisher_confirm_timeout: float = environ.var(default=10.0, converter=float)
+    admission_max_queue_depth: int = environ.var(default=1000, converter=int)
+    admission_max_inflight: int = environ.var(default=5000, converter=int)
+    admission_refresh_seconds: float = environ.var(default=2.0, converter=float)
+    worker_slots: int = environ.var(default=1, converter=int)
+    task_seconds_estimate: float = environ.var(default=60.0, converter=float)
+    batch_max_size: int = environ.var(default=10000, converter=int)
+    dedup_enabled: bool = environ.var(default=True, converter=use_mock_converter)
+    dedup_freshness_seconds: int = environ.var(default=86400, converter=int)
+    # unfinished tasks older than this are not reused, e.g. one never picked up
+    dedup_inflight_max_age_seconds: int = environ.var(default=3600, converter=int)
+    events_keepalive_seconds: float = environ.var(default=15.0, converter=float)
     rustfs_host: str = environ.var(default="localhost")
     rustfs_port: str = environ.var(default="9000")
     rustfs_access_key: str = environ.var(default="rustfsadmin")
@@ -0,0 +1,95 @@
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+from pydantic import BaseModel
+
+
+class PoolMetrics(BaseModel):
+    pool_min: int
+    pool_max: int
+    pool_size: int
+    pool_available: int
+    requests_waiting: int
+    checkouts: int
+    checkouts_in_use: int
+    checkout_wait_avg_ms: float
+    checkout_wait_max_ms: float
+    checkout_hold_avg_ms: float
+    pool_stats: dict[str, int]
+
+
+class CheckoutStats:
+    """Running totals for connections handed out by the pool"""
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.in_use = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.hold_total_ms = 0.0
+
+    def record_checkout(self, wait_ms: float):
+        self.checkouts += 1
+        self.in_use += 1
+        self.wait_total_ms += wait_ms
+        self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+
+    def record_release(self, hold_ms: float):
+        self.in_use -= 1
+        self.hold_total_ms += hold_ms
+
+
+def create_pool(conninfo: str, min_size: int, max_size: int, timeout: float):
+    """Creates an unopened async connection pool
+
+    Args:
+        conninfo (str): postgres connection string
+        min_size (int): connections kept open when idle
+        max_size (int): upper bound on open connections
+        timeout (float): seconds a request waits for a connection before failing
+    """
+    return AsyncConnectionPool(
+        conninfo,
+        min_size=min_size,
+        max_size=max_size,
+        timeout=timeout,
+        open=False,
+        name="backend",
+    )
+
+
+@asynccontextmanager
+async def checkout(
+    pool: AsyncConnectionPool, stats: CheckoutStats
+) -> AsyncIterator[AsyncConnection]:
+    """Borrows a connection from the pool and records wait and hold times"""
+    start = time.perf_counter()
+    async with pool.connection() as conn:
+        acquired = time.perf_counter()
+        stats.record_checkout((acquired - start) * 1000)
+        try:
+            yield conn
+        finally:
+            stats.record_release((time.perf_counter() - acquired) * 1000)
+
+
+def pool_metrics(pool: AsyncConnectionPool, stats: CheckoutStats) -> PoolMetrics:
+    pool_stats = pool.get_stats()
+    checkouts = max(stats.checkouts, 1)
+    released = max(stats.checkouts - stats.in_use, 1)
+    return PoolMetrics(
+        pool_min=pool.min_size,
+        pool_max=pool.max_size,
+        pool_size=pool_stats.get("pool_size", 0),
+        pool_available=pool_stats.get("pool_available", 0),
+        requests_waiting=pool_stats.get("requests_waiting", 0),
+        checkouts=stats.checkouts,
+        checkouts_in_use=stats.in_use,
+        checkout_wait_avg_ms=stats.wait_total_ms / checkouts,
+        checkout_wait_max_ms=stats.wait_max_ms,
+        checkout_hold_avg_ms=stats.hold_total_ms / released,
+        pool_stats=pool_stats,
+    )
@@ -0,0 +1,84 @@
+import datetime
+import hashlib
+
+from psycopg import AsyncCursor
+
+from schema import TERMINAL_STATES
+
+# A task can be reused while it is in flight and younger than the in-flight
+# window, or once done while its output is younger than the freshness
+# window. The age bound keeps a task that was never picked up from
+# absorbing every later request. A task still waiting in the queue is only
+# reused by requests of at most its priority, a more urgent request must
+# not wait behind it.
+SELECT_REUSABLE_TASKS = """SELECT DISTINCT ON (request_key) request_key, id::text
+from tasks join unnest(%(keys)s::text[], %(priorities)s::int[]) AS r(key, priority)
+    on tasks.request_key = r.key
+where (
+    state::text <> ALL(%(terminal)s) and created_at >= %(inflight_since)s
+    and (state <> 'submitted' or tasks.priority >= r.priority)
+)
+or (state = 'done' and updated_at >= %(since)s)
+order by request_key, created_at desc"""
+
+
+def request_key(
+    city: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    pipeline: str | None = None,
+) -> str:
+    """Canonical key identifying trips that produce the same output
+
+    Args:
+        city (str): city name, compared case and whitespace insensitively
+        start_date (datetime.date): first day of the trip
+        end_date (datetime.date): last day of the trip
+        pipeline (str | None): pipeline explicitly requested for the trip
+    """
+    parts = [
+        " ".join(city.split()).casefold(),
+        start_date.isoformat(),
+        end_date.isoformat(),
+    ]
+    if pipeline is not None:
+        parts.append(pipeline)
+    canonical = "|".join(parts)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+async def lock_request_key(cursor: AsyncCursor, key: str):
+    """Serializes submissions of the same key until the transaction ends"""
+    await cursor.execute(
+        "SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", (key,)
+    )
+
+
+async def find_reusable_tasks(
+    cursor: AsyncCursor,
+    keys: dict[str, int],
+    freshness: datetime.timedelta,
+    inflight_max_age: datetime.timedelta,
+) -> dict[str, str]:
+    """Maps request keys to the newest task whose work can be reused
+
+    Args:
+        cursor (AsyncCursor): cursor to query with
+        keys (dict[str, int]): request keys to look up and the priority
+            each is requested with
+        freshness (datetime.timedelta): maximum age of a completed output
+        inflight_max_age (datetime.timedelta): maximum age of an unfinished task
+    """
+    now = datetime.datetime.now()
+    await cursor.execute(
+        SELECT_REUSABLE_TASKS,
+        {
+            "keys": list(keys),
+            "priorities": list(keys.values()),
+            "since": now - freshness,
+            "inflight_since": now - inflight_max_age,
+            "terminal": sorted(TERMINAL_STATES),
+        },
+        prepare=True,
+    )
+    return dict(await cursor.fetchall())
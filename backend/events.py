@@ -0,0 +1,108 @@
+import asyncio
+import contextlib
+from collections import defaultdict
+
+import msgspec
+from psycopg import AsyncConnection, OperationalError
+
+TASK_EVENTS_CHANNEL = "task_events"
+
+
+class TaskEvent(msgspec.Struct):
+    id: str
+    state: str
+    updated_at: str
+    stage: str | None = None
+    error: str | None = None
+
+
+# Pushed to every subscriber after the LISTEN connection was re-established,
+# notifications sent while it was down are lost so subscribers must re-read.
+RESYNC = TaskEvent(id="", state="", updated_at="")
+
+
+class TaskEventHub:
+    """Fans out task state and stage notifications from one shared LISTEN connection
+
+    The worker updates rows in ``tasks`` and a trigger calls ``pg_notify``.
+    Each SSE client subscribes to a task id and receives the events for that
+    id without issuing queries of its own.
+    """
+
+    def __init__(self, conninfo: str, queue_size: int = 16):
+        self.conninfo = conninfo
+        self.queue_size = queue_size
+        self._subscribers: defaultdict[str, set[asyncio.Queue[TaskEvent]]] = (
+            defaultdict(set)
+        )
+        self._decoder = msgspec.json.Decoder(type=TaskEvent)
+        self._listen_task: asyncio.Task | None = None
+
+    async def start(self):
+        self._listen_task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._listen_task
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscribe(self, task_id: str) -> asyncio.Queue[TaskEvent]:
+        queue: asyncio.Queue[TaskEvent] = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[task_id].add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue[TaskEvent]):
+        queues = self._subscribers.get(task_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[task_id]
+
+    def _put(self, queue: asyncio.Queue[TaskEvent], event: TaskEvent):
+        # a slow client only needs the latest state, drop the oldest event
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def _dispatch(self, payload: str):
+        try:
+            event = self._decoder.decode(payload)
+        except msgspec.DecodeError as e:
+            print(f"ignoring malformed task event {payload}: {e}")
+            return
+        for queue in self._subscribers.get(event.id, ()):
+            self._put(queue, event)
+
+    async def _listen(self):
+        delay = 0.5
+        connected_before = False
+        while True:
+            try:
+                async with await AsyncConnection.connect(
+                    self.conninfo, autocommit=True
+                ) as conn:
+                    await conn.execute(f"LISTEN {TASK_EVENTS_CHANNEL}")
+                    if connected_before:
+                        for queues in self._subscribers.values():
+                            for queue in queues:
+                                self._put(queue, RESYNC)
+                    connected_before = True
+                    delay = 0.5
+                    async for notify in conn.notifies():
+                        self._dispatch(notify.payload)
+            except OperationalError as e:
+                print(f"task event listener disconnected: {e}, reconnecting")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            except Exception as e:
+                # anything else would end the task silently and every
+                # subscriber would stop receiving events
+                print(f"task event listener failed: {e!r}, reconnecting")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
@@ -0,0 +1,212 @@
+import asyncio
+import contextlib
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractRobustConnection
+from aio_pika.exceptions import AMQPError, ChannelInvalidStateError
+
+
+class OutboxFullError(Exception):
+    """Raised when the outbox cannot take more messages"""
+
+
+class Publisher:
+    """Long lived RabbitMQ publisher
+
+    Messages are placed in a bounded in-memory outbox and a single background
+    task drains it in batches over one channel with publisher confirms. The
+    underlying connection is a robust connection, so the channel is restored
+    automatically after the broker goes away. With max_priority the queue
+    is declared as a priority queue and messages carry their priority.
+    Messages go to queue unless they name one of extra_queues, e.g. the
+    queue of a tenant, which are declared the same way.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        queue: str,
+        outbox_size: int = 1000,
+        batch_size: int = 100,
+        max_attempts: int = 5,
+        confirm_timeout: float = 10.0,
+        max_priority: int = 0,
+        extra_queues: list[str] | None = None,
+    ):
+        self.url = url
+        self.queue = queue
+        self.queues = [queue, *(extra_queues or [])]
+        self.max_priority = max_priority
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.confirm_timeout = confirm_timeout
+        self._outbox: asyncio.Queue[tuple[bytes, int, str, asyncio.Future[None]]] = (
+            asyncio.Queue(maxsize=outbox_size)
+        )
+        self._connection: AbstractRobustConnection | None = None
+        self._channel: AbstractChannel | None = None
+        self._admin_channel: AbstractChannel | None = None
+        self._drain_task: asyncio.Task | None = None
+
+    async def start(self):
+        self._connection = await aio_pika.connect_robust(self.url)
+        self._channel = await self._connection.channel(publisher_confirms=True)
+        for queue in self.queues:
+            await self._channel.declare_queue(queue, arguments=self.queue_arguments)
+        self._drain_task = asyncio.create_task(self._drain())
+
+    async def close(self):
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._drain_task
+        while not self._outbox.empty():
+            *_, fut = self._outbox.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Publisher closed"))
+        if self._connection is not None:
+            await self._connection.close()
+
+    @property
+    def queue_arguments(self) -> dict[str, int] | None:
+        # must match the worker's declaration, the broker rejects a
+        # redeclaration with different arguments
+        if self.max_priority <= 0:
+            return None
+        return {"x-max-priority": self.max_priority}
+
+    @property
+    def channel(self) -> AbstractChannel:
+        if self._channel is None:
+            raise RuntimeError("Publisher is not started")
+        return self._channel
+
+    async def queue_depth(self) -> int:
+        """Number of ready messages in all queues, from passive declares"""
+        if self._connection is None:
+            raise RuntimeError("Publisher is not started")
+        # a failed passive declare closes its channel, keep it off the
+        # publishing channel
+        if self._admin_channel is None or self._admin_channel.is_closed:
+            self._admin_channel = await self._connection.channel()
+        depth = 0
+        for name in self.queues:
+            queue = await self._admin_channel.declare_queue(name, passive=True)
+            depth += queue.declaration_result.message_count or 0
+        return depth
+
+    def _priority(self, priority: int) -> int:
+        return min(max(priority, 0), self.max_priority)
+
+    def _queue(self, queue: str | None) -> str:
+        # the default exchange drops messages for a queue nobody declared
+        if queue is None:
+            return self.queue
+        if queue not in self.queues:
+            raise ValueError(f"Queue {queue} is not declared by the publisher")
+        return queue
+
+    def _enqueue(
+        self, body: bytes, priority: int, queue: str | None
+    ) -> asyncio.Future[None]:
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        item = (body, self._priority(priority), self._queue(queue), fut)
+        try:
+            self._outbox.put_nowait(item)
+        except asyncio.QueueFull:
+            raise OutboxFullError("Publisher outbox is full")
+        return fut
+
+    async def publish(self, body: bytes, priority: int = 0, queue: str | None = None):
+        """Queues a message and waits until the broker confirms it
+
+        Args:
+            body (bytes): encoded message body
+            priority (int): message priority, clamped to the queue's maximum
+            queue (str | None): one of the publisher's queues, by default queue
+
+        Raises:
+            OutboxFullError: the outbox is at capacity
+        """
+        await self._enqueue(body, priority, queue)
+
+    async def publish_many(
+        self,
+        bodies: list[bytes],
+        priorities: list[int] | None = None,
+        queues: list[str] | None = None,
+    ):
+        """Queues many messages and waits until the broker confirms all of them
+
+        Unlike publish this waits for room in the outbox instead of failing,
+        so a large batch streams through the outbox in order.
+
+        Args:
+            bodies (list[bytes]): encoded message bodies
+            priorities (list[int] | None): priority of each message
+            queues (list[str] | None): queue of each message
+        """
+        loop = asyncio.get_running_loop()
+        futures: list[asyncio.Future[None]] = []
+        for i, body in enumerate(bodies):
+            fut: asyncio.Future[None] = loop.create_future()
+            priority = priorities[i] if priorities is not None else 0
+            queue = self._queue(queues[i] if queues is not None else None)
+            await self._outbox.put((body, self._priority(priority), queue, fut))
+            futures.append(fut)
+        await asyncio.gather(*futures)
+
+    async def _drain(self):
+        while True:
+            batch = [await self._outbox.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._outbox.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            results = None
+            try:
+                results = await asyncio.gather(
+                    *(
+                        self._send(body, priority, queue)
+                        for body, priority, queue, _ in batch
+                    ),
+                    return_exceptions=True,
+                )
+            finally:
+                # cancelled by close() while the batch was in flight, its
+                # callers would otherwise wait forever
+                if results is None:
+                    for *_, fut in batch:
+                        if not fut.done():
+                            fut.set_exception(RuntimeError("Publisher closed"))
+            for (*_, fut), result in zip(batch, results):
+                if fut.done():
+                    continue
+                if isinstance(result, BaseException):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(None)
+
+    async def _send(self, body: bytes, priority: int = 0, queue: str | None = None):
+        delay = 0.1
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.channel.default_exchange.publish(
+                    aio_pika.Message(body=body, priority=priority or None),
+                    routing_key=queue or self.queue,
+                    timeout=self.confirm_timeout,
+                )
+                return
+            except (
+                AMQPError,
+                ChannelInvalidStateError,
+                ConnectionError,
+                TimeoutError,
+            ) as e:
+                if attempt == self.max_attempts:
+                    raise
+                print(f"publish attempt {attempt} failed: {e}, retrying")
+                await asyncio.sleep(delay)
+                delay *= 2
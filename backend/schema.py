@@ -0,0 +1,184 @@
+from psycopg import AsyncConnection
+
+# Values of the task_state enum, kept in step with the migrations below.
+TASK_STATES = ("submitted", "running", "done", "cancelled", "timeout", "failed")
+TERMINAL_STATES = frozenset({"done", "cancelled", "timeout", "failed"})
+
+# Progress of a running task, reported by the worker next to its state.
+TASK_STAGES = ("geocoded", "weather_ready", "weather_summarized", "attractions_ready")
+
+# Advisory lock key taken while migrating so concurrent replicas do not race.
+MIGRATION_LOCK_ID = 7_301_991
+
+# Ordered list of (version, statements). Never edit an applied migration,
+# append a new one instead.
+MIGRATIONS: list[tuple[int, list[str]]] = [
+    (
+        1,
+        [
+            """Create Table IF NOT EXISTS tasks (
+    id varchar(50) primary key,
+    state varchar(50),
+    created_at Timestamp default current_timestamp,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)""",
+        ],
+    ),
+    (
+        2,
+        [
+            """DO $$ BEGIN
+    CREATE TYPE task_state AS ENUM ('submitted', 'running', 'done');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$""",
+            "ALTER TABLE tasks ALTER COLUMN id TYPE uuid USING id::uuid",
+            "ALTER TABLE tasks ALTER COLUMN state TYPE task_state USING state::task_state",
+            "ALTER TABLE tasks ALTER COLUMN state SET DEFAULT 'submitted'",
+            "ALTER TABLE tasks ALTER COLUMN state SET NOT NULL",
+            "ALTER TABLE tasks ALTER COLUMN created_at SET NOT NULL",
+            "ALTER TABLE tasks ALTER COLUMN updated_at SET NOT NULL",
+            "CREATE INDEX IF NOT EXISTS tasks_state_created_at_idx ON tasks (state, created_at)",
+            "CREATE INDEX IF NOT EXISTS tasks_updated_at_idx ON tasks (updated_at)",
+        ],
+    ),
+    (
+        3,
+        [
+            """CREATE OR REPLACE FUNCTION notify_task_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('task_events', json_build_object(
+        'id', NEW.id::text,
+        'state', NEW.state::text,
+        'updated_at', NEW.updated_at::text
+    )::text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql""",
+            "DROP TRIGGER IF EXISTS tasks_notify_state ON tasks",
+            """CREATE TRIGGER tasks_notify_state
+    AFTER UPDATE OF state ON tasks
+    FOR EACH ROW
+    WHEN (OLD.state IS DISTINCT FROM NEW.state)
+    EXECUTE FUNCTION notify_task_event()""",
+        ],
+    ),
+    (
+        4,
+        [
+            "CREATE INDEX IF NOT EXISTS tasks_created_at_id_idx ON tasks (created_at, id)",
+        ],
+    ),
+    (
+        5,
+        [
+            "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS request_key text",
+            "CREATE INDEX IF NOT EXISTS tasks_request_key_idx ON tasks (request_key, created_at)",
+        ],
+    ),
+    (
+        6,
+        [
+            "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS stage text",
+            "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS stage_times jsonb NOT NULL DEFAULT '{}'",
+            """CREATE OR REPLACE FUNCTION notify_task_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('task_events', json_build_object(
+        'id', NEW.id::text,
+        'state', NEW.state::text,
+        'stage', NEW.stage,
+        'updated_at', NEW.updated_at::text
+    )::text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql""",
+            "DROP TRIGGER IF EXISTS tasks_notify_state ON tasks",
+            """CREATE TRIGGER tasks_notify_state
+    AFTER UPDATE OF state, stage ON tasks
+    FOR EACH ROW
+    WHEN (OLD.state IS DISTINCT FROM NEW.state OR OLD.stage IS DISTINCT FROM NEW.stage)
+    EXECUTE FUNCTION notify_task_event()""",
+        ],
+    ),
+    (
+        7,
+        [
+            # the new values are not used in this transaction, which Postgres requires
+            "ALTER TYPE task_state ADD VALUE IF NOT EXISTS 'cancelled'",
+            "ALTER TYPE task_state ADD VALUE IF NOT EXISTS 'timeout'",
+        ],
+    ),
+    (
+        8,
+        [
+            "ALTER TYPE task_state ADD VALUE IF NOT EXISTS 'failed'",
+            # reason of the last failure, kept while the task waits for a retry
+            "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS error text",
+            """CREATE OR REPLACE FUNCTION notify_task_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('task_events', json_build_object(
+        'id', NEW.id::text,
+        'state', NEW.state::text,
+        'stage', NEW.stage,
+        'error', NEW.error,
+        'updated_at', NEW.updated_at::text
+    )::text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql""",
+        ],
+    ),
+    (
+        9,
+        [
+            # when the last attempt started running, for the service time
+            "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS started_at timestamp",
+        ],
+    ),
+    (
+        10,
+        [
+            # priority the task's message was published with, see dedup.py
+            "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS priority smallint NOT NULL DEFAULT 0",
+        ],
+    ),
+    (
+        11,
+        [
+            # requests sharing the task through dedup, see cancel_task
+            "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS requesters integer NOT NULL DEFAULT 1",
+        ],
+    ),
+]
+
+
+async def migrate(db_conn: AsyncConnection) -> int:
+    """Applies pending migrations in order
+
+    Args:
+        db_conn (AsyncConnection): connection used for the migration transaction
+
+    Returns:
+        int: schema version after migrating
+    """
+    async with db_conn.transaction(), db_conn.cursor() as cursor:
+        await cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        await cursor.execute("""Create Table IF NOT EXISTS schema_migrations (
+    version integer primary key,
+    applied_at timestamp not null default current_timestamp
+)""")
+        await cursor.execute("SELECT coalesce(max(version), 0) from schema_migrations")
+        row = await cursor.fetchone()
+        current = row[0] if row is not None else 0
+
+        for version, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                await cursor.execute(statement)
+            await cursor.execute(
+                "Insert into schema_migrations (version) values (%s)", (version,)
+            )
+            print(f"applied schema migration {version}")
+            current = version
+
+    return current
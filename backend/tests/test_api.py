@@ -1,5 +1,9 @@
+import asyncio
+import contextlib
+import datetime
 import os
 import sys
+import uuid
 from pathlib import Path
 
 from fastapi.testclient import TestClient
@@ -13,6 +17,9 @@ if path not in sys.path:
     sys.path.append(path)
 
 import app
+from admission import AdmissionController, Backlog, OverloadedError
+
+from common.geocoding import GeocodingError
 
 client = TestClient(app.app)
 
@@ -29,3 +36,239 @@ def test_bad_order_date():
     response = client.post("/agents/invoke", json=body)
     assert response.status_code == 400
     assert response.json() == {"detail": "Start date must be before end date"}
+
+
+def test_batch_bad_order_date():
+    app.app.dependency_overrides[app.get_pool] = lambda: None
+    app.app.dependency_overrides[app.get_publisher] = lambda: None
+    app.app.dependency_overrides[app.get_admission] = lambda: None
+    body = {
+        "trips": [
+            {"city": "Toronto", "start_date": "2024-01-02", "end_date": "2024-01-03"},
+            {"city": "Toronto", "start_date": "2024-01-02", "end_date": "2024-01-01"},
+        ]
+    }
+    response = client.post("/tasks/batch", json=body)
+    app.app.dependency_overrides.clear()
+    assert response.status_code == 400
+    assert response.json() == {
+        "detail": [{"index": 1, "detail": "Start date must be before end date"}]
+    }
+
+
+def test_batch_over_admission_limit():
+    controller = AdmissionController(
+        publisher=None,
+        pool=None,
+        stats=app.db_stats,
+        max_queue_depth=app.ADMISSION_MAX_QUEUE_DEPTH,
+        max_inflight=app.ADMISSION_MAX_INFLIGHT,
+        worker_slots=1,
+        default_task_seconds=30,
+    )
+
+    async def measure(conn=None):
+        return Backlog(queue_depth=0, inflight=0, task_seconds=30, taken_at=0)
+
+    controller._measure = measure
+    app.app.dependency_overrides[app.get_pool] = lambda: None
+    app.app.dependency_overrides[app.get_publisher] = lambda: None
+    app.app.dependency_overrides[app.get_admission] = lambda: controller
+    limit = app.batch_limit()
+    trip = {"city": "Toronto", "start_date": "2024-01-02", "end_date": "2024-01-03"}
+    response = client.post("/tasks/batch", json={"trips": [trip] * (limit + 1)})
+    app.app.dependency_overrides.clear()
+    assert limit <= app.ADMISSION_MAX_QUEUE_DEPTH
+    assert response.status_code == 413
+    assert response.json() == {"detail": f"Batch is larger than {limit} trips"}
+
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2024, 2, 1, 12, 30, 15, 250)
+    task_id = str(uuid.uuid4())
+    cursor = app.encode_cursor(created_at, task_id)
+    assert app.decode_cursor(cursor) == (created_at, uuid.UUID(task_id))
+
+
+def test_list_tasks_bad_cursor():
+    app.app.dependency_overrides[app.get_db] = lambda: None
+    response = client.get("/tasks", params={"cursor": "not-a-cursor"})
+    app.app.dependency_overrides.clear()
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_request_key_is_canonical():
+    start, end = datetime.date(2024, 2, 1), datetime.date(2024, 2, 10)
+    assert app.request_key("Toronto", start, end) == app.request_key(
+        "  toronto ", start, end
+    )
+    assert app.request_key("Toronto", start, end) != app.request_key(
+        "Toronto", start, datetime.date(2024, 2, 11)
+    )
+
+
+def test_admission_rejects_over_queue_depth():
+    controller = AdmissionController(
+        publisher=None,
+        pool=None,
+        stats=app.db_stats,
+        max_queue_depth=10,
+        max_inflight=0,
+        worker_slots=2,
+        default_task_seconds=30,
+    )
+
+    async def measure(conn=None):
+        return Backlog(queue_depth=9, inflight=9, task_seconds=30, taken_at=0)
+
+    controller._measure = measure
+    controller.refresh_seconds = float("inf")
+
+    async def admit_twice():
+        wait = await controller.admit()
+        try:
+            await controller.admit()
+        except OverloadedError as e:
+            return wait, e.retry_after
+
+    assert asyncio.run(admit_twice()) == (150, 30)
+
+
+def test_estimated_wait_grows_linearly():
+    controller = AdmissionController(
+        publisher=None,
+        pool=None,
+        stats=app.db_stats,
+        max_queue_depth=0,
+        max_inflight=0,
+        worker_slots=1,
+        default_task_seconds=30,
+    )
+
+    async def measure(conn=None):
+        return Backlog(queue_depth=0, inflight=0, task_seconds=30, taken_at=0)
+
+    controller._measure = measure
+    controller.refresh_seconds = float("inf")
+
+    async def admit_ten():
+        return [await controller.admit() for _ in range(10)]
+
+    assert asyncio.run(admit_ten()) == [30 * i for i in range(10)]
+
+
+def test_task_queue_routes_listed_tenants():
+    app.TENANT_QUEUES.append("bulk")
+    try:
+        assert app.task_queue("bulk") == f"{app.RABBITMQ_QUEUE}.tenant.bulk"
+        assert app.task_queue("ui") == app.RABBITMQ_QUEUE
+    finally:
+        app.TENANT_QUEUES.remove("bulk")
+
+
+def test_dedup_respects_priority():
+    class Cursor:
+        async def execute(self, query, params, prepare=False):
+            self.query, self.params = query, params
+
+        async def fetchall(self):
+            return []
+
+    keys = ["a", "b", "a"]
+    priorities = app.key_priorities(keys, [2, 2, 8])
+    assert priorities == {"a": 8, "b": 2}
+
+    cursor = Cursor()
+    hour = datetime.timedelta(hours=1)
+    asyncio.run(app.find_reusable_tasks(cursor, priorities, hour, hour))
+    assert cursor.params["keys"] == ["a", "b"]
+    assert cursor.params["priorities"] == [8, 2]
+    # a queued task is only reused by requests of at most its priority
+    assert "tasks.priority >= r.priority" in cursor.query
+
+
+class FakeCopy:
+    def __init__(self):
+        self.rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        return False
+
+    async def write_row(self, row):
+        self.rows.append(row)
+
+
+class FakeCursor:
+    def __init__(self, reusable: list[tuple[str, str]]):
+        self.reusable = reusable
+        self.executed = []
+        self.copied = FakeCopy()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        return False
+
+    async def execute(self, query, params=None, prepare=False):
+        self.executed.append((query, params))
+
+    async def fetchall(self):
+        return self.reusable
+
+    def copy(self, statement):
+        return self.copied
+
+
+class FakeConnection:
+    def __init__(self, cursor: FakeCursor):
+        self._cursor = cursor
+
+    def transaction(self):
+        return contextlib.nullcontext()
+
+    def cursor(self):
+        return self._cursor
+
+
+def test_batch_counts_the_requests_sharing_a_task():
+    class Admission:
+        async def admit(self, count=1, conn=None):
+            return 0.0
+
+    cursor = FakeCursor(reusable=[("old", "reused-task")])
+    keys = ["old", "new", "old", "new", "new"]
+    task_ids, new_indexes, _ = asyncio.run(
+        app.insert_many_db(
+            FakeConnection(cursor), keys, {"old": 2, "new": 2}, Admission()
+        )
+    )
+    assert new_indexes == [1]
+    assert task_ids[0] == task_ids[2] == "reused-task"
+    # a cancel only cancels the task once every one of them cancelled
+    assert (app.ATTACH_REQUESTS, {"ids": ["reused-task"], "counts": [2]}) in (
+        cursor.executed
+    )
+    [row] = cursor.copied.rows
+    assert row[0] == task_ids[1] and row[-1] == 3
+
+
+def test_start_task_geocoder_unavailable(monkeypatch):
+    async def aget(city):
+        raise GeocodingError("Geocoder unreachable: ConnectError()", 503)
+
+    monkeypatch.setattr(app.geocoder, "aget", aget)
+    app.app.dependency_overrides[app.get_pool] = lambda: None
+    app.app.dependency_overrides[app.get_publisher] = lambda: None
+    app.app.dependency_overrides[app.get_admission] = lambda: None
+    body = {"city": "Toronto", "start_date": "2024-01-02", "end_date": "2024-01-03"}
+    response = client.post("/task/start", json=body)
+    app.app.dependency_overrides.clear()
+    assert response.status_code == 503
+    assert response.json() == {
+        "detail": "Geocoding failed: Geocoder unreachable: ConnectError()"
+    }
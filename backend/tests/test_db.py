@@ -0,0 +1,62 @@
+import asyncio
+import contextlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from psycopg_pool import PoolTimeout
+
+path = os.getcwd()
+parent_path = Path().resolve().parent
+
+if str(parent_path) not in sys.path:
+    sys.path.append(str(parent_path))
+if path not in sys.path:
+    sys.path.append(path)
+
+import app
+from db import CheckoutStats, checkout, pool_metrics
+
+
+class FakePool:
+    min_size = 1
+    max_size = 4
+
+    def __init__(self, exhausted: bool = False):
+        self.exhausted = exhausted
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        if self.exhausted:
+            raise PoolTimeout("couldn't get a connection after 5.00 sec")
+        yield "conn"
+
+    def get_stats(self):
+        return {"pool_size": 2, "pool_available": 1, "requests_waiting": 0}
+
+
+def test_checkout_records_wait_and_hold():
+    stats = CheckoutStats()
+
+    async def borrow():
+        async with checkout(FakePool(), stats) as conn:
+            assert stats.in_use == 1
+            return conn
+
+    assert asyncio.run(borrow()) == "conn"
+    assert stats.checkouts == 1
+    assert stats.in_use == 0
+    metrics = pool_metrics(FakePool(), stats)
+    assert (metrics.pool_max, metrics.pool_size, metrics.checkouts) == (4, 2, 1)
+
+
+def test_exhausted_pool_is_a_503():
+    async def borrow():
+        async with app.db_connection(FakePool(exhausted=True)):
+            pass
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(borrow())
+    assert e.value.status_code == 503
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+path = os.getcwd()
+parent_path = Path().resolve().parent
+
+if str(parent_path) not in sys.path:
+    sys.path.append(str(parent_path))
+if path not in sys.path:
+    sys.path.append(path)
+
+from publisher import OutboxFullError, Publisher
+
+
+class FakeExchange:
+    def __init__(self):
+        self.published = []
+        # set to hold the broker's confirms back
+        self.confirm = asyncio.Event()
+        self.confirm.set()
+
+    async def publish(self, message, routing_key, timeout=None):
+        await self.confirm.wait()
+        self.published.append((message.body, message.priority, routing_key))
+
+
+class FakeChannel:
+    def __init__(self):
+        self.default_exchange = FakeExchange()
+
+
+def started(publisher: Publisher) -> FakeExchange:
+    channel = FakeChannel()
+    publisher._channel = channel
+    publisher._drain_task = asyncio.create_task(publisher._drain())
+    return channel.default_exchange
+
+
+def test_publish_returns_once_confirmed():
+    async def run():
+        publisher = Publisher(
+            "amqp://", "messages", max_priority=10, extra_queues=["messages.bulk"]
+        )
+        exchange = started(publisher)
+        await publisher.publish(b"a", priority=20)
+        await publisher.publish_many(
+            [b"b", b"c"], priorities=[1, 2], queues=["messages.bulk", "messages"]
+        )
+        with pytest.raises(ValueError):
+            await publisher.publish(b"d", queue="undeclared")
+        await publisher.close()
+        return exchange.published
+
+    assert asyncio.run(run()) == [
+        (b"a", 10, "messages"),
+        (b"b", 1, "messages.bulk"),
+        (b"c", 2, "messages"),
+    ]
+
+
+def test_full_outbox_rejects_publish():
+    async def run():
+        publisher = Publisher("amqp://", "messages", outbox_size=1)
+        waiting = asyncio.ensure_future(publisher.publish(b"a"))
+        await asyncio.sleep(0)
+        with pytest.raises(OutboxFullError):
+            await publisher.publish(b"b")
+        await publisher.close()
+        with pytest.raises(RuntimeError, match="Publisher closed"):
+            await waiting
+
+    asyncio.run(run())
+
+
+def test_close_fails_messages_awaiting_confirms():
+    async def run():
+        publisher = Publisher("amqp://", "messages")
+        exchange = started(publisher)
+        exchange.confirm.clear()
+        in_flight = asyncio.ensure_future(publisher.publish(b"a"))
+        await asyncio.sleep(0.01)
+        await publisher.close()
+        with pytest.raises(RuntimeError, match="Publisher closed"):
+            await asyncio.wait_for(in_flight, timeout=1)
+
+    asyncio.run(run())
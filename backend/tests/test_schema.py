@@ -0,0 +1,76 @@
+import asyncio
+import contextlib
+import os
+import sys
+from pathlib import Path
+
+path = os.getcwd()
+parent_path = Path().resolve().parent
+
+if str(parent_path) not in sys.path:
+    sys.path.append(str(parent_path))
+if path not in sys.path:
+    sys.path.append(path)
+
+import schema
+
+
+class FakeCursor:
+    def __init__(self, version: int | None):
+        self.version = version
+        self.executed = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    async def fetchone(self):
+        return (self.version,)
+
+
+class FakeConnection:
+    def __init__(self, version: int | None):
+        self.cur = FakeCursor(version)
+
+    def transaction(self):
+        return contextlib.nullcontext()
+
+    def cursor(self):
+        return self.cur
+
+
+def recorded_versions(cursor: FakeCursor) -> list[int]:
+    return [
+        params[0]
+        for query, params in cursor.executed
+        if query.startswith("Insert into schema_migrations")
+    ]
+
+
+def test_migration_versions_increase():
+    versions = [version for version, _ in schema.MIGRATIONS]
+    assert versions == sorted(set(versions))
+
+
+def test_migrate_applies_only_pending_migrations():
+    versions = [version for version, _ in schema.MIGRATIONS]
+    current = versions[-3]
+    conn = FakeConnection(current)
+    assert asyncio.run(schema.migrate(conn)) == versions[-1]
+    assert recorded_versions(conn.cur) == versions[-2:]
+
+    pending = [stmt for v, stmts in schema.MIGRATIONS if v > current for stmt in stmts]
+    executed = [query for query, _ in conn.cur.executed]
+    assert [q for q in executed if q in pending] == pending
+
+
+def test_migrate_up_to_date_schema_is_a_no_op():
+    latest = schema.MIGRATIONS[-1][0]
+    conn = FakeConnection(latest)
+    assert asyncio.run(schema.migrate(conn)) == latest
+    assert recorded_versions(conn.cur) == []
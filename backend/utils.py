@@ -1,47 +1,12 @@
-from functools import lru_cache
+from pathlib import Path
 
-import httpx2
-import msgspec
 from appconfig import config
-
-API_KEY = config.api_key
-USE_MOCK = config.use_mock
-
-
-class Result(msgspec.Struct):
-    name: str
-    latitude: float
-    longitude: float
-    country_code: str
-    country: str
-
-
-class GeocodingSearchResponse(msgspec.Struct):
-    results: list[Result]
-
-
-@lru_cache
-def get_coordinates(city: str) -> tuple[float, float]:
-    if USE_MOCK:
-        return 0.0, 0.0
-    geocoding_url = "https://geocoding-api.open-meteo.com/v1/search"
-    geocoding_params = {"name": city, "count": 1, "language": "en", "format": "json"}
-    resp = httpx2.get(url=geocoding_url, params=geocoding_params)
-    if resp.status_code < 200 or resp.status_code > 200:
-        raise ValueError(
-            f"Non 200 status code {resp.status_code}, {resp.content.decode()}"
-        )
-    decoder = msgspec.json.Decoder(type=GeocodingSearchResponse)
-
-    try:
-        geocoding_response = decoder.decode(resp.content)
-    except Exception:
-        raise ValueError("City is not found")
-
-    if geocoding_response.results[0].name != city:
-        raise ValueError("City is not found")
-
-    latitude = geocoding_response.results[0].latitude
-    longitude = geocoding_response.results[0].longitude
-
-    return latitude, longitude
+from common.geocoding import Geocoder
+
+geocoder = Geocoder(
+    store_path=Path(config.cache_dir) / "geocoding.sqlite",
+    ttl=config.geocode_ttl_seconds,
+    negative_ttl=config.geocode_negative_ttl_seconds,
+    memory_size=config.geocode_memory_size,
+    mock=config.use_mock,
+)
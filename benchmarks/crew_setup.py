@@ -0,0 +1,96 @@
+"""Micro benchmark of the per task crew setup overhead in the worker
+
+Compares building a crew from scratch for every message (parse the yaml
+configs, construct new LLM clients and tools), as the worker used to, with
+copying the process wide template returned by crew.new_crew. No LLM calls
+are made.
+
+Usage:
+    python benchmarks/crew_setup.py [--iterations 50]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+from unittest import mock
+
+WORKER_DIR = Path(__file__).resolve().parent.parent / "worker"
+if str(WORKER_DIR) not in sys.path:
+    sys.path.append(str(WORKER_DIR))
+if str(WORKER_DIR.parent) not in sys.path:
+    sys.path.append(str(WORKER_DIR.parent))
+
+
+def measure(build: Callable[[], object], iterations: int) -> list[float]:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        build()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def fresh_crew(crew_module) -> object:
+    """Builds a crew with its own LLM clients and tools, as before the template"""
+
+    def new_llm():
+        return crew_module.LLM(
+            provider="ollama",
+            model=crew_module.OLLAMA_LLM,
+            base_url=f"http://{crew_module.OLLAMA_HOST}:{crew_module.OLLAMA_PORT}/v1/",
+            api_key="ollama",
+            timeout=crew_module.LLM_TIMEOUT_SECONDS,
+            temperature=crew_module.LLM_TEMPERATURE,
+        )
+
+    def new_tools():
+        return crew_module.SharedTools(
+            weather=crew_module.WeatherTool(), attractions=crew_module.AttractionTool()
+        )
+
+    # the agents and tasks look both up on every build
+    with (
+        mock.patch.object(crew_module, "shared_llm", new_llm),
+        mock.patch.object(crew_module, "shared_tools", new_tools),
+    ):
+        return crew_module.MultiAgentCrew().crew()
+
+
+def report(name: str, timings: list[float]):
+    print(
+        f"{name:<22} mean {statistics.mean(timings):8.2f} ms"
+        f"  median {statistics.median(timings):8.2f} ms"
+        f"  max {max(timings):8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    import crew
+
+    print(f"importing crew module: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    # warm up the template so its one time cost is reported separately
+    start = time.perf_counter()
+    crew.new_crew()
+    print(
+        f"first new_crew (builds template): {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+
+    fresh = measure(lambda: fresh_crew(crew), args.iterations)
+    reused = measure(crew.new_crew, args.iterations)
+
+    report("before: fresh crew", fresh)
+    report("after: template copy", reused)
+    print(f"speedup {statistics.mean(fresh) / statistics.mean(reused):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
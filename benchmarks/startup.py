@@ -0,0 +1,128 @@
+"""Startup import benchmark for the backend and worker services
+
+Runs ``python -X importtime`` on each service entry module in a fresh
+interpreter, reports the slowest imports and fails when the cumulative
+import time goes over budget or when a module that must stay off the
+startup path gets imported.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--top 10] [--service backend]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+import msgspec
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class Budget(msgspec.Struct):
+    service: str
+    module: str
+    max_ms: float
+    # top level packages that must not be imported at startup
+    forbidden: list[str] = []
+    # statement timed instead of a plain import of module
+    statement: str = ""
+
+
+BUDGETS = [
+    Budget(
+        service="backend",
+        module="app",
+        max_ms=1500,
+        # boto3 is left out, environ-config imports it for its secrets module
+        forbidden=["pandas", "pika"],
+    ),
+    Budget(
+        service="worker",
+        module="recieve",
+        max_ms=1500,
+        forbidden=["crewai", "pandas", "openmeteo_requests", "requests_cache"],
+    ),
+    # the worker image's entry point, which preloads crewai before forking
+    Budget(
+        service="worker",
+        module="supervisor",
+        max_ms=8000,
+        forbidden=["pandas", "requests_cache"],
+        statement="import supervisor; supervisor.warm_up()",
+    ),
+]
+
+
+def run_importtime(
+    service: str, module: str, statement: str = ""
+) -> list[tuple[int, int, str]]:
+    """Imports module in a fresh interpreter and returns (self_us, cumulative_us, name)"""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement or f"import {module}"],
+        cwd=ROOT / service,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {service}/{module} failed:\n{proc.stderr}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        # drop the separator space, the remaining indent is the nesting depth
+        rows.append((int(self_us), int(cumulative_us), name[1:].rstrip()))
+    return rows
+
+
+def check(budget: Budget, runs: int, top: int) -> bool:
+    totals = []
+    rows: list[tuple[int, int, str]] = []
+    for _ in range(runs):
+        rows = run_importtime(budget.service, budget.module, budget.statement)
+        # top level imports are not indented, their cumulative times add up
+        totals.append(
+            sum(cum for _, cum, name in rows if not name.startswith(" ")) / 1000
+        )
+
+    median_ms = statistics.median(totals)
+    print(f"== {budget.service}: import {budget.module}")
+    print(f"median {median_ms:.1f} ms over {runs} runs (budget {budget.max_ms} ms)")
+    print("slowest top level imports:")
+    top_level = sorted(
+        (row for row in rows if not row[2].startswith(" ")), key=lambda r: -r[1]
+    )
+    for _, cum, name in top_level[:top]:
+        print(f"  {cum / 1000:8.1f} ms  {name.strip()}")
+
+    imported = {name.strip().split(".")[0] for _, _, name in rows}
+    leaked = sorted(set(budget.forbidden) & imported)
+    ok = median_ms <= budget.max_ms and not leaked
+    if leaked:
+        print(f"FAIL: imported at startup: {', '.join(leaked)}")
+    if median_ms > budget.max_ms:
+        print(f"FAIL: over budget by {median_ms - budget.max_ms:.1f} ms")
+    print()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--service", choices=[b.service for b in BUDGETS])
+    args = parser.parse_args()
+
+    budgets = [b for b in BUDGETS if args.service in (None, b.service)]
+    results = [check(budget, args.runs, args.top) for budget in budgets]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
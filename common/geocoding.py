@@ -0,0 +1,195 @@
+import asyncio
+from pathlib import Path
+
+import httpx2
+import msgspec
+
+from common.kvstore import MemoryCache, SqliteStore
+
+GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+
+
+class Result(msgspec.Struct):
+    name: str
+    latitude: float
+    longitude: float
+    country_code: str
+    country: str
+
+
+class GeocodingSearchResponse(msgspec.Struct):
+    results: list[Result]
+
+
+class CachedLookup(msgspec.Struct):
+    found: bool
+    latitude: float = 0.0
+    longitude: float = 0.0
+
+
+class GeocodingError(ValueError):
+    """Raised when the geocoder answers with an error status or is unreachable"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message, status_code)
+        self.message = message
+        self.status_code = status_code
+
+    def __str__(self) -> str:
+        return self.message
+
+
+class Geocoder:
+    """Resolves city names to coordinates with the Open-Meteo geocoder
+
+    Lookups go through a bounded in-memory cache, then a sqlite store that
+    is shared by every process using the same path, and only then to the
+    network. Cities that are not found are cached too, for a shorter time,
+    so repeated unknown names never reach the upstream API.
+    """
+
+    def __init__(
+        self,
+        store_path: str | Path | None,
+        ttl: float = 30 * 24 * 3600,
+        negative_ttl: float = 24 * 3600,
+        memory_size: int = 1024,
+        timeout: float = 10.0,
+        mock: bool = False,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.mock = mock
+        self._memory: MemoryCache[CachedLookup] = MemoryCache(memory_size)
+        self._store: SqliteStore | None = None
+        if store_path is not None:
+            try:
+                self._store = SqliteStore(store_path, "geocoding")
+            except Exception as e:
+                print(f"geocoding store unavailable, using memory only: {e}")
+        self._encoder = msgspec.msgpack.Encoder()
+        self._lookup_decoder = msgspec.msgpack.Decoder(type=CachedLookup)
+        self._response_decoder = msgspec.json.Decoder(type=GeocodingSearchResponse)
+        self._client: httpx2.Client | None = None
+        self._async_client: httpx2.AsyncClient | None = None
+        self._inflight: dict[str, asyncio.Future[CachedLookup]] = {}
+
+    @staticmethod
+    def _params(city: str) -> dict[str, str | int]:
+        return {"name": city, "count": 1, "language": "en", "format": "json"}
+
+    def _cached(self, city: str) -> CachedLookup | None:
+        lookup = self._memory.get(city)
+        if lookup is not None or self._store is None:
+            return lookup
+        raw = self._store.get(city)
+        if raw is None:
+            return None
+        lookup = self._lookup_decoder.decode(raw)
+        ttl = self.ttl if lookup.found else self.negative_ttl
+        self._memory.put(city, lookup, ttl=ttl)
+        return lookup
+
+    def _remember(self, city: str, lookup: CachedLookup):
+        ttl = self.ttl if lookup.found else self.negative_ttl
+        self._memory.put(city, lookup, ttl=ttl)
+        if self._store is not None:
+            self._store.put(city, self._encoder.encode(lookup), ttl=ttl)
+
+    def _parse(self, city: str, resp: httpx2.Response) -> CachedLookup:
+        if resp.status_code < 200 or resp.status_code > 200:
+            raise GeocodingError(
+                f"Non 200 status code {resp.status_code}, {resp.content.decode()}",
+                resp.status_code,
+            )
+        try:
+            geocoding_response = self._response_decoder.decode(resp.content)
+        except Exception:
+            return CachedLookup(found=False)
+
+        results = geocoding_response.results
+        if not results or results[0].name != city:
+            return CachedLookup(found=False)
+
+        result = results[0]
+        return CachedLookup(
+            found=True, latitude=result.latitude, longitude=result.longitude
+        )
+
+    @staticmethod
+    def _unreachable(error: httpx2.TransportError) -> GeocodingError:
+        # timeouts and connection errors count as the service being unavailable
+        return GeocodingError(f"Geocoder unreachable: {error!r}", 503)
+
+    @staticmethod
+    def _coordinates(lookup: CachedLookup) -> tuple[float, float]:
+        if not lookup.found:
+            raise ValueError("City is not found")
+        return lookup.latitude, lookup.longitude
+
+    def get(self, city: str) -> tuple[float, float]:
+        """Returns (latitude, longitude) of a city, blocking on network misses
+
+        Raises:
+            ValueError: the city is unknown
+            GeocodingError: the geocoder returned an error or is unreachable
+        """
+        if self.mock:
+            return 0.0, 0.0
+        lookup = self._cached(city)
+        if lookup is None:
+            if self._client is None:
+                self._client = httpx2.Client(timeout=self.timeout)
+            try:
+                resp = self._client.get(GEOCODING_URL, params=self._params(city))
+            except httpx2.TransportError as e:
+                raise self._unreachable(e) from e
+            lookup = self._parse(city, resp)
+            self._remember(city, lookup)
+        return self._coordinates(lookup)
+
+    async def aget(self, city: str) -> tuple[float, float]:
+        """Async version of get, concurrent lookups of one city share a request
+
+        Raises:
+            ValueError: the city is unknown
+            GeocodingError: the geocoder returned an error or is unreachable
+        """
+        if self.mock:
+            return 0.0, 0.0
+        lookup = self._memory.get(city)
+        if lookup is None:
+            inflight = self._inflight.get(city)
+            if inflight is None:
+                inflight = asyncio.ensure_future(self._afetch(city))
+                self._inflight[city] = inflight
+                inflight.add_done_callback(lambda _: self._inflight.pop(city, None))
+            lookup = await asyncio.shield(inflight)
+        return self._coordinates(lookup)
+
+    async def _afetch(self, city: str) -> CachedLookup:
+        lookup = await asyncio.to_thread(self._cached, city)
+        if lookup is not None:
+            return lookup
+        if self._async_client is None:
+            self._async_client = httpx2.AsyncClient(timeout=self.timeout)
+        try:
+            resp = await self._async_client.get(
+                GEOCODING_URL, params=self._params(city)
+            )
+        except httpx2.TransportError as e:
+            raise self._unreachable(e) from e
+        lookup = self._parse(city, resp)
+        await asyncio.to_thread(self._remember, city, lookup)
+        return lookup
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
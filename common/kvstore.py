@@ -0,0 +1,171 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Generic, TypeVar
+
+_NAMESPACE_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+V = TypeVar("V")
+
+
+class MemoryCache(Generic[V]):
+    """Bounded in-memory LRU cache with per entry expiry, safe across threads"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[V, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> V | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: V, ttl: float | None = None):
+        expires_at = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteStore:
+    """Persistent key value store on a sqlite file
+
+    The file can be shared by every process on a host (it runs in WAL mode),
+    e.g. through a volume mounted into several containers. Entries may have
+    a time to live, and when max_bytes is set the least recently used
+    entries are evicted once the values grow past it.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        namespace: str,
+        max_bytes: int | None = None,
+        evict_every: int = 100,
+    ):
+        if not _NAMESPACE_RE.match(namespace):
+            raise ValueError(f"Invalid store namespace {namespace}")
+        self.path = Path(path)
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._writes = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(f"""CREATE TABLE IF NOT EXISTS {namespace} (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL
+)""")
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {namespace}_accessed_idx ON {namespace} (accessed_at)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(keys))
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"""SELECT key, value FROM {self.namespace}
+WHERE key IN ({placeholders}) AND (expires_at IS NULL OR expires_at > ?)""",
+                [*keys, now],
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    f"UPDATE {self.namespace} SET accessed_at = ? WHERE key IN ({placeholders})",
+                    [now, *keys],
+                )
+        return dict(rows)
+
+    def put(self, key: str, value: bytes, ttl: float | None = None):
+        self.put_many({key: value}, ttl=ttl)
+
+    def put_many(self, items: dict[str, bytes], ttl: float | None = None):
+        if not items:
+            return
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        with self._conn() as conn:
+            conn.executemany(
+                f"""INSERT INTO {self.namespace} (key, value, size, expires_at, accessed_at)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,
+expires_at = excluded.expires_at, accessed_at = excluded.accessed_at""",
+                [
+                    (key, value, len(value), expires_at, now)
+                    for key, value in items.items()
+                ],
+            )
+        self._writes += len(items)
+        if self._writes >= self.evict_every:
+            self._writes = 0
+            self.evict()
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones over max_bytes"""
+        with self._conn() as conn:
+            conn.execute(
+                f"DELETE FROM {self.namespace} WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            )
+            if self.max_bytes is None:
+                return
+            (total,) = conn.execute(
+                f"SELECT coalesce(sum(size), 0) FROM {self.namespace}"
+            ).fetchone()
+            if total <= self.max_bytes:
+                return
+            # shrink below the bound so eviction does not run on every write
+            excess = total - int(self.max_bytes * 0.9)
+            conn.execute(
+                f"""DELETE FROM {self.namespace} WHERE key IN (
+    SELECT key FROM (
+        SELECT key, size, sum(size) OVER (ORDER BY accessed_at, key) AS running
+        FROM {self.namespace}
+    ) WHERE running - size < ?
+)""",
+                (excess,),
+            )
+
+    def stats(self) -> dict[str, int]:
+        with self._conn() as conn:
+            entries, size = conn.execute(
+                f"SELECT count(*), coalesce(sum(size), 0) FROM {self.namespace}"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
@@ -0,0 +1,13 @@
+def parse_tenants(spec: str) -> list[str]:
+    """Parses a comma separated list of tenant names"""
+    return [tenant for tenant in (part.strip() for part in spec.split(",")) if tenant]
+
+
+def tenant_queue(queue: str, tenant: str) -> str:
+    """Name of the task queue of a tenant that has a queue of its own"""
+    return f"{queue}.tenant.{tenant}"
+
+
+def task_queues(queue: str, tenants: list[str]) -> list[str]:
+    """The shared task queue followed by the queue of each tenant in tenants"""
+    return [queue, *(tenant_queue(queue, tenant) for tenant in tenants)]
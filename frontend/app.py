@@ -10,15 +10,27 @@ from shiny import App, Inputs, Outputs, Session, reactive, render, ui
 SERVER_HOST = config.server_host
 SERVER_PORT = config.server_port
 task_id: str | None = None
-
-
-def poll_func() -> str:
-    if task_id is not None:
-        resp = httpx2.get(f"http://{SERVER_HOST}:{SERVER_PORT}/tasks/{task_id}/status")
-        decoder = msgspec.json.Decoder(type=DBStatus)
-        db_state = decoder.decode(resp.content)
-        return db_state.state
-    return "missing"
+TERMINAL_STATES = frozenset({"done", "cancelled", "timeout", "failed"})
+PARTIAL_REFRESH_SECONDS = 2
+
+
+async def follow_task(task_id: str) -> str:
+    """Follows the task event stream and returns the final state"""
+    decoder = msgspec.json.Decoder(type=DBStatus)
+    state = "missing"
+    async with (
+        httpx2.AsyncClient(timeout=httpx2.Timeout(10, read=None)) as client,
+        client.stream(
+            "GET", f"http://{SERVER_HOST}:{SERVER_PORT}/tasks/{task_id}/events"
+        ) as resp,
+    ):
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            state = decoder.decode(line.removeprefix("data:").strip()).state
+            if state in TERMINAL_STATES:
+                break
+    return state
 
 
 def task_output() -> str:
@@ -31,6 +43,18 @@ def task_output() -> str:
     return ""
 
 
+def partial_output() -> str:
+    """Output the running task has written so far, empty when there is none"""
+    if task_id is None:
+        return ""
+    resp = httpx2.get(
+        f"http://{SERVER_HOST}:{SERVER_PORT}/tasks/{task_id}/output/partial"
+    )
+    if resp.status_code != 200:
+        return ""
+    return resp.json()
+
+
 # Define UI
 app_ui = ui.page_sidebar(
     ui.sidebar(
@@ -56,22 +80,17 @@ app_ui = ui.page_sidebar(
 # Define server
 def server(input: Inputs, output: Outputs, session: Session):
     current_data = reactive.value(task_output())
-    polling_status = reactive.value(False)
-    change_detected = reactive.value(False)
+
+    @reactive.extended_task
+    async def wait_for_task(task_id: str) -> str:
+        return await follow_task(task_id)
 
     @reactive.effect
     def _():
-        if polling_status.get() is False:
-            return
-
-        reactive.invalidate_later(5)
-
-        current_state = poll_func()
+        current_state = wait_for_task.result()
 
         if current_state == "done":
             current_data.set(task_output())
-            change_detected.set(True)
-            polling_status.set(False)
         else:
             current_data.set(current_state)
 
@@ -93,13 +112,19 @@ def server(input: Inputs, output: Outputs, session: Session):
         decoder = msgspec.json.Decoder(type=TaskDetails)
         task_details = decoder.decode(resp.content)
         task_id = task_details.task_id
-        polling_status.set(True)
+        current_data.set("running")
+        wait_for_task(task_id)
 
     @render.ui
     def response():
         cur_val = current_data.get()
         if cur_val == "running":
-            return ui.HTML("""<div class="spinner-border" role="status"></div>""")
+            # show what the task wrote so far until it is done
+            reactive.invalidate_later(PARTIAL_REFRESH_SECONDS)
+            return ui.div(
+                ui.HTML("""<div class="spinner-border" role="status"></div>"""),
+                ui.markdown(partial_output()),
+            )
         else:
             return ui.markdown(cur_val)
 
@@ -0,0 +1,27 @@
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, Mock
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+from attractions import KINDS, AttractionStore
+
+
+def test_first_lookup_prefetches_every_kind(tmp_path):
+    store = AttractionStore(store_path=tmp_path / "attractions.sqlite", api_key="key")
+    resp = Mock()
+    resp.status_code = 200
+    resp.content = b'[{"name": "Royal Ontario Museum"}]'
+    store._client = Mock()
+    store._client.get = AsyncMock(return_value=resp)
+
+    async def lookups():
+        return [await store.aget(43.7, -79.4, kinds) for kinds in KINDS]
+
+    results = asyncio.run(lookups())
+
+    assert results[0] == [{"name": "Royal Ontario Museum"}]
+    assert store._client.get.await_count == len(KINDS)
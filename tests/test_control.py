@@ -0,0 +1,75 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+import control as control_module
+from control import CancelWatcher, TaskAborted, TaskControl
+
+
+def test_check_raises_once_over_budget():
+    control = TaskControl("task", budget_seconds=0.05)
+    control.check()
+    time.sleep(0.06)
+    with pytest.raises(TaskAborted) as e:
+        control.check()
+    assert e.value.state == "timeout"
+
+
+def test_cancel_wins_over_a_later_timeout():
+    control = TaskControl("task", budget_seconds=0.01)
+    assert control.abort("cancelled")
+    time.sleep(0.02)
+    with pytest.raises(TaskAborted) as e:
+        control.step_callback(None)
+    assert e.value.state == "cancelled"
+    assert not control.abort("timeout")
+
+
+class FakeConnection:
+    def __init__(self, watcher: CancelWatcher, cancelled: list[str]):
+        self.watcher = watcher
+        self.cancelled = cancelled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+    def execute(self, query, params=None):
+        self.rows = [(task_id,) for task_id in self.cancelled] if params else []
+        return self
+
+    def fetchall(self):
+        return self.rows
+
+    def notifies(self, timeout=None):
+        self.watcher._stopping.set()
+        return []
+
+
+def test_watcher_reconnects_and_rechecks_registered_tasks(monkeypatch):
+    watcher = CancelWatcher("postgresql://")
+    running, cancelled = TaskControl("running"), TaskControl("cancelled")
+    watcher.register(running)
+    watcher.register(cancelled)
+    attempts = []
+
+    def connect(conninfo, autocommit=False):
+        attempts.append(conninfo)
+        if len(attempts) == 1:
+            raise RuntimeError("not a connection error")
+        return FakeConnection(watcher, ["cancelled"])
+
+    monkeypatch.setattr(control_module.psycopg, "connect", connect)
+    watcher._listen()
+    assert len(attempts) == 2
+    with pytest.raises(TaskAborted):
+        cancelled.check()
+    running.check()
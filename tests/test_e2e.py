@@ -41,7 +41,8 @@ def api_container():
     rustfs_container.with_network_aliases("rustfs")
     rustfs_container.start()
 
-    api_img = docker.build((Path(__file__).parent / "../backend").resolve(True))
+    root = (Path(__file__).parent / "..").resolve(True)
+    api_img = docker.build(root, file=root / "backend/Dockerfile")
     api_container = DockerContainer(image=str(api_img))
     api_container.with_network(network)
     api_container.with_exposed_ports(8000)
@@ -70,7 +71,7 @@ def api_container():
     api_container.with_env("RUSTFS_SECRET_KEY", "rustfsadmin")
     api_container.with_env("RUSTFS_BUCKET", "llm")
 
-    worker_img = docker.build((Path(__file__).parent / "../worker").resolve(True))
+    worker_img = docker.build(root, file=root / "worker/Dockerfile")
     worker_container = DockerContainer(str(worker_img))
     worker_container.with_network(network)
     worker_container.with_env("USE_MOCK", "true")
@@ -0,0 +1,62 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import httpx2
+import pytest
+
+from common.geocoding import Geocoder, GeocodingError
+
+
+def make_response(content: bytes) -> Mock:
+    resp = Mock()
+    resp.status_code = 200
+    resp.content = content
+    return resp
+
+
+def test_unknown_city_is_cached(tmp_path):
+    geocoder = Geocoder(store_path=tmp_path / "geocoding.sqlite")
+    geocoder._client = Mock()
+    geocoder._client.get.return_value = make_response(b'{"generationtime_ms": 0.1}')
+
+    for _ in range(3):
+        with pytest.raises(ValueError, match="City is not found"):
+            geocoder.get("asdascasc")
+
+    assert geocoder._client.get.call_count == 1
+
+
+def test_store_is_shared_between_instances(tmp_path):
+    body = b"""{"results": [{"name": "Toronto", "latitude": 43.7, "longitude": -79.4,
+    "country_code": "CA", "country": "Canada"}]}"""
+    first = Geocoder(store_path=tmp_path / "geocoding.sqlite")
+    first._client = Mock()
+    first._client.get.return_value = make_response(body)
+    assert first.get("Toronto") == (43.7, -79.4)
+
+    second = Geocoder(store_path=tmp_path / "geocoding.sqlite")
+    second._client = Mock()
+    assert second.get("Toronto") == (43.7, -79.4)
+    second._client.get.assert_not_called()
+
+
+def test_transport_errors_are_geocoding_errors(tmp_path):
+    geocoder = Geocoder(store_path=tmp_path / "geocoding.sqlite")
+    geocoder._client = Mock()
+    geocoder._client.get.side_effect = httpx2.ConnectError("connection refused")
+    geocoder._async_client = AsyncMock()
+    geocoder._async_client.get.side_effect = httpx2.ReadTimeout("timed out")
+
+    with pytest.raises(GeocodingError) as e:
+        geocoder.get("Toronto")
+    assert e.value.status_code == 503
+    with pytest.raises(GeocodingError) as e:
+        asyncio.run(geocoder.aget("Toronto"))
+    assert e.value.status_code == 503
+    # an outage is not remembered as an unknown city
+    geocoder._client.get.side_effect = None
+    geocoder._client.get.return_value = make_response(
+        b"""{"results": [{"name": "Toronto", "latitude": 43.7, "longitude": -79.4,
+    "country_code": "CA", "country": "Canada"}]}"""
+    )
+    assert geocoder.get("Toronto") == (43.7, -79.4)
@@ -0,0 +1,25 @@
+import sys
+from pathlib import Path
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+from lean import choose_kinds, pick_attractions
+
+
+def test_mostly_wet_trip_prefers_indoor_kinds():
+    kinds = choose_kinds({"wet_days": 5, "dry_days": 2})
+    assert kinds == ["museums", "religion", "architecture", "natural"]
+    assert choose_kinds({"wet_days": 0, "dry_days": 3}) == ["architecture", "natural"]
+
+
+def test_empty_categories_move_to_a_different_one():
+    found = {
+        "museums": [],
+        "religion": {"error": "bad request"},
+        "natural": [{"name": "High Park"}],
+    }
+    assert pick_attractions(["museums", "religion"], found) == {
+        "natural": ["High Park"]
+    }
@@ -0,0 +1,58 @@
+import sys
+from pathlib import Path
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+from llmcache import LLMCache, cache_llm, completion_key
+
+
+class FakeLLM:
+    def __init__(self, replies: list):
+        self.model = "llama3"
+        self.temperature = 0.1
+        self.replies = replies
+        self.calls = 0
+
+    def call(self, messages, tools=None):
+        self.calls += 1
+        return self.replies.pop(0)
+
+
+def test_repeated_completion_is_served_from_cache(tmp_path):
+    cache = LLMCache(tmp_path / "llm.sqlite")
+    llm = cache_llm(FakeLLM(["Day 1: museums"]), cache)
+    messages = [{"role": "user", "content": "Plan a trip to Toronto"}]
+
+    assert llm.call(messages) == "Day 1: museums"
+    # prompt templates differ only in whitespace
+    respaced = [{"role": "user", "content": "Plan a  trip\nto Toronto "}]
+    assert llm.call(respaced) == "Day 1: museums"
+    assert llm.calls == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_tool_calls_are_not_cached(tmp_path):
+    cache = LLMCache(tmp_path / "llm.sqlite")
+    tool_call = {"name": "weather", "arguments": {"city": "Toronto"}}
+    llm = cache_llm(FakeLLM([tool_call, "", "Day 1: parks"]), cache)
+
+    assert llm.call("Plan a trip") == tool_call
+    assert llm.call("Plan a trip") == ""
+    assert llm.call("Plan a trip") == "Day 1: parks"
+    assert llm.calls == 3
+
+
+def test_key_covers_model_settings_and_tools(tmp_path):
+    cache = LLMCache(tmp_path / "llm.sqlite")
+    llm = FakeLLM([])
+    key = completion_key(cache, llm, "Plan a trip")
+
+    assert completion_key(cache, llm, "Plan a trip", tools=[{"name": "w"}]) != key
+    llm.temperature = 0.7
+    assert completion_key(cache, llm, "Plan a trip") != key
+    llm.temperature, llm.model = 0.1, "mistral"
+    assert completion_key(cache, llm, "Plan a trip") != key
+    llm.model = "llama3"
+    assert completion_key(cache, llm, "Plan a trip") == key
@@ -0,0 +1,77 @@
+import asyncio
+import sys
+from pathlib import Path
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+import prefetch
+from prefetch import Prefetched
+
+
+def fake_fetch(found: Prefetched | None, started: list | None = None):
+    async def fetch(city, start_date, end_date, progress=None):
+        if started is not None:
+            started.append((city, start_date, end_date))
+        if found is None:
+            raise ConnectionError("geocoder unreachable")
+        return found
+
+    return fetch
+
+
+def test_tools_read_the_trip_being_prefetched(monkeypatch):
+    started = []
+    data = Prefetched(weather=["sunny"], attractions={"museums": ["ROM"]})
+    monkeypatch.setattr(prefetch, "fetch", fake_fetch(data, started))
+
+    with prefetch.prefetch("Toronto", "2024-01-02", "2024-01-03"):
+        # the city is matched regardless of case and spacing
+        assert prefetch.weather(" toronto ", "2024-01-02", "2024-01-03") == ["sunny"]
+        assert prefetch.attractions("TORONTO", "museums") == ["ROM"]
+        assert prefetch.attractions("Toronto", "parks") is None
+        # weather of other dates is not the trip's
+        assert prefetch.weather("Toronto", "2024-02-01", "2024-02-03") is None
+        assert prefetch.weather("Ottawa", "2024-01-02", "2024-01-03") is None
+
+    assert started == [("Toronto", "2024-01-02", "2024-01-03")]
+    assert prefetch._trips == {}
+    assert prefetch.weather("Toronto", "2024-01-02", "2024-01-03") is None
+
+
+def test_overlapping_trips_of_a_city_are_kept_apart(monkeypatch):
+    first = Prefetched(weather=["snow"], attractions=None)
+    second = Prefetched(weather=["rain"], attractions=None)
+
+    monkeypatch.setattr(prefetch, "fetch", fake_fetch(first))
+    with prefetch.prefetch("Toronto", "2024-01-02", "2024-01-03"):
+        monkeypatch.setattr(prefetch, "fetch", fake_fetch(second))
+        with prefetch.prefetch("Toronto", "2024-04-02", "2024-04-03"):
+            assert prefetch.weather("Toronto", "2024-01-02", "2024-01-03") == ["snow"]
+            assert prefetch.weather("Toronto", "2024-04-02", "2024-04-03") == ["rain"]
+        assert len(prefetch._trips["toronto"]) == 1
+        # the remaining trip failed to fetch its attractions
+        assert prefetch.attractions("Toronto", "museums") is None
+    assert prefetch._trips == {}
+
+
+def test_failed_fetch_leaves_the_tools_to_fetch(monkeypatch):
+    monkeypatch.setattr(prefetch, "fetch", fake_fetch(None))
+    with prefetch.prefetch("Toronto", "2024-01-02", "2024-01-03"):
+        assert prefetch.weather("Toronto", "2024-01-02", "2024-01-03") is None
+        assert prefetch.attractions("Toronto", "museums") is None
+
+
+def test_fetch_keeps_what_succeeded(monkeypatch):
+    async def coordinates(city):
+        return 43.7, -79.4
+
+    async def no_attractions(latitude, longitude, kinds):
+        raise TimeoutError("overpass timed out")
+
+    monkeypatch.setattr(prefetch.geocoder, "aget", coordinates)
+    monkeypatch.setattr(prefetch.weather_store, "daily", lambda *_: ["sunny"])
+    monkeypatch.setattr(prefetch.attraction_store, "aget_many", no_attractions)
+    found = asyncio.run(prefetch.fetch("Toronto", "2024-01-02", "2024-01-03"))
+    assert found == Prefetched(weather=["sunny"], attractions=None)
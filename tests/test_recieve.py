@@ -0,0 +1,222 @@
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+import msgspec
+import pytest
+from botocore.exceptions import ClientError
+from pika.spec import Basic, BasicProperties
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+import recieve
+
+
+class FakeWatcher:
+    def __init__(self, events: list):
+        self.events = events
+
+    def register(self, control):
+        self.events.append("register")
+
+    def unregister(self, control):
+        self.events.append("unregister")
+
+
+def payload() -> recieve.Payload:
+    return recieve.Payload(
+        task_id="6f1c1a52-6c8e-4a39-9d3c-0c2d6d7a7f10",
+        city="Toronto",
+        start_date="2024-01-02",
+        end_date="2024-01-03",
+    )
+
+
+def test_task_is_registered_before_it_is_marked_running(monkeypatch):
+    events = []
+
+    def update_db(task_id, state, error=None):
+        events.append(state)
+        # cancelled between the registration and the state write
+        return False
+
+    def run_pipeline(data, control):
+        raise AssertionError("a cancelled task must not run")
+
+    monkeypatch.setattr(recieve, "cancel_watcher", lambda: FakeWatcher(events))
+    monkeypatch.setattr(recieve, "update_db", update_db)
+    monkeypatch.setattr(recieve, "run_pipeline", run_pipeline)
+    recieve.process_message(payload())
+    assert events == ["register", "running", "unregister"]
+
+
+class FakeS3:
+    def __init__(self, events: list):
+        self.events = events
+
+    def delete_object(self, Bucket, Key):
+        self.events.append(f"delete {Key}")
+
+
+@pytest.mark.parametrize("outcome", ["done", "cancelled"])
+def test_partial_output_is_deleted_when_the_task_stops(monkeypatch, outcome):
+    events = []
+    data = payload()
+
+    def update_db(task_id, state, error=None):
+        events.append(state)
+        return True
+
+    def run_pipeline(data, control):
+        if outcome == "cancelled":
+            raise recieve.TaskAborted(data.task_id, "cancelled")
+        return "itinerary"
+
+    monkeypatch.setattr(recieve, "cancel_watcher", lambda: FakeWatcher(events))
+    monkeypatch.setattr(recieve, "update_db", update_db)
+    monkeypatch.setattr(recieve, "run_pipeline", run_pipeline)
+    monkeypatch.setattr(recieve, "s3_client", lambda: FakeS3(events))
+    monkeypatch.setattr(recieve, "upload_text_to_rustfs", lambda *_: True)
+    monkeypatch.setattr(recieve, "LLM_CACHE_ENABLED", False)
+    if outcome == "cancelled":
+        with pytest.raises(recieve.TaskAborted):
+            recieve.process_message(data)
+    else:
+        recieve.process_message(data)
+    expected = ["register", "running"] + (["done"] if outcome == "done" else [])
+    assert events == expected + ["unregister", f"delete {data.task_id}.partial.txt"]
+
+
+class FakeChannel:
+    def __init__(self, connection: "FakeConnection", bodies: list[bytes]):
+        self.connection = connection
+        self.bodies = bodies
+        self.consumers = {}
+        self.prefetch_count = None
+        self.acked = []
+
+    def confirm_delivery(self):
+        pass
+
+    def queue_declare(self, queue, arguments=None):
+        pass
+
+    def basic_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback, auto_ack):
+        self.consumers[queue] = on_message_callback
+        return f"ctag-{queue}"
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def start_consuming(self):
+        deliver = self.consumers[recieve.RABBITMQ_QUEUE]
+        for tag, body in enumerate(self.bodies, start=1):
+            properties = BasicProperties(headers=None, priority=0)
+            deliver(self, Basic.Deliver(delivery_tag=tag), properties, body)
+        # runs the completions the pool threads hand back, as pika would
+        while len(self.acked) < len(self.bodies):
+            self.connection.callbacks.get(timeout=5)()
+
+
+class FakeConnection:
+    def __init__(self, bodies: list[bytes]):
+        self.callbacks: queue.Queue = queue.Queue()
+        self.chan = FakeChannel(self, bodies)
+
+    def channel(self):
+        return self.chan
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.put(callback)
+
+
+class Closeable:
+    def close(self):
+        pass
+
+
+def test_main_runs_at_most_worker_concurrency_tasks(monkeypatch):
+    bodies = [msgspec.msgpack.encode(payload()) for _ in range(6)]
+    connection = FakeConnection(bodies)
+    lock = threading.Lock()
+    running = peak = 0
+
+    def run_task(data, attempt, policy):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return recieve.Outcome("ack")
+
+    monkeypatch.setattr(recieve, "WORKER_CONCURRENCY", 2)
+    monkeypatch.setattr(recieve, "PREFETCH_COUNT", 6)
+    monkeypatch.setattr(recieve, "TASK_QUEUES", [recieve.RABBITMQ_QUEUE])
+    monkeypatch.setattr(recieve, "ensure_bucket", lambda *_: None)
+    monkeypatch.setattr(recieve, "s3_client", lambda: None)
+    monkeypatch.setattr(recieve, "state_writer", Closeable)
+    monkeypatch.setattr(recieve, "cancel_watcher", Closeable)
+    monkeypatch.setattr(recieve, "run_task", run_task)
+    monkeypatch.setattr(recieve.pika, "BlockingConnection", lambda _: connection)
+    monkeypatch.setattr(recieve.signal, "signal", lambda *_: None)
+
+    load = [None, None]
+    recieve.main(load)
+
+    assert connection.chan.prefetch_count == 6
+    assert peak == 2
+    assert sorted(connection.chan.acked) == list(range(1, 7))
+    assert load == [0, 0]
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code}}, "operation")
+
+
+class FakeBucketClient:
+    def __init__(self, missing_puts: int = 0):
+        self.calls = []
+        self.missing_puts = missing_puts
+
+    def head_bucket(self, Bucket):
+        self.calls.append("head_bucket")
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.calls.append("put_object")
+        if self.missing_puts:
+            self.missing_puts -= 1
+            raise client_error("NoSuchBucket")
+
+
+@pytest.fixture
+def known_buckets(monkeypatch):
+    monkeypatch.setattr(recieve, "_known_buckets", set())
+
+
+def test_bucket_is_checked_once(known_buckets):
+    client = FakeBucketClient()
+    assert recieve.upload_text_to_rustfs(client, "trips", "a.txt", "a")
+    assert recieve.upload_text_to_rustfs(client, "trips", "b.txt", "b")
+    assert client.calls == ["head_bucket", "put_object", "put_object"]
+
+
+def test_upload_rechecks_a_bucket_that_went_missing(known_buckets):
+    client = FakeBucketClient(missing_puts=1)
+    recieve.ensure_bucket(client, "trips")
+    assert recieve.upload_text_to_rustfs(client, "trips", "a.txt", "a")
+    assert client.calls == ["head_bucket", "put_object", "head_bucket", "put_object"]
+
+
+def test_upload_gives_up_after_one_recheck(known_buckets):
+    client = FakeBucketClient(missing_puts=2)
+    assert not recieve.upload_text_to_rustfs(client, "trips", "a.txt", "a")
+    assert client.calls.count("put_object") == 2
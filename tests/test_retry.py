@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+from common.geocoding import GeocodingError
+from retry import RetryPolicy, describe, is_transient
+
+
+def test_classifies_errors():
+    assert is_transient(TimeoutError())
+    assert is_transient(GeocodingError("Non 200 status code 503", 503))
+    assert not is_transient(GeocodingError("Non 200 status code 400", 400))
+    assert not is_transient(ValueError("City is not found"))
+
+
+def test_follows_the_cause():
+    try:
+        try:
+            raise ConnectionError("refused")
+        except ConnectionError as e:
+            raise RuntimeError("tool failed") from e
+    except RuntimeError as e:
+        assert is_transient(e)
+
+
+def test_backoff_doubles_up_to_the_cap():
+    policy = RetryPolicy("messages", max_attempts=6, base_delay=5, max_delay=30)
+    assert [policy.delay(attempt) for attempt in range(2, 7)] == [5, 10, 20, 30, 30]
+    assert policy.delay_queue(3) == "messages.retry.10s"
+
+
+def test_gives_up_after_max_attempts():
+    policy = RetryPolicy("messages", max_attempts=3)
+    assert policy.attempts(None) == 0
+    assert policy.attempts({"x-attempts": 2}) == 2
+    assert policy.should_retry(TimeoutError(), attempt=2)
+    assert not policy.should_retry(TimeoutError(), attempt=3)
+    assert not policy.should_retry(ValueError(), attempt=1)
+
+
+def test_describe_is_bounded():
+    assert describe(ValueError("x" * 1000)).startswith("ValueError: x")
+    assert len(describe(ValueError("x" * 1000))) == 500
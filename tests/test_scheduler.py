@@ -0,0 +1,64 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+from scheduler import FairScheduler, parse_weights
+
+
+def test_higher_priority_goes_first():
+    scheduler = FairScheduler()
+    scheduler.push("batch", tenant="a", priority=2)
+    scheduler.push("ui", tenant="a", priority=8)
+    assert [scheduler.pop(), scheduler.pop()] == ["ui", "batch"]
+    assert scheduler.pop() is None
+
+
+def test_tenants_share_by_weight():
+    scheduler = FairScheduler({"big": 3})
+    for i in range(8):
+        scheduler.push(("big", i), tenant="big")
+        scheduler.push(("small", i), tenant="small")
+    served = [scheduler.pop()[0] for _ in range(8)]
+    assert served.count("big") == 6
+    assert served.count("small") == 2
+
+
+def test_parse_weights():
+    assert parse_weights("") == {}
+    assert parse_weights("ui=4, bulk=0.5") == {"ui": 4.0, "bulk": 0.5}
+    with pytest.raises(ValueError):
+        parse_weights("ui")
+
+
+def test_deep_backlog_does_not_starve_other_tenants():
+    # a tenant with a queue of its own fills only its consumer's prefetch
+    # window, however deep its backlog in the broker
+    window = 8
+    scheduler = FairScheduler()
+    backlog = iter(range(10_000))
+    for _ in range(window):
+        scheduler.push(("bulk", next(backlog)), tenant="bulk")
+    served = [scheduler.pop()[0] for _ in range(3)]
+    for _ in range(3):
+        scheduler.push(("bulk", next(backlog)), tenant="bulk")
+    scheduler.push(("ui", 0), tenant="ui")
+    served += [scheduler.pop()[0] for _ in range(2)]
+    assert served == ["bulk"] * 3 + ["ui", "bulk"]
+
+
+def test_idle_tenants_are_forgotten():
+    scheduler = FairScheduler()
+    for i in range(4):
+        scheduler.push(("busy", i), tenant="busy")
+    for tenant in ["a", "b", "c"]:
+        scheduler.push((tenant, 0), tenant=tenant)
+    served = [scheduler.pop()[0] for _ in range(6)]
+    assert sorted(served) == ["a", "b", "busy", "busy", "busy", "c"]
+    assert set(scheduler._virtual_time) == {"busy"}
+    scheduler.pop()
+    assert not scheduler._virtual_time
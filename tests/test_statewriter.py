@@ -0,0 +1,39 @@
+import datetime
+import sys
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+
+import psycopg
+import pytest
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+from statewriter import StateWriter, Write
+
+
+def write(state: str) -> Write:
+    return Write("state", str(uuid.uuid4()), state, datetime.datetime.now(), Future())
+
+
+def test_bad_write_fails_alone():
+    writer = StateWriter("postgresql://")
+    executed = []
+
+    def execute(batch: list[Write]):
+        # a value the database rejects fails every write of its statement
+        if any(w.value == "not-a-state" for w in batch):
+            raise psycopg.DataError("invalid input value for enum task_state")
+        executed.append(batch)
+        return {w.task_id: w for w in batch}, {w.task_id for w in batch}
+
+    writer._execute = execute
+    batch = [write("running"), write("not-a-state"), write("done")]
+    writer._flush(batch)
+
+    assert batch[0].future.result() and batch[2].future.result()
+    with pytest.raises(psycopg.DataError):
+        batch[1].future.result()
+    assert [[w.value for w in b] for b in executed] == [["running"], ["done"]]
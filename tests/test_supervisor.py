@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+from supervisor import desired_processes
+
+
+def test_sizes_to_demand_within_bounds():
+    assert desired_processes(0, 2, 3, False, 1, 4) == 1
+    assert desired_processes(5, 2, 1, False, 1, 4) == 3
+    assert desired_processes(50, 2, 1, False, 1, 4) == 4
+
+
+def test_does_not_grow_while_saturated():
+    assert desired_processes(50, 2, 2, True, 1, 4) == 2
+    assert desired_processes(0, 2, 2, True, 1, 4) == 1
@@ -0,0 +1,62 @@
+import datetime
+import sys
+from pathlib import Path
+
+worker_path = str(Path(__file__).parent.parent / "worker")
+if worker_path not in sys.path:
+    sys.path.append(worker_path)
+
+from weather import DailyWeather, WeatherStore, summarize
+
+
+def test_overlapping_queries_fetch_only_missing_days(tmp_path):
+    store = WeatherStore(tmp_path / "weather.sqlite")
+    fetched = []
+
+    def fake_fetch(location, start, end):
+        fetched.append((start, end))
+        days = (end - start).days + 1
+        return [
+            DailyWeather(
+                date=start + datetime.timedelta(days=i), values=[1.0, 0.0, 0.0, 0.0]
+            )
+            for i in range(days)
+        ]
+
+    store._fetch = fake_fetch
+    first = store.daily(
+        43.7001, -79.4163, datetime.date(2024, 2, 1), datetime.date(2024, 2, 10)
+    )
+    second = store.daily(
+        43.7002, -79.4161, datetime.date(2024, 2, 3), datetime.date(2024, 2, 12)
+    )
+
+    assert [day.date for day in first][0] == datetime.date(2024, 2, 1)
+    assert len(second) == 10
+    assert fetched == [
+        (datetime.date(2024, 2, 1), datetime.date(2024, 2, 10)),
+        (datetime.date(2024, 2, 11), datetime.date(2024, 2, 12)),
+    ]
+
+
+def test_summary_size_does_not_depend_on_trip_length():
+    start = datetime.date(2024, 1, 1)
+    days = []
+    for i in range(90):
+        precipitation = 2.0 if i % 3 == 0 else 0.0
+        days.append(
+            DailyWeather(
+                date=start + datetime.timedelta(days=i),
+                values=[float(i % 10), precipitation, precipitation, 1.0],
+            )
+        )
+
+    summary = summarize(days, table_rows=4)
+
+    assert summary["days"] == 90
+    assert summary["temperature_min"] == 0.0
+    assert summary["temperature_max"] == 9.0
+    assert summary["wet_days"] == 30
+    assert summary["wet_day_flags"].startswith("100100")
+    assert len(summary["table"]) == 4
+    assert summary["table"][-1]["end_date"] == "2024-03-30"
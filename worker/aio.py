@@ -0,0 +1,29 @@
+import asyncio
+import threading
+from collections.abc import Coroutine
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def event_loop() -> asyncio.AbstractEventLoop:
+    """Returns the worker's background event loop, started on first use
+
+    The crew and its tools run on pool threads. Async clients are bound to
+    the loop they were first used on, so all async I/O of the process runs
+    on this one loop and its connection pools are reused across tasks.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="aio", daemon=True).start()
+    return _loop
+
+
+def run(coro: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+    """Runs coro on the background loop and blocks until it returns"""
+    return asyncio.run_coroutine_threadsafe(coro, event_loop()).result(timeout)
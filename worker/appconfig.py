@@ -1,3 +1,6 @@
+import tempfile
+from pathlib import Path
+
 import environ
 from dotenv import load_dotenv
 
@@ -16,21 +19,82 @@ class AppConfig:
     postgres_db: str = environ.var(default="postgres")
     postgres_pass: str = environ.var(default="postgres")
     postgres_port: str = environ.var(default="5433")
+    db_pool_max_size: int = environ.var(default=2, converter=int)
+    # most task state transitions written by one UPDATE
+    state_batch_size: int = environ.var(default=100, converter=int)
     rabbitmq_user: str = environ.var(default="user")
     rabbitmq_pass: str = environ.var(default="password")
     rabbitmq_host: str = environ.var(default="localhost")
     rabbitmq_port: int = environ.var(default=5672, converter=int)
     rabbitmq_queue: str = environ.var(default="messages")
+    rabbitmq_heartbeat: int = environ.var(default=60, converter=int)
+    worker_concurrency: int = environ.var(default=1, converter=int)
+    # 0 means scheduling_lookahead prefetched messages per execution slot
+    prefetch_count: int = environ.var(default=0, converter=int)
+    scheduling_lookahead: int = environ.var(default=4, converter=int)
+    # 0 declares a plain FIFO queue, must match the backend's setting
+    rabbitmq_max_priority: int = environ.var(default=10, converter=int)
+    # share of the worker each tenant gets, as "tenant=weight,..." (default 1)
+    tenant_weights: str = environ.var(default="")
+    # tenants with a task queue of their own, as "tenant,...", so their
+    # backlog cannot hold up the others. Must match the backend's setting.
+    tenant_queues: str = environ.var(default="")
+    # deliveries per task, including the first one, before it is failed
+    task_max_attempts: int = environ.var(default=4, converter=int)
+    # the n-th retry waits base * 2**(n - 1) seconds, at most max
+    retry_base_delay_seconds: float = environ.var(default=5, converter=float)
+    retry_max_delay_seconds: float = environ.var(default=300, converter=float)
+    # consumer processes the supervisor keeps running
+    min_processes: int = environ.var(default=1, converter=int)
+    max_processes: int = environ.var(default=4, converter=int)
+    scale_interval_seconds: float = environ.var(default=5, converter=float)
+    # how long demand must stay below capacity before a process is retired
+    scale_down_delay_seconds: float = environ.var(default=60, converter=float)
+    # how long a draining process may finish its running tasks before it is killed
+    drain_timeout_seconds: float = environ.var(default=660, converter=float)
+    # requests Ollama serves at once (its OLLAMA_NUM_PARALLEL), no processes
+    # are added while this many tasks run. Required for scaling, with 0 the
+    # supervisor keeps min_processes.
+    ollama_parallel: int = environ.var(default=0, converter=int)
+    # "crew" runs the multi agent crew, "lean" a single LLM call
+    pipeline: str = environ.var(default="crew")
+    # fetch the weather and attractions of a trip as soon as its message arrives
+    prefetch_tool_data: bool = environ.var(default=True, converter=use_mock_converter)
+    # least seconds between uploads of a running task's partial output
+    partial_flush_seconds: float = environ.var(default=1.0, converter=float)
+    # wall clock seconds a task may run before it is aborted, 0 for no limit
+    task_time_budget_seconds: float = environ.var(default=600, converter=float)
     rustfs_host: str = environ.var(default="localhost")
     rustfs_port: str = environ.var(default="9000")
     rustfs_access_key: str = environ.var(default="rustfsadmin")
     rustfs_secret_key: str = environ.var(default="rustfsadmin")
     rustfs_bucket: str = environ.var(default="llm")
+    # total attempts per S3 request, including the first one
+    s3_max_attempts: int = environ.var(default=5, converter=int)
     api_key: str = environ.var(default="")
     use_mock: bool = environ.var(default=False, converter=use_mock_converter)
+    cache_dir: str = environ.var(
+        default=str(Path(tempfile.gettempdir()) / "trip-planner")
+    )
+    geocode_ttl_seconds: int = environ.var(default=30 * 24 * 3600, converter=int)
+    geocode_negative_ttl_seconds: int = environ.var(default=24 * 3600, converter=int)
+    geocode_memory_size: int = environ.var(default=1024, converter=int)
+    weather_cache_max_bytes: int = environ.var(default=256 * 1024 * 1024, converter=int)
+    # decimals coordinates are rounded to before weather lookups
+    weather_coordinate_precision: int = environ.var(default=2, converter=int)
+    # "summary" gives the weather agent fixed size aggregates, "daily" every day
+    weather_output: str = environ.var(default="summary")
+    weather_table_rows: int = environ.var(default=0, converter=int)
+    attractions_ttl_seconds: int = environ.var(default=7 * 24 * 3600, converter=int)
+    # fetch every attraction category on the first lookup of a city
+    attractions_prefetch_all: bool = environ.var(
+        default=True, converter=use_mock_converter
+    )
     ollama_host: str = environ.var(default="localhost")
     ollama_port: str = environ.var(default="11434")
     ollama_llm: str = environ.var(default="qwen3:8b")
+    llm_cache_enabled: bool = environ.var(default=True, converter=use_mock_converter)
+    llm_cache_max_bytes: int = environ.var(default=512 * 1024 * 1024, converter=int)
     phoenix_collector_endpoint: str = environ.var(
         default="http://localhost:6006/v1/traces"
     )
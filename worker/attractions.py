@@ -0,0 +1,128 @@
+import asyncio
+from pathlib import Path
+
+import httpx2
+import msgspec
+
+from common.kvstore import MemoryCache, SqliteStore
+
+PLACES_URL = "https://api.opentripmap.com/0.1/en/places/radius"
+
+KINDS = ["museums", "religion", "architecture", "natural"]
+
+
+class AttractionStore:
+    """Cached OpenTripMap attraction lookups
+
+    Results are cached by (rounded latitude, rounded longitude, radius,
+    kinds) in memory and in a sqlite store shared by the workers on a host.
+    With prefetch_all a miss fetches every supported kind at once over one
+    pooled async client, since the agent usually goes on to try the other
+    categories for the same city.
+    """
+
+    def __init__(
+        self,
+        store_path: str | Path | None,
+        api_key: str,
+        ttl: float = 7 * 24 * 3600,
+        memory_size: int = 1024,
+        precision: int = 3,
+        radius: int = 5000,
+        limit: int = 5,
+        timeout: float = 10.0,
+        prefetch_all: bool = True,
+    ):
+        self.api_key = api_key
+        self.ttl = ttl
+        self.precision = precision
+        self.radius = radius
+        self.limit = limit
+        self.timeout = timeout
+        self.prefetch_all = prefetch_all
+        self._memory: MemoryCache[bytes] = MemoryCache(memory_size)
+        self._store: SqliteStore | None = None
+        if store_path is not None:
+            try:
+                self._store = SqliteStore(store_path, "attractions")
+            except Exception as e:
+                print(f"attraction store unavailable, using memory only: {e}")
+        self._client: httpx2.AsyncClient | None = None
+        self._decoder = msgspec.json.Decoder()
+
+    def _key(self, latitude: float, longitude: float, kinds: str) -> str:
+        return (
+            f"{round(latitude, self.precision)},{round(longitude, self.precision)},"
+            f"{self.radius},{self.limit},{kinds}"
+        )
+
+    def _cached(self, key: str) -> bytes | None:
+        raw = self._memory.get(key)
+        if raw is not None or self._store is None:
+            return raw
+        raw = self._store.get(key)
+        if raw is not None:
+            self._memory.put(key, raw, ttl=self.ttl)
+        return raw
+
+    def _remember(self, key: str, raw: bytes):
+        self._memory.put(key, raw, ttl=self.ttl)
+        if self._store is not None:
+            self._store.put(key, raw, ttl=self.ttl)
+
+    async def _fetch(self, latitude: float, longitude: float, kinds: str) -> bytes:
+        if self._client is None:
+            self._client = httpx2.AsyncClient(timeout=self.timeout)
+        params = {
+            "lang": "en",
+            "radius": self.radius,
+            "lon": longitude,
+            "lat": latitude,
+            "format": "json",
+            "limit": self.limit,
+            "kinds": kinds,
+            "apikey": self.api_key,
+        }
+        resp = await self._client.get(PLACES_URL, params=params)
+        # errors are returned to the agent as before, but never cached
+        if resp.status_code == 200:
+            await asyncio.to_thread(
+                self._remember, self._key(latitude, longitude, kinds), resp.content
+            )
+        return resp.content
+
+    async def aget(self, latitude: float, longitude: float, kinds: str):
+        """Returns the decoded attractions of one kind around a location"""
+        raw = await asyncio.to_thread(
+            self._cached, self._key(latitude, longitude, kinds)
+        )
+        if raw is None:
+            wanted = KINDS if self.prefetch_all and kinds in KINDS else [kinds]
+            results = await self.aget_many(latitude, longitude, wanted)
+            return results[kinds]
+        return self._decoder.decode(raw)
+
+    async def aget_many(
+        self, latitude: float, longitude: float, kinds: list[str]
+    ) -> dict[str, object]:
+        """Fetches the kinds that are not cached concurrently, returns all of them"""
+        found = {}
+        missing = []
+        for kind in kinds:
+            raw = await asyncio.to_thread(
+                self._cached, self._key(latitude, longitude, kind)
+            )
+            if raw is None:
+                missing.append(kind)
+            else:
+                found[kind] = raw
+        fetched = await asyncio.gather(
+            *(self._fetch(latitude, longitude, kind) for kind in missing)
+        )
+        found.update(zip(missing, fetched))
+        return {kind: self._decoder.decode(raw) for kind, raw in found.items()}
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
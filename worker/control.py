@@ -0,0 +1,152 @@
+import threading
+import time
+
+import msgspec
+import psycopg
+
+TASK_EVENTS_CHANNEL = "task_events"
+
+SELECT_CANCELLED = (
+    "SELECT id::text from tasks where id = ANY(%s::uuid[]) and state = 'cancelled'"
+)
+
+
+class TaskAborted(BaseException):
+    """Raised inside a task that was cancelled or ran out of time
+
+    A BaseException so the retries crewai runs on Exception inside
+    agents do not swallow it.
+    """
+
+    def __init__(self, task_id: str, state: str):
+        super().__init__(task_id, state)
+        self.task_id = task_id
+        self.state = state
+
+    def __str__(self) -> str:
+        return f"task {self.task_id} {self.state}"
+
+
+class TaskControl:
+    """Cancellation flag and wall clock budget of one running task
+
+    The pipeline calls check between its steps, which raises once the task
+    was cancelled or went over budget.
+    """
+
+    def __init__(self, task_id: str, budget_seconds: float = 0):
+        self.task_id = task_id
+        self.deadline = (
+            time.monotonic() + budget_seconds if budget_seconds > 0 else None
+        )
+        self._aborted: str | None = None
+        self._lock = threading.Lock()
+
+    def abort(self, state: str) -> bool:
+        """Marks the task as aborted, returns False when it already was"""
+        with self._lock:
+            if self._aborted is not None:
+                return False
+            self._aborted = state
+            return True
+
+    def remaining(self) -> float | None:
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def check(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.abort("timeout")
+        if self._aborted is not None:
+            raise TaskAborted(self.task_id, self._aborted)
+
+    def step_callback(self, *_):
+        """Crew step callback, runs after every agent step"""
+        self.check()
+
+
+class TaskEvent(msgspec.Struct):
+    id: str
+    state: str
+
+
+class CancelWatcher:
+    """Flags running tasks when the backend cancels them
+
+    Listens to the task events the tasks table trigger sends, on one
+    connection per worker process, and aborts the control of a registered
+    task whose state turns to cancelled. Notifications sent while the
+    connection is down are lost, so after every (re)connect the registered
+    tasks are looked up in the tasks table instead.
+    """
+
+    def __init__(self, conninfo: str):
+        self.conninfo = conninfo
+        self._controls: dict[str, TaskControl] = {}
+        self._lock = threading.Lock()
+        self._decoder = msgspec.json.Decoder(type=TaskEvent)
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._listen, name="cancel-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def register(self, control: TaskControl):
+        with self._lock:
+            self._controls[control.task_id] = control
+
+    def unregister(self, control: TaskControl):
+        with self._lock:
+            self._controls.pop(control.task_id, None)
+
+    def _dispatch(self, payload: str):
+        try:
+            event = self._decoder.decode(payload)
+        except msgspec.DecodeError:
+            return
+        if event.state != "cancelled":
+            return
+        with self._lock:
+            control = self._controls.get(event.id)
+        if control is not None:
+            control.abort("cancelled")
+
+    def _resync(self, conn: psycopg.Connection):
+        with self._lock:
+            task_ids = list(self._controls)
+        if not task_ids:
+            return
+        for (task_id,) in conn.execute(SELECT_CANCELLED, (task_ids,)).fetchall():
+            with self._lock:
+                control = self._controls.get(task_id)
+            if control is not None:
+                control.abort("cancelled")
+
+    def _listen(self):
+        delay = 0.5
+        while not self._stopping.is_set():
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {TASK_EVENTS_CHANNEL}")
+                    # cancels committed before the LISTEN sent no notification
+                    self._resync(conn)
+                    delay = 0.5
+                    while not self._stopping.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            self._dispatch(notify.payload)
+            except Exception as e:
+                # the watcher must outlive any error, tasks are cancelled
+                # through it for the lifetime of the worker
+                print(f"cancel watcher disconnected: {e!r}, reconnecting")
+                self._stopping.wait(delay)
+                delay = min(delay * 2, 30)
@@ -0,0 +1,125 @@
+import functools
+import threading
+from typing import NamedTuple
+
+from appconfig import config
+from crewai import LLM, Agent, Crew, Task
+from crewai.agents.agent_builder.base_agent import BaseAgent
+from crewai.project import CrewBase, agent, crew, task
+from llmcache import cache_llm
+from llmclient import (
+    LLM_CACHE_ENABLED,
+    LLM_TEMPERATURE,
+    LLM_TIMEOUT_SECONDS,
+    OLLAMA_HOST,
+    OLLAMA_LLM,
+    OLLAMA_PORT,
+    llm_cache,
+)
+from tools import AttractionTool, WeatherTool
+
+PHOENIX_COLLECTOR_ENDPOINT = config.phoenix_collector_endpoint
+
+
+@functools.cache
+def shared_llm() -> LLM:
+    """LLM client shared by every agent of every crew in this process"""
+    llm = LLM(
+        provider="ollama",
+        model=f"{OLLAMA_LLM}",
+        base_url=f"http://{OLLAMA_HOST}:{OLLAMA_PORT}/v1/",
+        api_key="ollama",
+        timeout=LLM_TIMEOUT_SECONDS,
+        temperature=LLM_TEMPERATURE,
+    )
+    if LLM_CACHE_ENABLED:
+        # identical prompts with identical tool results skip the GPU
+        cache_llm(llm, llm_cache())
+    return llm
+
+
+class SharedTools(NamedTuple):
+    weather: WeatherTool
+    attractions: AttractionTool
+
+
+@functools.cache
+def shared_tools() -> SharedTools:
+    return SharedTools(weather=WeatherTool(), attractions=AttractionTool())
+
+
+# tracer_provider = register(
+#     endpoint=PHOENIX_COLLECTOR_ENDPOINT,
+#     project_name="crewai-tracing",
+#     auto_instrument=True,
+#     protocol="http/protobuf",
+#     batch=True,
+# )
+
+
+@CrewBase
+class MultiAgentCrew:
+    agents: list[BaseAgent]
+    tasks: list[Task]
+
+    agents_config: str = "config/agents.yaml"
+    tasks_config: str = "config/task.yaml"
+
+    @agent
+    def weather_agent(self) -> Agent:
+        return Agent(
+            config=self.agents_config["weather"],  # type: ignore[index]
+            llm=shared_llm(),
+            allow_delegation=True,
+            max_iter=5,
+        )
+
+    @agent
+    def attractions_agent(self) -> Agent:
+        return Agent(
+            config=self.agents_config["trip"],  # type: ignore[index]
+            llm=shared_llm(),
+            allow_delegation=True,
+            max_iter=5,
+        )
+
+    @task
+    def weather_task(self) -> Task:
+        return Task(
+            config=self.tasks_config["weather_task"],  # type: ignore[index]
+            agent=self.weather_agent(),
+            tools=[shared_tools().weather],
+        )
+
+    @task
+    def attraction_task(self) -> Task:
+        return Task(
+            config=self.tasks_config["attraction_task"],  # type: ignore[index]
+            agent=self.attractions_agent(),
+            tools=[shared_tools().attractions],
+            context=[self.weather_task()],
+        )
+
+    @crew
+    def crew(self) -> Crew:
+        return Crew(agents=self.agents, tasks=self.tasks, verbose=True)
+
+
+_template_lock = threading.Lock()
+
+
+@functools.cache
+def _template_crew() -> Crew:
+    # parses the yaml configs once, the template itself is never kicked off
+    return MultiAgentCrew().crew()
+
+
+def new_crew() -> Crew:
+    """Returns a crew for one message
+
+    The crew is copied from a process wide template, so the yaml configs are
+    parsed once and the LLM client and tools are shared. Inputs are
+    interpolated into the copy's templates by kickoff.
+    """
+    with _template_lock:
+        return _template_crew().copy()
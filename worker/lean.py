@@ -0,0 +1,185 @@
+import datetime
+import json
+
+import aio
+from attractions import KINDS
+from control import TaskControl
+from llmcache import completion_key
+from llmclient import LLM_CACHE_ENABLED, MODEL, llm_cache, stream_completion
+from prefetch import Trip, fetch
+from progress import Progress
+from stores import attraction_store, geocoder, weather_store
+from weather import DailyWeather, summarize
+
+# the categories task.yaml asks the attraction agent to pick by weather
+INDOOR_KINDS = ["museums", "religion"]
+OUTDOOR_KINDS = ["architecture", "natural"]
+
+SYSTEM_PROMPT = """You are an expert trip planner. Write a short itinerary for the trip \
+using only the weather summary and the attractions you are given. \
+Recommend the indoor attractions for wet days and the outdoor ones for dry days."""
+
+USER_PROMPT = """City: {city}
+Dates: {start_date} to {end_date}
+
+Weather summary:
+{weather}
+
+Attractions by category:
+{attractions}
+
+Write a summary of the weather for the trip, followed by a bullet point \
+list of attractions to visit based on the weather conditions such as \
+precipitation."""
+
+
+def choose_kinds(summary: dict) -> list[str]:
+    """Attraction categories for the weather, the better fitting ones first
+
+    Mirrors the branching of the attraction task: indoor categories when
+    there is precipitation, outdoor ones when there is none.
+    """
+    kinds = []
+    if summary.get("wet_days", 0) > 0:
+        kinds += INDOOR_KINDS
+    if summary.get("dry_days", 0) > 0:
+        kinds += OUTDOOR_KINDS
+    if summary.get("wet_days", 0) > summary.get("dry_days", 0):
+        return kinds
+    return sorted(kinds, key=lambda kind: kind in INDOOR_KINDS)
+
+
+def _names(found: object) -> list[str]:
+    # errors come back as an object, places as a list
+    if not isinstance(found, list):
+        return []
+    return [place["name"] for place in found if place.get("name")]
+
+
+def pick_attractions(
+    kinds: list[str], found: dict[str, object]
+) -> dict[str, list[str]]:
+    """Attraction names of the chosen kinds, moving on to other kinds when empty"""
+    picked = {kind: _names(found.get(kind)) for kind in kinds}
+    picked = {kind: names for kind, names in picked.items() if names}
+    if not picked:
+        # no attractions for the chosen categories, move to a different one
+        for kind in KINDS:
+            names = _names(found.get(kind))
+            if names:
+                return {kind: names}
+    return picked
+
+
+def complete(
+    messages: list[dict[str, str]],
+    progress: Progress | None,
+    control: TaskControl | None = None,
+) -> str:
+    """Completes messages with Ollama, streaming into progress if given
+
+    With a control, cancellation and the time budget are checked for every
+    streamed token.
+    """
+
+    def on_token(token: str):
+        if control is not None:
+            control.check()
+        if progress is not None:
+            progress.append(token)
+
+    cache = llm_cache() if LLM_CACHE_ENABLED else None
+    key = completion_key(cache, MODEL, messages) if cache is not None else ""
+    text = cache.get(key) if cache is not None else None
+    if text is not None:
+        if progress is not None:
+            progress.append(text)
+        return text
+    text = stream_completion(messages, on_token)
+    if cache is not None and text:
+        cache.put(key, text)
+    return text
+
+
+def run(
+    city: str,
+    start_date: str,
+    end_date: str,
+    trip: Trip | None = None,
+    progress: Progress | None = None,
+    control: TaskControl | None = None,
+    timeout: float = 60.0,
+) -> str:
+    """Plans a trip with one LLM call instead of the multi agent crew
+
+    The weather statistics and the attraction categories are computed in
+    code, the LLM only writes the final itinerary.
+
+    Args:
+        trip (Trip | None): prefetch of the same trip to take the data from
+        progress (Progress | None): receives the stages and the partial
+            output, the itinerary is then streamed token by token
+        control (TaskControl | None): checked between the steps
+
+    Raises:
+        TaskAborted: the task was cancelled or went over its time budget
+    """
+    remaining = control.remaining() if control is not None else None
+    if remaining is not None:
+        timeout = min(timeout, remaining)
+    try:
+        if trip is not None:
+            data = trip.data.result(timeout=timeout)
+        else:
+            data = aio.run(fetch(city, start_date, end_date, progress), timeout=timeout)
+    except TimeoutError:
+        # report a fetch cut short by the budget as a timeout of the task
+        if control is not None:
+            control.check()
+        raise
+    if control is not None:
+        control.check()
+
+    days: list[DailyWeather] | None = data.weather
+    found = data.attractions
+    if days is None or found is None:
+        # whatever failed during the prefetch is fetched once more, errors
+        # are raised like the tools would
+        latitude, longitude = geocoder.get(city)
+        if days is None:
+            days = weather_store.daily(
+                latitude,
+                longitude,
+                datetime.date.fromisoformat(start_date),
+                datetime.date.fromisoformat(end_date),
+            )
+        if found is None:
+            found = aio.run(attraction_store.aget_many(latitude, longitude, KINDS))
+
+    summary = summarize(days)
+    if control is not None:
+        control.check()
+    if progress is not None:
+        progress.stage("weather_summarized")
+        weather = json.dumps(summary, indent=2)
+        progress.append(f"## Weather\n\n```json\n{weather}\n```\n\n")
+        progress.flush()
+    attractions = pick_attractions(choose_kinds(summary), found)
+    prompt = USER_PROMPT.format(
+        city=city,
+        start_date=start_date,
+        end_date=end_date,
+        weather=json.dumps(summary),
+        attractions=json.dumps(attractions),
+    )
+    text = complete(
+        [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        progress,
+        control,
+    )
+    if progress is not None:
+        progress.flush()
+    return text
@@ -0,0 +1,113 @@
+import functools
+import hashlib
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import msgspec
+
+from common.kvstore import SqliteStore
+
+# sampling settings that change the completion, read from the LLM object
+SAMPLING_PARAMS = ["temperature", "top_p", "max_tokens", "stop", "seed"]
+
+
+def _normalize(messages: str | list[dict[str, Any]]) -> list[dict[str, Any]]:
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    normalized = []
+    for message in messages:
+        message = dict(message)
+        content = message.get("content")
+        if isinstance(content, str):
+            # whitespace differences from prompt templates do not change the answer
+            message["content"] = " ".join(content.split())
+        normalized.append(message)
+    return normalized
+
+
+class LLMCache:
+    """Persistent cache of LLM completions
+
+    Completions are keyed by the model, the normalized messages (which
+    carry the tool results of earlier turns), the tool definitions and the
+    sampling settings. They are kept in a sqlite store whose least recently
+    used entries are evicted past max_bytes.
+    """
+
+    def __init__(self, store_path: str | Path, max_bytes: int | None = None):
+        self._store = SqliteStore(store_path, "llm", max_bytes=max_bytes)
+        self._encoder = msgspec.json.Encoder(order="sorted")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(
+        self,
+        model: str,
+        messages: str | list[dict[str, Any]],
+        tools: list[dict[str, Any]] | None,
+        params: dict[str, Any],
+    ) -> str:
+        raw = self._encoder.encode([model, _normalize(messages), tools, params])
+        return hashlib.sha256(raw).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        raw = self._store.get(key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if raw is None else raw.decode()
+
+    def put(self, key: str, completion: str):
+        self._store.put(key, completion.encode())
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **self._store.stats(),
+        }
+
+
+def completion_key(
+    cache: LLMCache,
+    llm: Any,
+    messages: str | list[dict[str, Any]],
+    tools: list[dict[str, Any]] | None = None,
+) -> str:
+    """Cache key of a completion of messages by llm with its current settings"""
+    params = {name: getattr(llm, name, None) for name in SAMPLING_PARAMS}
+    return cache.key(llm.model, messages, tools, params)
+
+
+def cache_llm(llm: Any, cache: LLMCache) -> Any:
+    """Routes the text completions of llm through cache, returns llm
+
+    Only the instance's call is replaced, so the object keeps the type the
+    agents expect. Completions that are not text, e.g. tool calls, are
+    never cached.
+    """
+    call: Callable[..., Any] = llm.call
+
+    @functools.wraps(call)
+    def cached_call(messages, tools=None, *args, **kwargs):
+        key = completion_key(cache, llm, messages, tools)
+        completion = cache.get(key)
+        if completion is not None:
+            return completion
+        result = call(messages, tools, *args, **kwargs)
+        if isinstance(result, str) and result:
+            cache.put(key, result)
+        return result
+
+    # bypasses attribute validation on pydantic based LLM classes
+    object.__setattr__(llm, "call", cached_call)
+    return llm
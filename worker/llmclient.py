@@ -0,0 +1,71 @@
+import functools
+import json
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple
+
+import httpx2
+from appconfig import config
+from llmcache import LLMCache
+
+# Ollama settings and clients shared by the crew and the lean pipeline,
+# without importing crewai.
+
+OLLAMA_HOST = config.ollama_host
+OLLAMA_PORT = config.ollama_port
+OLLAMA_LLM = config.ollama_llm
+LLM_CACHE_ENABLED = config.llm_cache_enabled
+LLM_TEMPERATURE = 0.1
+LLM_TIMEOUT_SECONDS = 120
+
+
+class ModelSettings(NamedTuple):
+    """Model and sampling settings, as read by llmcache.completion_key"""
+
+    model: str
+    temperature: float
+
+
+MODEL = ModelSettings(model=OLLAMA_LLM, temperature=LLM_TEMPERATURE)
+
+
+@functools.cache
+def llm_cache() -> LLMCache:
+    return LLMCache(
+        Path(config.cache_dir) / "llm.sqlite", max_bytes=config.llm_cache_max_bytes
+    )
+
+
+@functools.cache
+def ollama_client() -> httpx2.Client:
+    return httpx2.Client(
+        base_url=f"http://{OLLAMA_HOST}:{OLLAMA_PORT}/v1",
+        timeout=httpx2.Timeout(10, read=LLM_TIMEOUT_SECONDS),
+    )
+
+
+def stream_completion(
+    messages: list[dict[str, str]], on_token: Callable[[str], None]
+) -> str:
+    """Streams a chat completion from Ollama, passing each token to on_token"""
+    parts = []
+    body = {
+        "model": MODEL.model,
+        "messages": messages,
+        "temperature": MODEL.temperature,
+        "stream": True,
+    }
+    with ollama_client().stream("POST", "/chat/completions", json=body) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line.removeprefix("data:").strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            token = choices[0].get("delta", {}).get("content")
+            if token:
+                parts.append(token)
+                on_token(token)
+    return "".join(parts)
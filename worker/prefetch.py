@@ -0,0 +1,132 @@
+import asyncio
+import datetime
+import threading
+from collections.abc import Iterator
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import aio
+from attractions import KINDS
+from progress import Progress
+from stores import attraction_store, geocoder, weather_store
+from weather import DailyWeather
+
+
+class Prefetched(NamedTuple):
+    weather: list[DailyWeather] | None
+    attractions: dict[str, object] | None
+
+
+class Trip(NamedTuple):
+    city: str
+    start_date: str
+    end_date: str
+    data: "Future[Prefetched]"
+
+
+# trips whose data is being fetched or ready, by normalized city
+_trips: dict[str, list[Trip]] = {}
+_trips_lock = threading.Lock()
+
+
+def _city_key(city: str) -> str:
+    return " ".join(city.split()).casefold()
+
+
+async def fetch(
+    city: str, start_date: str, end_date: str, progress: Progress | None = None
+) -> Prefetched:
+    """Geocodes the city, then fetches its weather and attractions concurrently"""
+    latitude, longitude = await geocoder.aget(city)
+    if progress is not None:
+        progress.stage("geocoded")
+
+    async def weather() -> list[DailyWeather]:
+        # the archive client is blocking, it runs on a thread next to the
+        # attraction requests
+        days = await asyncio.to_thread(
+            weather_store.daily,
+            latitude,
+            longitude,
+            datetime.date.fromisoformat(start_date),
+            datetime.date.fromisoformat(end_date),
+        )
+        if progress is not None:
+            progress.stage("weather_ready")
+        return days
+
+    async def attractions() -> dict[str, object]:
+        found = await attraction_store.aget_many(latitude, longitude, KINDS)
+        if progress is not None:
+            progress.stage("attractions_ready")
+        return found
+
+    days, found = await asyncio.gather(weather(), attractions(), return_exceptions=True)
+    return Prefetched(
+        weather=None if isinstance(days, BaseException) else days,
+        attractions=None if isinstance(found, BaseException) else found,
+    )
+
+
+@contextmanager
+def prefetch(
+    city: str, start_date: str, end_date: str, progress: Progress | None = None
+) -> Iterator[Trip]:
+    """Starts fetching the tool data of a trip and serves it to the tools
+
+    Geocoding, weather and attraction requests run on the background loop
+    while the crew is built and the first LLM turn runs. Tool calls for the
+    same trip inside the block wait for this data instead of going out
+    again; anything that failed is fetched by the tool as usual. Each
+    finished fetch is reported as a stage of the task.
+    """
+    data = asyncio.run_coroutine_threadsafe(
+        fetch(city, start_date, end_date, progress), aio.event_loop()
+    )
+    trip = Trip(city, start_date, end_date, data)
+    key = _city_key(city)
+    with _trips_lock:
+        _trips.setdefault(key, []).append(trip)
+    try:
+        yield trip
+    finally:
+        with _trips_lock:
+            trips = _trips[key]
+            trips.remove(trip)
+            if not trips:
+                del _trips[key]
+        data.cancel()
+
+
+def _find(
+    city: str, timeout: float, dates: tuple[str, str] | None = None
+) -> Prefetched | None:
+    with _trips_lock:
+        trips = [
+            trip
+            for trip in _trips.get(_city_key(city), [])
+            if dates is None or (trip.start_date, trip.end_date) == dates
+        ]
+    if not trips:
+        return None
+    try:
+        return trips[-1].data.result(timeout=timeout)
+    except Exception:
+        return None
+
+
+def weather(
+    city: str, start_date: str, end_date: str, timeout: float = 30.0
+) -> list[DailyWeather] | None:
+    """Prefetched weather of a trip in progress, None when there is none"""
+    found = _find(city, timeout, (start_date, end_date))
+    return None if found is None else found.weather
+
+
+def attractions(city: str, kinds: str, timeout: float = 30.0) -> object | None:
+    """Prefetched attractions of one kind, None when there are none"""
+    found = _find(city, timeout)
+    if found is None or found.attractions is None:
+        return None
+    return found.attractions.get(kinds)
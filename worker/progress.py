@@ -0,0 +1,72 @@
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from statewriter import StateWriter
+
+
+class Progress:
+    """Reports the stages of one task and publishes its partial output
+
+    Stages are written next to the task state without waiting for the
+    database. Partial output is appended in memory and uploaded as a whole
+    object, at most every flush_seconds, so the backend can serve what was
+    written so far while the task runs.
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        writer: StateWriter,
+        upload: Callable[[str], bool],
+        flush_seconds: float = 1.0,
+    ):
+        self.task_id = task_id
+        self.writer = writer
+        self.upload = upload
+        self.flush_seconds = flush_seconds
+        self._stages: set[str] = set()
+        self._parts: list[str] = []
+        self._flushed_at = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def stage(self, name: str):
+        """Records that the task reached a stage, once per stage"""
+        with self._lock:
+            if name in self._stages:
+                return
+            self._stages.add(name)
+        self.writer.stage(self.task_id, name)
+
+    def reached(self, name: str) -> bool:
+        with self._lock:
+            return name in self._stages
+
+    def append(self, text: str):
+        with self._lock:
+            self._parts.append(text)
+            self._dirty = True
+            due = time.monotonic() - self._flushed_at >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            text = "".join(self._parts)
+            self._dirty = False
+            self._flushed_at = time.monotonic()
+        if not self.upload(text):
+            print(f" [!] could not upload partial output of {self.task_id}")
+
+    def on_task_output(self, output: Any):
+        """Crew task callback, the crew runs the weather task first"""
+        if not self.reached("weather_summarized"):
+            self.stage("weather_summarized")
+            self.append(f"## Weather\n\n{output.raw}\n\n## Attractions\n\n")
+        else:
+            self.append(f"{output.raw}\n")
+        self.flush()
@@ -1,22 +1,22 @@
-import datetime
-import io
+import contextlib
+import functools
 import os
+import signal
 import sys
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, NamedTuple
 from unittest.mock import Mock
 
 import boto3
 import msgspec
 import pika
-import psycopg
 from botocore.client import Config
 from botocore.exceptions import ClientError
-from crewai import LLM, Agent, Crew, Task
-from crewai.agents.agent_builder.base_agent import BaseAgent
-from crewai.project import CrewBase, agent, crew, task
 from pika.adapters.blocking_connection import BlockingChannel
 from pika.spec import Basic, BasicProperties
-from types_boto3_s3.client import S3Client
 
 if str(Path(__file__).parent) not in sys.path:
     sys.path.append(str(Path(__file__).parent))
@@ -24,7 +24,22 @@ if str(Path(__file__).parent.parent) not in sys.path:
     sys.path.append(str(Path(__file__).parent.parent))
 
 from appconfig import config
-from tools import AttractionTool, WeatherTool
+from common.queues import parse_tenants, task_queues
+from control import CancelWatcher, TaskAborted, TaskControl
+from progress import Progress
+from retry import (
+    ATTEMPTS_HEADER,
+    REASON_HEADER,
+    TRANSIENT_ERRORS,
+    RetryPolicy,
+    describe,
+)
+from scheduler import FairScheduler, parse_weights
+from statewriter import StateWriter
+
+if TYPE_CHECKING:
+    from crewai import Crew
+    from types_boto3_s3.client import S3Client
 
 USE_MOCK = config.use_mock
 POSTGRES_HOST = config.postgres_host
@@ -32,95 +47,38 @@ POSTGRES_USER = config.postgres_user
 POSTGRES_PASS = config.postgres_pass
 POSTGRES_DB = config.postgres_db
 POSTGRES_PORT = config.postgres_port
+DB_POOL_MAX_SIZE = config.db_pool_max_size
+STATE_BATCH_SIZE = config.state_batch_size
 
 RABBITMQ_USER = config.rabbitmq_user
 RABBITMQ_PASS = config.rabbitmq_pass
 RABBITMQ_HOST = config.rabbitmq_host
 RABBITMQ_PORT = config.rabbitmq_port
 RABBITMQ_QUEUE = config.rabbitmq_queue
+RABBITMQ_HEARTBEAT = config.rabbitmq_heartbeat
+WORKER_CONCURRENCY = config.worker_concurrency
+PREFETCH_COUNT = (
+    config.prefetch_count or WORKER_CONCURRENCY * config.scheduling_lookahead
+)
+RABBITMQ_MAX_PRIORITY = config.rabbitmq_max_priority
+TENANT_WEIGHTS = parse_weights(config.tenant_weights)
+# the shared queue first, then one per tenant listed in tenant_queues
+TASK_QUEUES = task_queues(RABBITMQ_QUEUE, parse_tenants(config.tenant_queues))
+TASK_MAX_ATTEMPTS = config.task_max_attempts
+RETRY_BASE_DELAY_SECONDS = config.retry_base_delay_seconds
+RETRY_MAX_DELAY_SECONDS = config.retry_max_delay_seconds
+PREFETCH_TOOL_DATA = config.prefetch_tool_data
+PIPELINE = config.pipeline
+LLM_CACHE_ENABLED = config.llm_cache_enabled
+PARTIAL_FLUSH_SECONDS = config.partial_flush_seconds
+TASK_TIME_BUDGET_SECONDS = config.task_time_budget_seconds
 
 RUSTFS_HOST = config.rustfs_host
 RUSTFS_PORT = config.rustfs_port
 RUSTFS_ACCESS_KEY = config.rustfs_access_key
 RUSTFS_SECRET_KEY = config.rustfs_secret_key
 RUSTFS_BUCKET = config.rustfs_bucket
-
-OLLAMA_HOST = config.ollama_host
-OLLAMA_PORT = config.ollama_port
-OLLAMA_LLM = config.ollama_llm
-PHOENIX_COLLECTOR_ENDPOINT = config.phoenix_collector_endpoint
-
-# tracer_provider = register(
-#     endpoint=PHOENIX_COLLECTOR_ENDPOINT,
-#     project_name="crewai-tracing",
-#     auto_instrument=True,
-#     protocol="http/protobuf",
-#     batch=True,
-# )
-
-
-@CrewBase
-class MultiAgentCrew:
-    agents: list[BaseAgent]
-    tasks: list[Task]
-
-    agents_config: str = "config/agents.yaml"
-    tasks_config: str = "config/task.yaml"
-
-    @agent
-    def weather_agent(self) -> Agent:
-        llm = LLM(
-            provider="ollama",
-            model=f"{OLLAMA_LLM}",
-            base_url=f"http://{OLLAMA_HOST}:{OLLAMA_PORT}/v1/",
-            api_key="ollama",
-            timeout=120,
-            temperature=0.1,
-        )
-        return Agent(
-            config=self.agents_config["weather"],  # type: ignore[index]
-            llm=llm,
-            allow_delegation=True,
-            max_iter=5,
-        )
-
-    @agent
-    def attractions_agent(self) -> Agent:
-        llm = LLM(
-            provider="ollama",
-            model=f"{OLLAMA_LLM}",
-            base_url=f"http://{OLLAMA_HOST}:{OLLAMA_PORT}/v1/",
-            api_key="ollama",
-            timeout=120,
-            temperature=0.1,
-        )
-        return Agent(
-            config=self.agents_config["trip"],  # type: ignore[index]
-            llm=llm,
-            allow_delegation=True,
-            max_iter=5,
-        )
-
-    @task
-    def weather_task(self) -> Task:
-        return Task(
-            config=self.tasks_config["weather_task"],  # type: ignore[index]
-            agent=self.weather_agent(),
-            tools=[WeatherTool()],
-        )
-
-    @task
-    def attraction_task(self) -> Task:
-        return Task(
-            config=self.tasks_config["attraction_task"],  # type: ignore[index]
-            agent=self.attractions_agent(),
-            tools=[AttractionTool()],
-            context=[self.weather_task()],
-        )
-
-    @crew
-    def crew(self) -> Crew:
-        return Crew(agents=self.agents, tasks=self.tasks, verbose=True)
+S3_MAX_ATTEMPTS = config.s3_max_attempts
 
 
 class Payload(msgspec.Struct):
@@ -128,9 +86,34 @@ class Payload(msgspec.Struct):
     city: str
     start_date: str
     end_date: str
+    # "crew" or "lean", the worker's PIPELINE setting when not given
+    pipeline: str | None = None
+    priority: int = 0
+    tenant: str = "default"
 
 
-def create_crew_yaml(mock: bool) -> Crew:
+class TaskRef(msgspec.Struct):
+    task_id: str
+
+
+class Delivery(NamedTuple):
+    data: Payload | None
+    tag: int
+    body: bytes
+    properties: BasicProperties
+    # 1 for the first delivery of the task
+    attempt: int
+    # the task queue the message came from, retries go back to it
+    queue: str
+
+
+class Outcome(NamedTuple):
+    # "ack", "retry" or "dead_letter"
+    action: str
+    reason: str | None = None
+
+
+def create_crew_yaml(mock: bool) -> "Crew":
 
     if mock:
         crew_mock = Mock()
@@ -140,32 +123,56 @@ def create_crew_yaml(mock: bool) -> Crew:
         return crew_mock
 
     else:
-        return MultiAgentCrew().crew()
+        # crewai and the tool dependencies are only imported once a real
+        # crew is needed, so the consumer starts without loading them
+        from crew import new_crew
+
+        return new_crew()
 
 
-def update_db(id: str, state: str):
+@functools.cache
+def state_writer() -> StateWriter:
+    """Returns the worker's task state writer, started on first use"""
+    writer = StateWriter(
+        f"postgresql://{POSTGRES_USER}:{POSTGRES_PASS}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}",
+        min_size=1,
+        max_size=DB_POOL_MAX_SIZE,
+        batch_size=STATE_BATCH_SIZE,
+    )
+    writer.start()
+    return writer
+
+
+def update_db(id: str, state: str, error: str | None = None) -> bool:
     """Updates database with given state at task id
 
+    The write goes through the shared state writer, which batches the
+    transitions of concurrent tasks into one prepared UPDATE on a pooled
+    connection. Returns once the state is committed, False when the task
+    had already reached a terminal state, e.g. was cancelled.
+
+    A trigger on the tasks table sends a NOTIFY for every state change,
+    which the backend fans out to clients following the task's events.
+
     Args:
         id (str): id string for the task
         state (str): state to update
+        error (str | None): failure reason stored with the state
     """
-    with psycopg.connect(
+    return state_writer().write(id, state, error=error)
+
+
+@functools.cache
+def cancel_watcher() -> CancelWatcher:
+    """Returns the worker's cancellation listener, started on first use"""
+    watcher = CancelWatcher(
         f"postgresql://{POSTGRES_USER}:{POSTGRES_PASS}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
-    ) as conn, conn.cursor() as cursor:
-        data = {
-            "state": state,
-            "updated_at": datetime.datetime.now(),
-            "task_id": id,
-        }
-        cursor.execute(
-            """Update tasks set state = %(state)s, updated_at = %(updated_at)s  where id = %(task_id)s""",
-            data,
-        )
-        conn.commit()
+    )
+    watcher.start()
+    return watcher
 
 
-def bucket_exists(s3_client: S3Client, bucket_name: str):
+def bucket_exists(s3_client: "S3Client", bucket_name: str):
     try:
         s3_client.head_bucket(Bucket=bucket_name)
         print(f"Bucket '{bucket_name}' exists.")
@@ -181,104 +188,468 @@ def bucket_exists(s3_client: S3Client, bucket_name: str):
         return False
 
 
-def upload_text_to_rustfs(client: S3Client, bucket: str, key: str, text_content: str):
+@functools.cache
+def s3_client() -> "S3Client":
+    """Returns the worker's S3 client, created on first use
+
+    boto3 clients are thread safe, so all execution slots share this one and
+    its connection pool. Throttling, 5xx responses and connection errors are
+    retried by botocore with exponential backoff.
+    """
+    RUSTFS_ENDPOINT = f"http://{RUSTFS_HOST}:{RUSTFS_PORT}"
+    return boto3.client(
+        "s3",
+        endpoint_url=RUSTFS_ENDPOINT,
+        aws_access_key_id=RUSTFS_ACCESS_KEY,
+        aws_secret_access_key=RUSTFS_SECRET_KEY,
+        config=Config(
+            signature_version="s3v4",
+            max_pool_connections=max(WORKER_CONCURRENCY, 10),
+            retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "standard"},
+        ),
+    )
+
+
+# buckets known to exist, so the existence check runs once per process
+_known_buckets: set[str] = set()
+_buckets_lock = threading.Lock()
+
+
+def ensure_bucket(client: "S3Client", bucket: str, recheck: bool = False):
+    """Creates the bucket unless it was already confirmed to exist
+
+    Args:
+        client (s3client): boto3 client
+        bucket (str): name of the bucket
+        recheck (bool): ignore the cached result, e.g. after a NoSuchBucket error
+    """
+    with _buckets_lock:
+        if bucket in _known_buckets and not recheck:
+            return
+        if not bucket_exists(client, bucket):
+            try:
+                client.create_bucket(Bucket=bucket)
+                print(f"Bucket '{bucket}' created successfully.")
+            except ClientError as e:
+                # another worker created it in between
+                if e.response["Error"]["Code"] not in (
+                    "BucketAlreadyOwnedByYou",
+                    "BucketAlreadyExists",
+                ):
+                    raise
+        _known_buckets.add(bucket)
+
+
+def upload_text_to_rustfs(client: "S3Client", bucket: str, key: str, text_content: str):
     """
-    Connects to RustFS, ensures a bucket exists, and uploads text content as an object.
+    Uploads text content as an object, creating the bucket on first use.
 
     Args:
         client (s3client): boto3 client
         bucket (str): Name of the bucket to upload to.
         key (str): Name of the object (file) in the bucket.
         text_content (str): The string content to upload.
+
+    Returns:
+        bool: whether the object was uploaded
     """
-    # --- 1. Ensure Bucket Exists ---
     try:
-        found = bucket_exists(client, bucket)
-        if not found:
-            client.create_bucket(Bucket=bucket)
-            print(f"Bucket '{bucket}' created successfully.")
-        else:
-            print(f"Bucket '{bucket}' already exists.")
+        ensure_bucket(client, bucket)
     except Exception as e:
         print(f"An unexpected error occurred during bucket handling: {e}")
-        return
+        return False
 
-    # --- 2. Prepare Data for Upload ---
-    # Convert the string content to bytes and get its length.
-    # put_object requires a file-like object (stream) and the data length.
+    # put_object accepts the bytes directly, no stream is needed
+    body = text_content.encode("utf-8")
+    for recheck in (False, True):
+        try:
+            if recheck:
+                ensure_bucket(client, bucket, recheck=True)
+            client.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=body,
+                ContentType="text/plain",  # Set the content type explicitly
+            )
+            print(f"Successfully uploaded '{key}' to bucket '{bucket}'. ")
+            return True
+        except ClientError as e:
+            # the bucket was removed since it was cached, create it again once
+            if e.response["Error"]["Code"] == "NoSuchBucket" and not recheck:
+                continue
+            print(f"An unexpected error occurred during upload: {e}")
+            return False
+        except Exception as e:
+            print(f"An unexpected error occurred during upload: {e}")
+            return False
+    return False
+
+
+def delete_from_rustfs(client: "S3Client", bucket: str, key: str) -> bool:
+    """Deletes an object, a missing one counts as deleted
+
+    Returns:
+        bool: whether the object is gone
+    """
     try:
-        text_bytes = text_content.encode("utf-8")
-        text_stream = io.BytesIO(text_bytes)
+        client.delete_object(Bucket=bucket, Key=key)
+        return True
     except Exception as e:
-        print(f"Error preparing data for upload: {e}")
-        return
+        print(f"An unexpected error occurred during delete: {e}")
+        return False
 
-    # --- 3. Upload the Object ---
-    try:
-        client.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body=text_stream,
-            ContentType="text/plain",  # Set the content type explicitly
+
+def partial_key(task_id: str) -> str:
+    return f"{task_id}.partial.txt"
+
+
+class UploadError(Exception):
+    """Raised when the crew output could not be stored in RustFS"""
+
+
+def run_pipeline(data: Payload, control: TaskControl) -> str:
+    """Plans one trip with the requested pipeline and returns the itinerary"""
+    task_id = data.task_id
+    pipeline = data.pipeline or PIPELINE
+    progress = None
+    if not USE_MOCK:
+        # stages go to the tasks table, partial output next to the final object
+        progress = Progress(
+            task_id,
+            state_writer(),
+            functools.partial(
+                upload_text_to_rustfs, s3_client(), RUSTFS_BUCKET, partial_key(task_id)
+            ),
+            flush_seconds=PARTIAL_FLUSH_SECONDS,
         )
-        print(f"Successfully uploaded '{key}' to bucket '{bucket}'. ")
+    with contextlib.ExitStack() as stack:
+        trip = None
+        if PREFETCH_TOOL_DATA and not USE_MOCK:
+            from prefetch import prefetch
+
+            # the tool data is fetched while the crew is built and starts
+            trip = stack.enter_context(
+                prefetch(data.city, data.start_date, data.end_date, progress)
+            )
+        if pipeline == "lean" and not USE_MOCK:
+            import lean
+
+            return lean.run(
+                data.city,
+                data.start_date,
+                data.end_date,
+                trip=trip,
+                progress=progress,
+                control=control,
+            )
+
+        crew = create_crew_yaml(USE_MOCK)
+        if progress is not None:
+            crew.task_callback = progress.on_task_output
+        # cancellation and the time budget are checked after every agent step
+        crew.step_callback = control.step_callback
+        return crew.kickoff(
+            inputs={
+                "city": data.city,
+                "start_date": data.start_date,
+                "end_date": data.end_date,
+            }
+        ).raw
+
+
+def expire(control: TaskControl):
+    # records the timeout on time even while a step is stuck, the task's
+    # thread stops at its next check
+    if control.abort("timeout"):
+        print(f" [!] task {control.task_id} went over its time budget")
+        update_db(control.task_id, "timeout")
+
+
+def process_message(data: Payload):
+    """Plans one trip and stores its output
+
+    Runs on a pool thread, the consumer thread only dispatches messages and
+    acknowledges them once this returns. Tasks that were cancelled while
+    queued are skipped.
+
+    Raises:
+        TaskAborted: the task was cancelled or went over its time budget
+    """
+    task_id = data.task_id
+
+    control = TaskControl(task_id, TASK_TIME_BUDGET_SECONDS)
+    watcher = cancel_watcher()
+    # registered before the task is marked running, a cancel committed in
+    # between would otherwise reach neither the state write nor the watcher
+    watcher.register(control)
+    timer = None
+    started = False
+    try:
+        if not update_db(task_id, "running"):
+            print(f" [x] skipping task {task_id}, it is already finished or cancelled")
+            return
+        started = True
+
+        if control.deadline is not None:
+            timer = threading.Timer(TASK_TIME_BUDGET_SECONDS, expire, args=(control,))
+            timer.daemon = True
+            timer.start()
+        text = run_pipeline(data, control)
+        control.check()
+        if not upload_text_to_rustfs(
+            s3_client(), RUSTFS_BUCKET, f"{task_id}.txt", text
+        ):
+            raise UploadError(f"Could not upload output of task {task_id}")
+        print(" [x] finished processing")
+        if LLM_CACHE_ENABLED and not USE_MOCK:
+            from llmclient import llm_cache
+
+            print(f" [x] llm cache {llm_cache().stats()}")
+        update_db(task_id, "done")
+    except TaskAborted as e:
+        if e.state == "timeout":
+            update_db(task_id, "timeout")
+        print(f" [!] aborted task {task_id}: {e.state}")
+        raise
+    finally:
+        watcher.unregister(control)
+        if timer is not None:
+            timer.cancel()
+        if started:
+            # the partial output only serves readers while the task runs,
+            # a retry writes its own
+            delete_from_rustfs(s3_client(), RUSTFS_BUCKET, partial_key(task_id))
+
+
+def run_task(data: Payload, attempt: int, policy: RetryPolicy) -> Outcome:
+    """Runs process_message and records a failure with the task
+
+    A task that failed with a transient error and has attempts left goes
+    back to submitted until its retry, any other failure is final. Both
+    store the reason in the task's error column.
+    """
+    try:
+        process_message(data)
+    except TaskAborted:
+        # cancelled or timed out, process_message recorded it already
+        return Outcome("ack")
     except Exception as e:
-        print(f"An unexpected error occurred during upload: {e}")
+        reason = describe(e)
+        retry = policy.should_retry(e, attempt)
+        print(f" [!] task {data.task_id} failed on attempt {attempt}: {reason}")
+        state = "submitted" if retry else "failed"
+        if not update_db(data.task_id, state, error=reason):
+            # the task was cancelled meanwhile
+            return Outcome("ack")
+        return Outcome("retry" if retry else "dead_letter", reason)
+    return Outcome("ack")
+
+
+def forward(ch: BlockingChannel, delivery: Delivery, queue: str, reason: str | None):
+    """Publishes a delivery's message to queue, counting the attempt it had"""
+    headers = dict(delivery.properties.headers or {})
+    headers[ATTEMPTS_HEADER] = delivery.attempt
+    if reason is not None:
+        headers[REASON_HEADER] = reason
+    ch.basic_publish(
+        exchange="",
+        routing_key=queue,
+        body=delivery.body,
+        properties=BasicProperties(
+            headers=headers, priority=delivery.properties.priority
+        ),
+    )
 
 
-def main():
+def main(load: Any = None):
+    """Consumes trip messages until interrupted or, after SIGTERM, drained
+
+    On SIGTERM the worker stops taking messages, returns the ones it
+    buffered to the queue and exits once its running tasks are done.
+
+    Args:
+        load: optional shared array the supervisor reads, set to the number
+            of running and of buffered tasks
+    """
+    # the clients and the bucket are set up once, before any message arrives
+    ensure_bucket(s3_client(), RUSTFS_BUCKET)
+    writer = state_writer()
+    watcher = cancel_watcher()
+
     creds = pika.PlainCredentials(username=RABBITMQ_USER, password=RABBITMQ_PASS)
     connection_params = pika.ConnectionParameters(
-        host=RABBITMQ_HOST, port=RABBITMQ_PORT, credentials=creds
+        host=RABBITMQ_HOST,
+        port=RABBITMQ_PORT,
+        credentials=creds,
+        heartbeat=RABBITMQ_HEARTBEAT,
     )
     connection = pika.BlockingConnection(connection_params)
     channel = connection.channel()
+    # retried and dead messages are acked only once the broker has them
+    channel.confirm_delivery()
 
-    channel.queue_declare(queue=RABBITMQ_QUEUE)
+    # must match the backend's declaration, the broker rejects a
+    # redeclaration with different arguments
+    arguments = (
+        {"x-max-priority": RABBITMQ_MAX_PRIORITY} if RABBITMQ_MAX_PRIORITY > 0 else None
+    )
+    policies = {}
+    for queue in TASK_QUEUES:
+        channel.queue_declare(queue=queue, arguments=arguments)
+        policies[queue] = RetryPolicy(
+            queue,
+            max_attempts=TASK_MAX_ATTEMPTS,
+            base_delay=RETRY_BASE_DELAY_SECONDS,
+            max_delay=RETRY_MAX_DELAY_SECONDS,
+            transient=(*TRANSIENT_ERRORS, UploadError),
+        )
+        policies[queue].declare(channel)
+    # unacknowledged deliveries are bounded by the prefetch count of each
+    # consumer, so at most that many trips per task queue are buffered or
+    # running in this process. Buffering more than there are slots lets the
+    # scheduler pick among tenants, and a tenant with a queue of its own
+    # fills only its consumer's window however deep its backlog is.
+    channel.basic_qos(prefetch_count=PREFETCH_COUNT)
     decoder = msgspec.msgpack.Decoder(type=Payload)
+    ref_decoder = msgspec.msgpack.Decoder(type=TaskRef)
+    executor = ThreadPoolExecutor(
+        max_workers=WORKER_CONCURRENCY, thread_name_prefix="crew"
+    )
+    # deliveries waiting for a free slot, only touched on the consumer thread
+    scheduler: FairScheduler[Delivery] = FairScheduler(TENANT_WEIGHTS)
+    running = 0
+    draining = False
+
+    def report():
+        if load is not None:
+            load[0] = running
+            load[1] = len(scheduler)
+
+    def dispatch(ch: BlockingChannel):
+        nonlocal running
+        while running < WORKER_CONCURRENCY and scheduler and not draining:
+            delivery: Delivery = scheduler.pop()  # type: ignore[assignment]
+            running += 1
+            future = executor.submit(
+                run_task, delivery.data, delivery.attempt, policies[delivery.queue]
+            )
+            future.add_done_callback(
+                lambda f, delivery=delivery: connection.add_callback_threadsafe(
+                    functools.partial(on_done, ch, delivery, f)
+                )
+            )
+        report()
+
+    def settle(ch: BlockingChannel, delivery: Delivery, outcome: Outcome):
+        # a retry or dead letter is published before the original is acked,
+        # a crash in between delivers the task twice rather than never
+        policy = policies[delivery.queue]
+        try:
+            if outcome.action == "retry":
+                queue = policy.delay_queue(delivery.attempt + 1)
+                forward(ch, delivery, queue, outcome.reason)
+                print(f" [x] retrying task through {queue}")
+            elif outcome.action == "dead_letter":
+                forward(ch, delivery, policy.dead_letter_queue, outcome.reason)
+        except pika.exceptions.AMQPError as e:
+            print(f" [!] could not forward message, requeueing it: {e!r}")
+            ch.basic_nack(delivery_tag=delivery.tag, requeue=True)
+            return
+        ch.basic_ack(delivery_tag=delivery.tag)
+
+    def on_done(ch: BlockingChannel, delivery: Delivery, future: Future[Outcome]):
+        # runs on the consumer thread through add_callback_threadsafe,
+        # pika channels must not be used from the pool threads
+        nonlocal running
+        running -= 1
+        try:
+            outcome = future.result()
+        except Exception as e:
+            # not even the failure could be recorded, e.g. the database is down
+            retry = policies[delivery.queue].should_retry(e, delivery.attempt)
+            outcome = Outcome("retry" if retry else "dead_letter", describe(e))
+        settle(ch, delivery, outcome)
+        if draining and running == 0:
+            ch.stop_consuming()
+        dispatch(ch)
+
+    def drain():
+        nonlocal draining
+        if draining:
+            return
+        draining = True
+        print(f" [*] draining, waiting for {running} running tasks")
+        # pika nacks deliveries that are still on their way to the callback
+        for consumer_tag in consumer_tags:
+            channel.basic_cancel(consumer_tag)
+        while scheduler:
+            delivery: Delivery = scheduler.pop()  # type: ignore[assignment]
+            channel.basic_nack(delivery_tag=delivery.tag, requeue=True)
+        report()
+        if running == 0:
+            channel.stop_consuming()
 
     def callback(
+        queue: str,
         ch: BlockingChannel,
         method: Basic.Deliver,
         properties: BasicProperties,
         body: bytes,
     ):
         print(f" [x] Received {body}")
+        if draining:
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
 
-        data_decoded = decoder.decode(body)
-
-        task_id = data_decoded.task_id
-        city = data_decoded.city
-        start_date = data_decoded.start_date
-        end_date = data_decoded.end_date
-
-        update_db(task_id, "running")
-
-        crew = create_crew_yaml(USE_MOCK)
-        output = crew.kickoff(
-            inputs={"city": city, "start_date": start_date, "end_date": end_date}
+        attempt = RetryPolicy.attempts(properties.headers) + 1
+        try:
+            data_decoded = decoder.decode(body)
+        except msgspec.DecodeError as e:
+            reason = describe(e)
+            print(f" [!] dead lettering undecodable message: {reason}")
+            with contextlib.suppress(msgspec.DecodeError, ValueError):
+                # fails the task when at least its id can be read, an id that
+                # is not a UUID cannot belong to a task
+                task_id = str(uuid.UUID(ref_decoder.decode(body).task_id))
+                state_writer().submit(task_id, "failed", error=reason)
+            delivery = Delivery(
+                None, method.delivery_tag, body, properties, attempt, queue
+            )
+            settle(ch, delivery, Outcome("dead_letter", reason))
+            return
+
+        scheduler.push(
+            Delivery(
+                data_decoded, method.delivery_tag, body, properties, attempt, queue
+            ),
+            tenant=data_decoded.tenant,
+            # the same bound as the queue, a message published by other means
+            # cannot jump ahead of every task
+            priority=min(max(data_decoded.priority, 0), RABBITMQ_MAX_PRIORITY),
         )
+        dispatch(ch)
 
-        RUSTFS_ENDPOINT = f"http://{RUSTFS_HOST}:{RUSTFS_PORT}"
-        # --- Bucket and File Details ---
-        client = boto3.client(
-            "s3",
-            endpoint_url=RUSTFS_ENDPOINT,
-            aws_access_key_id=RUSTFS_ACCESS_KEY,
-            aws_secret_access_key=RUSTFS_SECRET_KEY,
-            config=Config(signature_version="s3v4"),
+    consumer_tags = [
+        channel.basic_consume(
+            queue=queue,
+            on_message_callback=functools.partial(callback, queue),
+            auto_ack=False,
         )
+        for queue in TASK_QUEUES
+    ]
+    # the handler only schedules the drain, pika is not reentrant
+    signal.signal(signal.SIGTERM, lambda *_: connection.add_callback_threadsafe(drain))
 
-        upload_text_to_rustfs(client, RUSTFS_BUCKET, f"{task_id}.txt", output.raw)
-        print(" [x] finished processing")
-        update_db(task_id, "done")
-
-    channel.basic_consume(
-        queue=RABBITMQ_QUEUE, on_message_callback=callback, auto_ack=True
+    print(
+        f" [*] Waiting for messages with {WORKER_CONCURRENCY} slots. To exit press CTRL+C"
     )
-
-    print(" [*] Waiting for messages. To exit press CTRL+C")
-    channel.start_consuming()
+    try:
+        channel.start_consuming()
+    finally:
+        # unacknowledged messages are redelivered to another consumer
+        executor.shutdown(wait=False, cancel_futures=True)
+        watcher.close()
+        writer.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+import httpx2
+import psycopg
+from botocore.exceptions import BotoCoreError
+
+# Errors from a dependency that is down or overloaded, the same task may
+# well succeed later. Anything else, e.g. a ValueError for an unknown
+# city, fails the same way every time.
+TRANSIENT_ERRORS: tuple[type[BaseException], ...] = (
+    ConnectionError,
+    TimeoutError,
+    httpx2.TransportError,
+    psycopg.OperationalError,
+    BotoCoreError,
+)
+
+# HTTP statuses worth retrying, carried by the status errors of the HTTP
+# and LLM clients and by the geocoder's errors
+TRANSIENT_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# longest failure reason stored with a task or a dead message
+MAX_REASON_LENGTH = 500
+
+ATTEMPTS_HEADER = "x-attempts"
+REASON_HEADER = "x-failure-reason"
+
+
+def status_code(error: BaseException) -> int | None:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient(
+    error: BaseException, transient: tuple[type[BaseException], ...] = TRANSIENT_ERRORS
+) -> bool:
+    """Whether error is worth retrying, following its chain of causes"""
+    seen = set()
+    current: BaseException | None = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, transient) or status_code(current) in TRANSIENT_STATUSES:
+            return True
+        current = current.__cause__ or current.__context__
+    return False
+
+
+def describe(error: BaseException) -> str:
+    """Short failure reason of error, as stored with the task"""
+    reason = f"{type(error).__name__}: {error}"
+    if len(reason) > MAX_REASON_LENGTH:
+        reason = reason[: MAX_REASON_LENGTH - 3] + "..."
+    return reason
+
+
+class RetryPolicy:
+    """Exponential backoff of failed tasks through delay queues
+
+    A message whose task failed with a transient error is published to a
+    delay queue and acked. The delay queue has a fixed message TTL and dead
+    letters expired messages back to the task queue, so the retry needs no
+    timer in the worker and survives its restart. Each delay gets its own
+    queue, a per-message TTL would hold short delays behind long ones.
+    Messages that fail permanently or run out of attempts go to the dead
+    letter queue, where they stay for inspection.
+
+    Attempts are counted in the x-attempts header, the first delivery has
+    none.
+    """
+
+    def __init__(
+        self,
+        queue: str,
+        max_attempts: int = 4,
+        base_delay: float = 5.0,
+        max_delay: float = 300.0,
+        transient: tuple[type[BaseException], ...] = TRANSIENT_ERRORS,
+    ):
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.transient = transient
+        self.dead_letter_queue = f"{queue}.dead"
+
+    @staticmethod
+    def attempts(headers: dict | None) -> int:
+        """Attempts a delivery already had before this one"""
+        return int((headers or {}).get(ATTEMPTS_HEADER, 0))
+
+    def delay(self, attempt: int) -> int:
+        """Seconds to wait before attempt, counting the first delivery as 1"""
+        return int(min(self.base_delay * 2 ** max(attempt - 2, 0), self.max_delay))
+
+    def delay_queue(self, attempt: int) -> str:
+        return f"{self.queue}.retry.{self.delay(attempt)}s"
+
+    def should_retry(self, error: BaseException, attempt: int) -> bool:
+        """Whether a task that failed on its attempt-th delivery is tried again"""
+        return attempt < self.max_attempts and is_transient(error, self.transient)
+
+    def declare(self, channel):
+        """Declares the delay queues and the dead letter queue on a pika channel"""
+        for attempt in range(2, self.max_attempts + 1):
+            channel.queue_declare(
+                queue=self.delay_queue(attempt),
+                arguments={
+                    "x-message-ttl": self.delay(attempt) * 1000,
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": self.queue,
+                },
+            )
+        channel.queue_declare(queue=self.dead_letter_queue)
@@ -0,0 +1,92 @@
+from collections import deque
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def parse_weights(spec: str) -> dict[str, float]:
+    """Parses tenant weights written as "tenant=weight,tenant=weight"
+
+    Raises:
+        ValueError: an entry is not of the form tenant=weight or the weight
+            is not positive
+    """
+    weights = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        tenant, sep, weight = entry.partition("=")
+        if not sep or float(weight) <= 0:
+            raise ValueError(f"Invalid tenant weight {entry}")
+        weights[tenant.strip()] = float(weight)
+    return weights
+
+
+class FairScheduler(Generic[T]):
+    """Orders buffered deliveries by priority, then fairly across tenants
+
+    Items of the highest pending priority always go first. Within a
+    priority, tenants are served in proportion to their weight (start time
+    fair queuing): each tenant's virtual time advances by 1/weight per
+    item, and the tenant with the lowest virtual time is served next. A
+    tenant that goes idle and comes back starts at the current virtual
+    time, so it cannot bank credit while it has nothing queued. The virtual
+    time of an idle tenant is forgotten once the current virtual time
+    catches up with it, as it would be reset on its return anyway, and
+    every tenant's once nothing is queued.
+    """
+
+    def __init__(self, weights: dict[str, float] | None = None):
+        self.weights = weights or {}
+        # priority -> tenant -> items
+        self._queues: dict[int, dict[str, deque[T]]] = {}
+        self._virtual_time: dict[str, float] = {}
+        # tenants with nothing queued whose virtual time is still ahead
+        self._idle: set[str] = set()
+        self._now = 0.0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def push(self, item: T, tenant: str, priority: int = 0):
+        if not self._active(tenant):
+            self._idle.discard(tenant)
+            self._virtual_time[tenant] = max(
+                self._virtual_time.get(tenant, 0.0), self._now
+            )
+        tenants = self._queues.setdefault(priority, {})
+        tenants.setdefault(tenant, deque()).append(item)
+        self._len += 1
+
+    def _active(self, tenant: str) -> bool:
+        return any(tenant in tenants for tenants in self._queues.values())
+
+    def pop(self) -> T | None:
+        if not self._queues:
+            return None
+        priority = max(self._queues)
+        tenants = self._queues[priority]
+        tenant = min(tenants, key=lambda name: (self._virtual_time[name], name))
+        queue = tenants[tenant]
+        item = queue.popleft()
+        if not queue:
+            del tenants[tenant]
+            if not tenants:
+                del self._queues[priority]
+        self._now = self._virtual_time[tenant]
+        self._virtual_time[tenant] += 1 / self.weights.get(tenant, 1.0)
+        self._len -= 1
+        if not self._active(tenant):
+            self._idle.add(tenant)
+        self._prune()
+        return item
+
+    def _prune(self):
+        if not self._len:
+            # nothing queued, no tenant has anything to catch up on
+            self._idle.clear()
+            self._virtual_time.clear()
+            self._now = 0.0
+            return
+        for tenant in [t for t in self._idle if self._virtual_time[t] <= self._now]:
+            self._idle.remove(tenant)
+            del self._virtual_time[tenant]
@@ -0,0 +1,227 @@
+import datetime
+import json
+import queue
+import threading
+import uuid
+from concurrent.futures import Future
+from typing import Literal, NamedTuple
+
+import psycopg
+from psycopg_pool import ConnectionPool
+
+# States a task never leaves, e.g. a late "done" must not undo a cancel.
+TERMINAL_STATES = ["done", "cancelled", "timeout", "failed"]
+
+# One statement updates every task in the batch, the arrays are unpacked
+# row by row so each task gets its own state and timestamp. error holds the
+# reason of the last failure and is cleared by the next state without one,
+# started_at the time the last attempt started running.
+UPDATE_STATES = """UPDATE tasks
+SET state = v.state, updated_at = v.updated_at, error = v.error,
+    started_at = CASE WHEN v.state = 'running' THEN v.updated_at ELSE tasks.started_at END
+FROM unnest(
+    %(ids)s::uuid[], %(states)s::task_state[], %(updated_at)s::timestamp[], %(errors)s::text[]
+) AS v(id, state, updated_at, error)
+WHERE tasks.id = v.id and tasks.state::text <> ALL(%(terminal)s)
+RETURNING tasks.id::text"""
+
+# Stages only move the progress marker, updated_at stays the time of the
+# last state change. stage_times collects when each stage was reached.
+UPDATE_STAGES = """UPDATE tasks SET stage = v.stage, stage_times = tasks.stage_times || v.times::jsonb
+FROM unnest(%(ids)s::uuid[], %(stages)s::text[], %(times)s::text[]) AS v(id, stage, times)
+WHERE tasks.id = v.id"""
+
+
+class Write(NamedTuple):
+    kind: Literal["state", "stage"]
+    task_id: str
+    value: str
+    at: datetime.datetime
+    future: "Future[bool]"
+    error: str | None = None
+
+
+class StateWriter:
+    """Writes task state transitions and progress stages through a small connection pool
+
+    Transitions are queued and a single writer thread flushes them. Every
+    transition that is queued while a flush runs goes into the next one, so
+    under load many in-flight tasks share one UPDATE and one commit, while a
+    lone transition is written right away. Callers wait on the returned
+    future, so a state is committed before e.g. the message is acknowledged.
+    Tasks in a terminal state are left as they are.
+    """
+
+    def __init__(
+        self,
+        conninfo: str,
+        min_size: int = 1,
+        max_size: int = 2,
+        batch_size: int = 100,
+        timeout: float = 30.0,
+    ):
+        self.batch_size = batch_size
+        self.pool = ConnectionPool(
+            conninfo,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            open=False,
+            name="worker",
+        )
+        self._pending: queue.SimpleQueue[Write | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self.pool.open(wait=True)
+        self._thread = threading.Thread(
+            target=self._run, name="state-writer", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._pending.put(None)
+            self._thread.join()
+            self._thread = None
+        self.pool.close()
+
+    def submit(
+        self,
+        task_id: str,
+        state: str,
+        kind: Literal["state", "stage"] = "state",
+        error: str | None = None,
+    ) -> Future[bool]:
+        """Queues a transition, the future resolves once it is committed
+
+        The result is False when a state was not written because the task
+        had already reached a terminal state, or because a later state of the
+        same task replaced it in the same batch. error is the failure reason
+        stored with a state.
+
+        Raises:
+            ValueError: task_id is not a UUID
+        """
+        if self._thread is None:
+            raise RuntimeError("State writer is not running")
+        # a malformed id would fail the cast of the whole batch
+        uuid.UUID(task_id)
+        future: Future[bool] = Future()
+        self._pending.put(
+            Write(kind, task_id, state, datetime.datetime.now(), future, error)
+        )
+        return future
+
+    def stage(self, task_id: str, stage: str) -> Future[bool]:
+        """Queues a progress stage without waiting for it
+
+        A failed stage write is only logged, stages are informational.
+        """
+
+        def log_failure(future: Future[bool]):
+            if future.exception() is not None:
+                print(
+                    f" [!] could not record stage {stage} of {task_id}: {future.exception()!r}"
+                )
+
+        future = self.submit(task_id, stage, kind="stage")
+        future.add_done_callback(log_failure)
+        return future
+
+    def write(
+        self,
+        task_id: str,
+        state: str,
+        error: str | None = None,
+        timeout: float | None = None,
+    ) -> bool:
+        """Queues a transition and blocks until it is committed
+
+        Returns:
+            bool: False when the task had already reached a terminal state
+        """
+        return self.submit(task_id, state, error=error).result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch: list[Write]):
+        try:
+            states, updated = self._execute(batch)
+        except psycopg.DataError as e:
+            if len(batch) > 1:
+                # one bad value fails the whole statement, write one by one so
+                # it only fails its own write
+                for write in batch:
+                    self._flush([write])
+                return
+            batch[0].future.set_exception(e)
+        except Exception as e:
+            for write in batch:
+                write.future.set_exception(e)
+        else:
+            for write in batch:
+                # a state superseded by a later one of the same task was not written
+                written = (
+                    states.get(write.task_id) is write and write.task_id in updated
+                )
+                write.future.set_result(write.kind == "stage" or written)
+
+    def _execute(self, batch: list[Write]) -> tuple[dict[str, Write], set[str]]:
+        """Writes a batch in one transaction
+
+        Returns:
+            tuple[dict[str, Write], set[str]]: the state write that ran for
+            each task and the tasks whose state was updated
+        """
+        # the latest transition of a task wins when it shows up twice
+        states = {write.task_id: write for write in batch if write.kind == "state"}
+        # every stage is kept in stage_times, the latest one becomes stage
+        stages: dict[str, dict[str, str]] = {}
+        for write in batch:
+            if write.kind == "stage":
+                stages.setdefault(write.task_id, {})[write.value] = write.at.isoformat()
+        updated: set[str] = set()
+        with self.pool.connection() as conn:
+            if states:
+                cursor = conn.execute(
+                    UPDATE_STATES,
+                    {
+                        "ids": list(states),
+                        "states": [write.value for write in states.values()],
+                        "updated_at": [write.at for write in states.values()],
+                        "errors": [write.error for write in states.values()],
+                        "terminal": TERMINAL_STATES,
+                    },
+                    prepare=True,
+                )
+                updated = {task_id for (task_id,) in cursor.fetchall()}
+            if stages:
+                conn.execute(
+                    UPDATE_STAGES,
+                    {
+                        "ids": list(stages),
+                        "stages": [list(times)[-1] for times in stages.values()],
+                        "times": [json.dumps(times) for times in stages.values()],
+                    },
+                    prepare=True,
+                )
+        return states, updated
@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from appconfig import config
+from attractions import AttractionStore
+from common.geocoding import Geocoder
+from weather import WeatherStore
+
+# Process wide caches of the external data the tools use, shared by the
+# tools and the prefetch stage.
+
+geocoder = Geocoder(
+    store_path=Path(config.cache_dir) / "geocoding.sqlite",
+    ttl=config.geocode_ttl_seconds,
+    negative_ttl=config.geocode_negative_ttl_seconds,
+    memory_size=config.geocode_memory_size,
+)
+
+weather_store = WeatherStore(
+    store_path=Path(config.cache_dir) / "weather.sqlite",
+    max_bytes=config.weather_cache_max_bytes,
+    precision=config.weather_coordinate_precision,
+)
+
+attraction_store = AttractionStore(
+    store_path=Path(config.cache_dir) / "attractions.sqlite",
+    api_key=config.api_key,
+    ttl=config.attractions_ttl_seconds,
+    prefetch_all=config.attractions_prefetch_all,
+)
@@ -0,0 +1,318 @@
+import importlib
+import math
+import multiprocessing
+import signal
+import sys
+import time
+from multiprocessing.context import ForkContext
+from pathlib import Path
+
+import httpx2
+import pika
+from pika.adapters.blocking_connection import BlockingChannel
+
+if str(Path(__file__).parent) not in sys.path:
+    sys.path.append(str(Path(__file__).parent))
+if str(Path(__file__).parent.parent) not in sys.path:
+    sys.path.append(str(Path(__file__).parent.parent))
+
+import recieve
+from appconfig import config
+
+USE_MOCK = config.use_mock
+RABBITMQ_USER = config.rabbitmq_user
+RABBITMQ_PASS = config.rabbitmq_pass
+RABBITMQ_HOST = config.rabbitmq_host
+RABBITMQ_PORT = config.rabbitmq_port
+RABBITMQ_HEARTBEAT = config.rabbitmq_heartbeat
+WORKER_CONCURRENCY = config.worker_concurrency
+OLLAMA_HOST = config.ollama_host
+OLLAMA_PORT = config.ollama_port
+
+MIN_PROCESSES = config.min_processes
+MAX_PROCESSES = config.max_processes
+SCALE_INTERVAL_SECONDS = config.scale_interval_seconds
+SCALE_DOWN_DELAY_SECONDS = config.scale_down_delay_seconds
+DRAIN_TIMEOUT_SECONDS = config.drain_timeout_seconds
+OLLAMA_PARALLEL = config.ollama_parallel
+
+# Third party packages every child imports once it runs a task. They are
+# imported before forking so the children start warm and share the pages.
+# Local modules that open files on import, e.g. stores, are left to the
+# children since sqlite connections must not cross a fork.
+WARM_MODULES = ["crewai", "numpy", "openmeteo_requests"]
+
+# a child exiting sooner than this after its start counts as a crash loop
+CRASH_WINDOW_SECONDS = 30
+MAX_RESTART_DELAY_SECONDS = 60
+
+
+def warm_up():
+    if USE_MOCK:
+        return
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f" [!] could not preload {name}: {e}")
+
+
+def desired_processes(
+    demand: int,
+    slots: int,
+    current: int,
+    saturated: bool,
+    min_processes: int,
+    max_processes: int,
+) -> int:
+    """Number of consumer processes for demand waiting and running tasks
+
+    Each process runs slots tasks at once. No processes are added while the
+    LLM is saturated, more of them would only wait on it.
+    """
+    desired = math.ceil(demand / max(slots, 1))
+    if saturated:
+        desired = min(desired, current)
+    return min(max(desired, min_processes), max_processes)
+
+
+def run_child(load):
+    # the supervisor handles Ctrl-C and asks the children to drain
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    recieve.main(load=load)
+
+
+class Child:
+    def __init__(self, ctx: ForkContext, name: str):
+        # running and buffered tasks, written by the child
+        self.load = ctx.Array("i", 2)
+        self.process = ctx.Process(target=run_child, args=(self.load,), name=name)
+        self.started = time.monotonic()
+        self.retiring_since: float | None = None
+
+    @property
+    def tasks(self) -> int:
+        return self.load[0] + self.load[1]
+
+
+class Supervisor:
+    """Runs and scales the consumer processes of one host
+
+    Children are forked from a process that already imported the worker,
+    so they start without loading their dependencies again. Every interval
+    the supervisor sizes the pool to the tasks waiting in the queue plus
+    the ones the children run, between min_processes and
+    max_processes. It grows right away and shrinks one process at a time
+    once demand stayed low for scale_down_delay seconds. A retired child
+    drains: it returns its buffered messages and finishes its running
+    tasks before it exits.
+
+    Children that exit on their own are replaced, after a doubling delay
+    when they keep exiting right after their start. SIGTERM or SIGINT
+    drains every child and stops the supervisor.
+    """
+
+    def __init__(
+        self,
+        min_processes: int = 1,
+        max_processes: int = 4,
+        interval: float = 5.0,
+        scale_down_delay: float = 60.0,
+        drain_timeout: float = 660.0,
+        ollama_parallel: int = 0,
+    ):
+        self.min_processes = min_processes
+        self.max_processes = max(max_processes, min_processes)
+        self.interval = interval
+        self.scale_down_delay = scale_down_delay
+        self.drain_timeout = drain_timeout
+        self.ollama_parallel = ollama_parallel
+        self._ctx = multiprocessing.get_context("fork")
+        self._children: list[Child] = []
+        self._retiring: list[Child] = []
+        self._spawned = 0
+        # children that exited and wait for their restart
+        self._lost = 0
+        self._crashes = 0
+        self._restart_at = 0.0
+        self._below_since: float | None = None
+        self._stopping = False
+        self._connection: pika.BlockingConnection | None = None
+        self._channel: BlockingChannel | None = None
+
+    def queue_depth(self) -> int | None:
+        """Ready messages in the task queues, None when RabbitMQ is unreachable"""
+        try:
+            if self._connection is None or self._connection.is_closed:
+                creds = pika.PlainCredentials(
+                    username=RABBITMQ_USER, password=RABBITMQ_PASS
+                )
+                self._connection = pika.BlockingConnection(
+                    pika.ConnectionParameters(
+                        host=RABBITMQ_HOST,
+                        port=RABBITMQ_PORT,
+                        credentials=creds,
+                        heartbeat=RABBITMQ_HEARTBEAT,
+                    )
+                )
+                self._channel = None
+            # a failed passive declare closes its channel
+            if self._channel is None or self._channel.is_closed:
+                self._channel = self._connection.channel()
+            depth = 0
+            for queue in recieve.TASK_QUEUES:
+                frame = self._channel.queue_declare(queue=queue, passive=True)
+                depth += frame.method.message_count
+            return depth
+        except pika.exceptions.AMQPError as e:
+            print(f" [!] could not read the queue depth: {e!r}")
+            return None
+
+    def ollama_saturated(self, running: int) -> bool:
+        """Whether more running tasks would only wait on Ollama
+
+        Ollama reports neither its queue nor the requests it serves, so its
+        capacity is the configured ollama_parallel. Without it the pool is
+        never grown. An unreachable Ollama counts as saturated as well.
+        """
+        if self.ollama_parallel <= 0 or running >= self.ollama_parallel:
+            return True
+        return not self.ollama_reachable()
+
+    @staticmethod
+    def ollama_reachable() -> bool:
+        try:
+            resp = httpx2.get(f"http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/ps", timeout=2)
+        except httpx2.HTTPError:
+            return False
+        return resp.status_code == 200
+
+    def spawn(self):
+        self._spawned += 1
+        child = Child(self._ctx, f"consumer-{self._spawned}")
+        child.process.start()
+        self._children.append(child)
+        print(f" [*] started worker process {child.process.pid}")
+
+    def retire(self, child: Child):
+        self._children.remove(child)
+        child.retiring_since = time.monotonic()
+        child.process.terminate()
+        self._retiring.append(child)
+        print(f" [*] draining worker process {child.process.pid}")
+
+    def reap(self, now: float):
+        for child in list(self._children):
+            if child.process.is_alive():
+                continue
+            child.process.join()
+            self._children.remove(child)
+            print(
+                f" [!] worker process {child.process.pid} exited with {child.process.exitcode}"
+            )
+            if now - child.started < CRASH_WINDOW_SECONDS:
+                self._crashes += 1
+                delay = min(2**self._crashes, MAX_RESTART_DELAY_SECONDS)
+                self._restart_at = max(self._restart_at, now + delay)
+            else:
+                self._crashes = 0
+            self._lost += 1
+
+        for child in list(self._retiring):
+            if not child.process.is_alive():
+                child.process.join()
+                self._retiring.remove(child)
+            elif now - (child.retiring_since or now) > self.drain_timeout:
+                print(
+                    f" [!] worker process {child.process.pid} did not drain, killing it"
+                )
+                child.process.kill()
+
+    def step(self):
+        now = time.monotonic()
+        self.reap(now)
+        if self._lost and now >= self._restart_at:
+            for _ in range(self._lost):
+                self.spawn()
+            self._lost = 0
+
+        depth = self.queue_depth()
+        if depth is None:
+            return
+        running = sum(child.load[0] for child in self._children)
+        # deliveries a child buffered are pinned to it, a new process could
+        # not take them over
+        demand = depth + running
+        current = len(self._children) + self._lost
+        desired = desired_processes(
+            demand,
+            WORKER_CONCURRENCY,
+            current,
+            self.ollama_saturated(running),
+            self.min_processes,
+            self.max_processes,
+        )
+        if desired > current:
+            self._below_since = None
+            print(f" [*] scaling up to {desired} processes, {demand} tasks")
+            for _ in range(desired - current):
+                self.spawn()
+        elif desired < current and self._children:
+            if self._below_since is None:
+                self._below_since = now
+            elif now - self._below_since >= self.scale_down_delay:
+                self.retire(min(self._children, key=lambda child: child.tasks))
+                self._below_since = now
+        else:
+            self._below_since = None
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        if self.ollama_parallel <= 0 and self.max_processes > self.min_processes:
+            print(" [!] OLLAMA_PARALLEL is not set, staying at MIN_PROCESSES")
+        for _ in range(self.min_processes):
+            self.spawn()
+        while not self._stopping:
+            self.step()
+            deadline = time.monotonic() + self.interval
+            while not self._stopping and time.monotonic() < deadline:
+                time.sleep(0.2)
+        self.shutdown()
+
+    def shutdown(self):
+        print(f" [*] draining {len(self._children)} worker processes")
+        for child in list(self._children):
+            self.retire(child)
+        deadline = time.monotonic() + self.drain_timeout
+        for child in self._retiring:
+            child.process.join(max(deadline - time.monotonic(), 0))
+            if child.process.is_alive():
+                print(
+                    f" [!] worker process {child.process.pid} did not drain, killing it"
+                )
+                child.process.kill()
+                child.process.join()
+        self._retiring.clear()
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+
+
+def main():
+    warm_up()
+    Supervisor(
+        min_processes=MIN_PROCESSES,
+        max_processes=MAX_PROCESSES,
+        interval=SCALE_INTERVAL_SECONDS,
+        scale_down_delay=SCALE_DOWN_DELAY_SECONDS,
+        drain_timeout=DRAIN_TIMEOUT_SECONDS,
+        ollama_parallel=OLLAMA_PARALLEL,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,16 @@
-from functools import lru_cache
+import datetime
 from typing import Literal, override
 
-import httpx2
-import msgspec
-import openmeteo_requests
-import pandas as pd
-import requests_cache
+import aio
+import prefetch
 from appconfig import config
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
-from retry_requests import retry
+from stores import attraction_store, geocoder, weather_store
+from weather import DAILY_VARS, summarize
 
-API_KEY = config.api_key
-
-
-class Result(msgspec.Struct):
-    name: str
-    latitude: float
-    longitude: float
-    country_code: str
-    country: str
-
-
-class GeocodingSearchResponse(msgspec.Struct):
-    results: list[Result]
-
-
-@lru_cache
-def get_coordinates(city: str) -> tuple[float, float]:
-    geocoding_url = "https://geocoding-api.open-meteo.com/v1/search"
-    geocoding_params = {"name": city, "count": 1, "language": "en", "format": "json"}
-    resp = httpx2.get(url=geocoding_url, params=geocoding_params)
-    if resp.status_code < 200 or resp.status_code > 200:
-        raise ValueError(
-            f"Non 200 status code {resp.status_code}, {resp.content.decode()}"
-        )
-    decoder = msgspec.json.Decoder(type=GeocodingSearchResponse)
-
-    try:
-        geocoding_response = decoder.decode(resp.content)
-    except Exception:
-        raise ValueError("City is not found")
-
-    if geocoding_response.results[0].name != city:
-        raise ValueError("City is not found")
-
-    latitude = geocoding_response.results[0].latitude
-    longitude = geocoding_response.results[0].longitude
-
-    return latitude, longitude
+WEATHER_OUTPUT = config.weather_output
+WEATHER_TABLE_ROWS = config.weather_table_rows
 
 
 class WeatherToolSchema(BaseModel):
@@ -60,56 +22,29 @@ class WeatherToolSchema(BaseModel):
 class WeatherTool(BaseTool):
     name: str = "weather tool"
     description: str = (
-        "Useful for getting daily weather for a city between a start_date and end_date"
+        "Useful for getting a summary of the daily weather for a city between a start_date and end_date"
     )
     args_schema: type[BaseModel] = WeatherToolSchema
 
     @override
     def _run(self, city: str, start_date: str, end_date: str) -> dict:
-        latitude, longitude = get_coordinates(city)
-
-        # Setup the Open-Meteo API client with cache and retry on error
-        cache_session = requests_cache.CachedSession(".cache", expire_after=-1)
-        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-        openmeteo = openmeteo_requests.Client(session=retry_session)
-
-        # Make sure all required weather variables are listed here
-        # The order of variables in hourly or daily is important to assign them correctly below
-        url = "https://archive-api.open-meteo.com/v1/archive"
+        days = prefetch.weather(city, start_date, end_date)
+        if days is None:
+            latitude, longitude = geocoder.get(city)
+            days = weather_store.daily(
+                latitude,
+                longitude,
+                datetime.date.fromisoformat(start_date),
+                datetime.date.fromisoformat(end_date),
+            )
+
+        if WEATHER_OUTPUT != "daily":
+            return summarize(days, table_rows=WEATHER_TABLE_ROWS)
 
-        daily_vars = [
-            "temperature_2m_mean",
-            "rain_sum",
-            "precipitation_sum",
-            "precipitation_hours",
-        ]
-
-        params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "start_date": start_date,
-            "end_date": end_date,
-            "daily": daily_vars,
-        }
-        responses = openmeteo.weather_api(url, params=params)
-
-        # Process first location. Add a for-loop for multiple locations or weather models
-        response = responses[0]
-
-        # Process daily data. The order of variables needs to be the same as requested.
-        daily = response.Daily()
-        if daily is None:
-            raise ValueError("response is empty")
         df_data = {}
-        for i, v in enumerate(daily_vars):
-            df_data[v] = daily.Variables(i).ValuesAsNumpy().tolist()  # type: ignore
-        dates = pd.date_range(
-            start=pd.to_datetime(daily.Time(), unit="s", utc=True),
-            end=pd.to_datetime(daily.TimeEnd(), unit="s", utc=True),
-            freq=pd.Timedelta(seconds=daily.Interval()),
-            inclusive="left",
-        ).to_list()
-        df_data["date"] = dates
+        for i, v in enumerate(DAILY_VARS):
+            df_data[v] = [day.values[i] for day in days]
+        df_data["date"] = [day.date.isoformat() for day in days]
 
         return df_data
 
@@ -143,18 +78,8 @@ class AttractionTool(BaseTool):
             | Literal["natural"]
         ),
     ) -> dict:
-        latitude, longitude = get_coordinates(city)
-        trip_url = "https://api.opentripmap.com/0.1/en/places/radius"
-        params = {
-            "lang": "en",
-            "radius": 5000,
-            "lon": longitude,
-            "lat": latitude,
-            "format": "json",
-            "limit": 5,
-            "kinds": kinds,
-            "apikey": API_KEY,
-        }
-
-        resp = httpx2.get(url=trip_url, params=params).json()
-        return resp
+        found = prefetch.attractions(city, kinds)
+        if found is not None:
+            return found  # type: ignore[return-value]
+        latitude, longitude = geocoder.get(city)
+        return aio.run(attraction_store.aget(latitude, longitude, kinds))
@@ -0,0 +1,214 @@
+import datetime
+import functools
+import math
+import warnings
+from collections.abc import Iterator
+from pathlib import Path
+
+import msgspec
+import numpy as np
+import openmeteo_requests
+import requests
+from retry_requests import retry
+
+from common.kvstore import SqliteStore
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+
+# The order of variables is important to assign them correctly from a response
+DAILY_VARS = [
+    "temperature_2m_mean",
+    "rain_sum",
+    "precipitation_sum",
+    "precipitation_hours",
+]
+
+# The archive lags a few days behind and recent values may still be revised,
+# so only days older than this are stored without expiry.
+FINAL_AFTER_DAYS = 7
+RECENT_TTL_SECONDS = 6 * 3600
+
+# daily precipitation from which a day counts as wet, in mm
+WET_DAY_MM = 1.0
+
+
+class DailyWeather(msgspec.Struct, array_like=True):
+    date: datetime.date
+    # one value per entry of DAILY_VARS, NaN when the archive has no value
+    values: list[float]
+
+
+@functools.cache
+def openmeteo_client() -> openmeteo_requests.Client:
+    """Returns the process wide Open-Meteo client, retrying on errors"""
+    session = retry(requests.Session(), retries=5, backoff_factor=0.2)
+    return openmeteo_requests.Client(session=session)
+
+
+def missing_ranges(
+    days: list[datetime.date], cached: set[datetime.date]
+) -> Iterator[tuple[datetime.date, datetime.date]]:
+    """Yields inclusive (start, end) ranges of consecutive days that are not cached"""
+    start = None
+    for day in days:
+        if day in cached:
+            if start is not None:
+                yield start, day - datetime.timedelta(days=1)
+                start = None
+        elif start is None:
+            start = day
+    if start is not None:
+        yield start, days[-1]
+
+
+class WeatherStore:
+    """Daily historical weather, stored per location and day
+
+    Coordinates are rounded to precision decimals so every lookup of a city
+    hits the same entries. A query only fetches the days that are not stored
+    yet, one archive request per gap, and stitches the rest from the store.
+    The store is a size bounded sqlite file that every worker on a host can
+    share.
+    """
+
+    def __init__(
+        self, store_path: str | Path, max_bytes: int | None = None, precision: int = 2
+    ):
+        self.precision = precision
+        self._store = SqliteStore(store_path, "weather", max_bytes=max_bytes)
+        self._encoder = msgspec.msgpack.Encoder()
+        self._decoder = msgspec.msgpack.Decoder(type=DailyWeather)
+
+    def _location(self, latitude: float, longitude: float) -> tuple[float, float]:
+        return round(latitude, self.precision), round(longitude, self.precision)
+
+    @staticmethod
+    def _key(location: tuple[float, float], day: datetime.date) -> str:
+        return f"{location[0]},{location[1]},{day.isoformat()}"
+
+    def daily(
+        self,
+        latitude: float,
+        longitude: float,
+        start_date: datetime.date,
+        end_date: datetime.date,
+    ) -> list[DailyWeather]:
+        """Returns one entry per day from start_date to end_date inclusive
+
+        Raises:
+            ValueError: the archive returned no daily data
+        """
+        location = self._location(latitude, longitude)
+        days = [
+            start_date + datetime.timedelta(days=i)
+            for i in range((end_date - start_date).days + 1)
+        ]
+        if not days:
+            return []
+
+        keys = {self._key(location, day): day for day in days}
+        found = {
+            keys[key]: self._decoder.decode(raw)
+            for key, raw in self._store.get_many(keys).items()
+        }
+        for start, end in missing_ranges(days, set(found)):
+            fetched = self._fetch(location, start, end)
+            self._remember(location, fetched)
+            found.update((entry.date, entry) for entry in fetched)
+
+        nan = [math.nan] * len(DAILY_VARS)
+        return [found.get(day) or DailyWeather(date=day, values=nan) for day in days]
+
+    def _fetch(
+        self,
+        location: tuple[float, float],
+        start_date: datetime.date,
+        end_date: datetime.date,
+    ) -> list[DailyWeather]:
+        params = {
+            "latitude": location[0],
+            "longitude": location[1],
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "daily": DAILY_VARS,
+        }
+        response = openmeteo_client().weather_api(ARCHIVE_URL, params=params)[0]
+        daily = response.Daily()
+        if daily is None:
+            raise ValueError("response is empty")
+
+        columns = [daily.Variables(i).ValuesAsNumpy() for i in range(len(DAILY_VARS))]  # type: ignore
+        first = datetime.datetime.fromtimestamp(daily.Time(), datetime.UTC).date()
+        step = datetime.timedelta(seconds=daily.Interval())
+        return [
+            DailyWeather(
+                date=first + step * i,
+                values=[float(column[i]) for column in columns],
+            )
+            for i in range(len(columns[0]))
+        ]
+
+    def _remember(self, location: tuple[float, float], entries: list[DailyWeather]):
+        final_before = datetime.date.today() - datetime.timedelta(days=FINAL_AFTER_DAYS)
+        final = {}
+        recent = {}
+        for entry in entries:
+            target = final if entry.date < final_before else recent
+            target[self._key(location, entry.date)] = self._encoder.encode(entry)
+        self._store.put_many(final)
+        self._store.put_many(recent, ttl=RECENT_TTL_SECONDS)
+
+
+def _rounded(value: float) -> float | None:
+    return None if math.isnan(value) else round(float(value), 1)
+
+
+def summarize(days: list[DailyWeather], table_rows: int = 0) -> dict:
+    """Fixed size summary of the daily weather of a trip
+
+    The aggregates are computed on one (days, variables) array, so both the
+    work and the size of the output stay about the same for long trips.
+
+    Args:
+        days (list[DailyWeather]): consecutive days, as returned by WeatherStore.daily
+        table_rows (int): when above 0, adds a table of at most that many rows,
+            each one averaging a run of consecutive days
+    """
+    if not days:
+        return {"days": 0}
+    values = np.array([day.values for day in days], dtype=np.float64)
+    temperature, rain, precipitation, precipitation_hours = values.T
+    wet = np.nan_to_num(precipitation) >= WET_DAY_MM
+
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        # all NaN columns give NaN, reported as null
+        warnings.simplefilter("ignore", RuntimeWarning)
+        summary = {
+            "start_date": days[0].date.isoformat(),
+            "end_date": days[-1].date.isoformat(),
+            "days": len(days),
+            "temperature_mean": _rounded(np.nanmean(temperature)),
+            "temperature_min": _rounded(np.nanmin(temperature)),
+            "temperature_max": _rounded(np.nanmax(temperature)),
+            "rain_total_mm": _rounded(np.nansum(rain)),
+            "precipitation_total_mm": _rounded(np.nansum(precipitation)),
+            "precipitation_hours_total": _rounded(np.nansum(precipitation_hours)),
+            "wet_days": int(wet.sum()),
+            "dry_days": int(len(days) - wet.sum()),
+            # one character per day from start_date, 1 for a wet day
+            "wet_day_flags": "".join(np.where(wet, "1", "0")),
+        }
+        if table_rows > 0:
+            summary["table"] = [
+                {
+                    "start_date": days[int(idx[0])].date.isoformat(),
+                    "end_date": days[int(idx[-1])].date.isoformat(),
+                    "temperature_mean": _rounded(np.nanmean(temperature[idx])),
+                    "precipitation_mm": _rounded(np.nansum(precipitation[idx])),
+                    "wet_days": int(wet[idx].sum()),
+                }
+                for idx in np.array_split(
+                    np.arange(len(days)), min(table_rows, len(days))
+                )
+            ]
+    return summary